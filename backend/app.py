@@ -3,61 +3,400 @@ from flask_cors import CORS
 import logging
 import os
 import engine
-import atexit
-from uuid import uuid4
+from werkzeug.serving import is_running_from_reloader
 from werkzeug.utils import secure_filename
 
-from config import ALLOWED_MODELS, DEFAULT_MODEL, TEMP_FOLDER
-from storage import cleanup_temp_storage, ensure_storage_dirs, purge_old_temp_files
+from config import (
+    ALLOWED_MODELS,
+    AUDIO_FORMATS,
+    ANALYSIS_MODES,
+    DECODE_CACHE,
+    DEFAULT_KEY_MODE,
+    DEFAULT_MODEL,
+    JOB_MAX_QUEUE_DEPTH,
+    JOB_RETENTION_SECONDS,
+    JOB_WORKERS,
+    KEY_MODES,
+    METADATA_CACHE_FOLDER,
+    METADATA_CACHE_TTL_SECONDS,
+    METADATA_ENDPOINT,
+    METADATA_MIN_INTERVAL_SECONDS,
+    RESAMPLER_TIER,
+    RESULT_CACHE_FOLDER,
+    RESULT_CACHE_MAX_BYTES,
+    SEPARATION_CHUNK_SECONDS,
+    SEPARATION_CHUNKED,
+    SEPARATION_OVERLAP_SECONDS,
+    SEPARATION_THREADS_PER_WORKER,
+    SEPARATION_WORKERS,
+    STEM_FORMAT,
+    STEM_WORKERS,
+    STORAGE_INDEX_PATH,
+    STORAGE_MAX_BYTES,
+    STORAGE_SCAN_INTERVAL_SECONDS,
+    TEMP_FILE_TTL_SECONDS,
+    TEMP_FOLDER,
+    UPLOAD_DECODE_STEP_BYTES,
+    UPLOAD_MAX_BYTES,
+    UPLOAD_READ_BYTES,
+    UPLOAD_SESSION_TTL_SECONDS,
+    USE_X_SENDFILE,
+)
+from delivery import send_artifact
+from jobs import JobManager, QueueFullError
+import storage
+from storage import StorageManager, ensure_storage_dirs
+from uploads import UploadConflict, UploadManager
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Let a fronting nginx/Apache send artifact files itself
+app.config["USE_X_SENDFILE"] = USE_X_SENDFILE
 # Enable CORS for the streaming response (Mimetype: application/x-ndjson could be used, but text/plain is simpler for fetch streams)
 CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["Content-Type"])
 
-ensure_storage_dirs()
-atexit.register(cleanup_temp_storage)
+# Services are built by create_app() rather than on import: the stem and
+# separation pools spawn workers that re-import this module as __mp_main__,
+# and those must not start a second storage manager or job pool.
+storage_manager = None
+upload_manager = None
+result_cache = None
+job_manager = None
+
+
+def create_app():
+    """
+    Create and start the storage, upload, engine and job services once; returns the app.
+
+    ``python app.py`` calls it; WSGI servers and ``flask --app`` should load
+    ``app:create_app()`` rather than ``app:app``.
+    """
+    global storage_manager, upload_manager, result_cache, job_manager
+    if job_manager is not None:
+        return app
+
+    ensure_storage_dirs()
+    storage_manager = StorageManager(
+        TEMP_FOLDER,
+        STORAGE_INDEX_PATH,
+        max_bytes=STORAGE_MAX_BYTES,
+        ttl_seconds=TEMP_FILE_TTL_SECONDS,
+        scan_interval_seconds=STORAGE_SCAN_INTERVAL_SECONDS,
+    )
+    storage_manager.start()
+    upload_manager = UploadManager(
+        TEMP_FOLDER,
+        storage_manager,
+        max_bytes=UPLOAD_MAX_BYTES,
+        session_ttl_seconds=UPLOAD_SESSION_TTL_SECONDS,
+        read_bytes=UPLOAD_READ_BYTES,
+        decode_step_bytes=UPLOAD_DECODE_STEP_BYTES,
+    )
+    # Decode caches count toward the quota as soon as they exist
+    engine.configure_decoding(
+        cache=DECODE_CACHE,
+        tier=RESAMPLER_TIER,
+        on_write=lambda path: storage_manager.register(os.path.basename(path)),
+    )
+    engine.configure_stem_pool(STEM_WORKERS)
+    result_cache = engine.ResultCache(RESULT_CACHE_FOLDER, max_bytes=RESULT_CACHE_MAX_BYTES)
+    engine.configure_metadata(
+        endpoint=METADATA_ENDPOINT,
+        cache_dir=METADATA_CACHE_FOLDER,
+        ttl_seconds=METADATA_CACHE_TTL_SECONDS,
+        min_interval_seconds=METADATA_MIN_INTERVAL_SECONDS,
+    )
+    if SEPARATION_CHUNKED:
+        engine.configure_separation(
+            chunking=engine.ChunkSettings(
+                chunk_seconds=SEPARATION_CHUNK_SECONDS,
+                overlap_seconds=SEPARATION_OVERLAP_SECONDS,
+                workers=SEPARATION_WORKERS,
+                threads_per_worker=SEPARATION_THREADS_PER_WORKER,
+            )
+        )
+    job_manager = JobManager(
+        run_analysis_job,
+        workers=JOB_WORKERS,
+        max_queue_depth=JOB_MAX_QUEUE_DEPTH,
+        retention_seconds=JOB_RETENTION_SECONDS,
+    )
+    return app
+
+
+@app.before_request
+def require_services():
+    """Refuse requests when the app was served without create_app(), e.g. as ``app:app``."""
+    if job_manager is None:
+        logger.error("Request to %s before create_app(); serve app:create_app() instead", request.path)
+        return jsonify({"error": "Server not initialised: serve app:create_app(), not app:app"}), 503
+
+def run_analysis_job(job):
+    filepath = job.params["filepath"]
+    if job.params["mode"] == "mix":
+        events = engine.analyze_mix(filepath)
+    else:
+        audio = None
+        if job.params.get("decoded") is not None:
+            try:
+                audio = job.params["decoded"].result()
+            except Exception:
+                logger.warning("Early decode of %s failed; loading it instead", filepath, exc_info=True)
+        events = engine.analyze_audio(
+            filepath,
+            model_name=job.params["model_name"],
+            cache=result_cache,
+            include_timings=job.params["timings"],
+            key_mode=job.params["key_mode"],
+            stages=job.params["stages"],
+            stem_format=STEM_FORMAT,
+            audio=audio,
+        )
+    return track_artifacts(filepath, events)
+
+
+def track_artifacts(filepath, events):
+    """
+    Pin the upload in storage while it is analyzed, then index what the analysis wrote.
+
+    A cached result serves the stems and MIDI of the analysis that first
+    produced it, which live in another upload's unit; that unit is pinned
+    until the job ends too, and registering it marks it as just used.
+    """
+    pinned = [os.path.basename(filepath)]
+    storage_manager.pin(pinned[0])
+    try:
+        for message in events:
+            if message.type == "complete":
+                result = message.result
+                names = set(result.file_hashes)
+                for files in (result.stem_files, result.midi_files, result.peak_files):
+                    names.update(name for name in files.values() if name)
+                owners = {storage.unit_of(name): name for name in names}
+                for unit, name in owners.items():
+                    if unit != storage.unit_of(pinned[0]):
+                        storage_manager.pin(name)
+                        pinned.append(name)
+                storage_manager.register(*names)
+            yield message
+    finally:
+        for name in pinned:
+            storage_manager.unpin(name)
+
+
+# Media types of event streams; the first is the default
+EVENT_MIMETYPES = ['application/x-ndjson', 'application/x-msgpack', 'application/vnd.msgpack']
+
+
+def event_response(events):
+    """
+    Stream job events as NDJSON, or as MessagePack when the Accept header prefers it.
+
+    Each MessagePack message is one map and waveforms are packed float32
+    arrays (see :mod:`engine.types`), so the stream is read with a
+    streaming unpacker rather than split on newlines.
+    """
+    mimetype = request.accept_mimetypes.best_match(EVENT_MIMETYPES, default=EVENT_MIMETYPES[0])
+    if mimetype == EVENT_MIMETYPES[0]:
+        body = (message.to_ndjson() for message in events)
+    else:
+        body = (message.to_msgpack() for message in events)
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+
+def query_flag(name):
+    """True for ``?name=1``, ``true`` or ``yes``; absent, ``0`` or ``false`` is off."""
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def submit_analysis(filepath, model_name, mode, stages=None, decoded=None):
+    """
+    Queue an analysis job and either stream its events or hand back the job id.
+
+    ``decoded`` is the upload's early decode (a future of ``(y, sr)``), if any.
+    """
+    key_mode = request.args.get('key_mode', DEFAULT_KEY_MODE)
+    if key_mode not in KEY_MODES:
+        return jsonify({"error": "Invalid key mode"}), 400
+
+    # e.g. "bpm,key,waveform"; prerequisites are added and empty means everything
+    try:
+        stage_plan = engine.stages.parse(stages)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    try:
+        job = job_manager.submit(
+            filepath=filepath,
+            model_name=model_name,
+            mode=mode,
+            timings=query_flag('timings'),
+            key_mode=key_mode,
+            stages=stage_plan,
+            decoded=decoded,
+        )
+    except QueueFullError as exc:
+        logger.warning("Rejected analysis for %s: %s", filepath, exc)
+        response = jsonify({"error": str(exc)})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(job_manager.retry_after_seconds())
+        return response
+
+    if query_flag('async'):
+        return jsonify({
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
+            "events_url": f"/jobs/{job.id}/events",
+        }), 202
+
+    # The job runs on the worker pool, so a client disconnect only ends this
+    # stream; it can reconnect through /jobs/<id>/events.
+    response = event_response(job.iter_events())
+    response.headers["X-Job-Id"] = job.id
+    return response
 
 @app.route('/analyze', methods=['POST'])
 def analyze():
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part"}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
-
-    filename = secure_filename(file.filename)
+    """
+    Store an upload and analyze it.
+
+    A multipart form (``file``, ``model``, ``mode``, ``stages``) has already
+    been spooled by Werkzeug when this runs, so it is only copied and hashed.
+    A raw body (``?filename=&model=&mode=&stages=``) is read straight from
+    the connection, hashing and decoding while it arrives, as the PATCH
+    uploads under /uploads are.
+    """
+    multipart = request.mimetype == 'multipart/form-data'
+    options = request.form if multipart else request.args
+    if multipart:
+        if 'file' not in request.files:
+            return jsonify({"error": "No file part"}), 400
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({"error": "No selected file"}), 400
+        raw_filename, stream = file.filename, file.stream
+    else:
+        raw_filename, stream = request.args.get('filename', ''), request.stream
+
+    filename = secure_filename(raw_filename)
     if not filename:
         return jsonify({"error": "Invalid filename"}), 400
 
-    model_name = request.form.get('model', DEFAULT_MODEL)
+    model_name = options.get('model', DEFAULT_MODEL)
     if model_name not in ALLOWED_MODELS:
         logger.warning("Rejected analyze request with invalid model: %s", model_name)
         return jsonify({"error": "Invalid model"}), 400
 
-    purge_old_temp_files()
-    unique_name = f"{uuid4().hex}_{filename}"
-    filepath = os.path.join(TEMP_FOLDER, unique_name)
-    file.save(filepath)
-    
-    logger.info("Queued analyze request for file %s with model %s", unique_name, model_name)
+    mode = options.get('mode', 'full')
+    if mode not in ANALYSIS_MODES:
+        return jsonify({"error": "Invalid mode"}), 400
+
+    try:
+        upload = upload_manager.save(stream, filename)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 413
+
+    logger.info("Queued analyze request for file %s with model %s", upload.name, model_name)
+    filepath = os.path.join(TEMP_FOLDER, upload.name)
+    return submit_analysis(filepath, model_name, mode, options.get('stages'), decoded=upload.decoded)
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """
+    Start a resumable upload: ``{"filename", "size"?, "digest"?}``.
+
+    With the ``digest`` of a stored file the upload is skipped and that
+    file's name comes back, ready for /re-analyze.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    if not filename:
+        return jsonify({"error": "Invalid filename"}), 400
+
+    digest = data.get('digest')
+    if digest:
+        existing = storage_manager.find_digest(str(digest)[:engine.DIGEST_LENGTH])
+        if existing is not None:
+            return jsonify({"filename": existing, "duplicate": True})
+
+    size = data.get('size')
+    if size is not None and not isinstance(size, int):
+        return jsonify({"error": "Invalid size"}), 400
+    try:
+        upload = upload_manager.create(filename, size)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 413
+    return jsonify({**upload.to_dict(), "upload_url": f"/uploads/{upload.id}"}), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    upload = upload_manager.get(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(upload.to_dict())
+
+@app.route('/uploads/<upload_id>', methods=['PATCH'])
+def append_upload(upload_id):
+    """Append the raw request body at the ``Upload-Offset`` header's offset."""
+    upload = upload_manager.get(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({"error": "Missing Upload-Offset header"}), 400
+
+    try:
+        upload_manager.append(upload, offset, request.stream)
+    except UploadConflict as exc:
+        return jsonify({"error": str(exc), "offset": exc.offset}), 409
+    except ValueError as exc:
+        return jsonify({"error": str(exc), "offset": upload.received}), 413
+    return jsonify(upload.to_dict())
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    upload = upload_manager.get(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    upload_manager.abort(upload)
+    return '', 204
 
-    def generate():
-        # Yield from engine
-        yield from engine.analyze_audio(filepath, model_name=model_name)
-        # Note: We NO LONGER cleanup here because user wants to hold it.
+@app.route('/uploads/<upload_id>/analyze', methods=['POST'])
+def analyze_upload(upload_id):
+    """Complete an upload and analyze it; takes the same options as /re-analyze."""
+    upload = upload_manager.get(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
 
-    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    data = request.get_json(silent=True) or {}
+    model_name = data.get('model', DEFAULT_MODEL)
+    if model_name not in ALLOWED_MODELS:
+        logger.warning("Rejected upload analysis with invalid model: %s", model_name)
+        return jsonify({"error": "Invalid model"}), 400
+    mode = data.get('mode', 'full')
+    if mode not in ANALYSIS_MODES:
+        return jsonify({"error": "Invalid mode"}), 400
+
+    try:
+        finished = upload_manager.finish(upload)
+    except UploadConflict as exc:
+        return jsonify({"error": str(exc), "offset": exc.offset}), 409
+
+    logger.info("Queued analysis of upload %s with model %s", finished.name, model_name)
+    filepath = os.path.join(TEMP_FOLDER, finished.name)
+    return submit_analysis(filepath, model_name, mode, data.get('stages'), decoded=finished.decoded)
 
 @app.route('/re-analyze', methods=['POST'])
 def re_analyze():
     data = request.get_json(silent=True) or {}
     raw_filename = data.get('filename')
     model_name = data.get('model', DEFAULT_MODEL)
-    
+    mode = data.get('mode', 'full')
+
     if not raw_filename:
         return jsonify({"error": "No filename provided"}), 400
 
@@ -65,6 +404,9 @@ def re_analyze():
         logger.warning("Rejected re-analyze request with invalid model: %s", model_name)
         return jsonify({"error": "Invalid model"}), 400
 
+    if mode not in ANALYSIS_MODES:
+        return jsonify({"error": "Invalid mode"}), 400
+
     filename = secure_filename(os.path.basename(raw_filename))
     if not filename:
         return jsonify({"error": "Invalid filename"}), 400
@@ -72,22 +414,100 @@ def re_analyze():
     filepath = os.path.join(TEMP_FOLDER, filename)
     if not os.path.exists(filepath):
         return jsonify({"error": "File not found on server"}), 404
-        
-    def generate():
-        yield from engine.analyze_audio(filepath, model_name=model_name)
-        
-    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    return submit_analysis(filepath, model_name, mode, data.get('stages'))
 
 @app.route('/audio/<filename>')
 def serve_audio(filename):
-    from flask import send_from_directory
-
+    """Stored audio or MIDI; ``?format=`` re-encodes, ``?v=<content hash>`` makes it immutable."""
     safe_name = secure_filename(filename)
     if not safe_name:
         return jsonify({"error": "Invalid filename"}), 400
 
-    logger.info("Serving audio file: %s", safe_name)
-    return send_from_directory(TEMP_FOLDER, safe_name)
+    source = os.path.join(TEMP_FOLDER, safe_name)
+    if not os.path.isfile(source):
+        return jsonify({"error": "File not found"}), 404
+    storage_manager.touch(safe_name)
+
+    audio_format = request.args.get('format')
+    if audio_format is None:
+        return send_artifact(source)
+
+    if audio_format not in AUDIO_FORMATS:
+        return jsonify({"error": "Invalid format"}), 400
+    is_new = not os.path.exists(engine.encoding.encoded_path(source, audio_format))
+    try:
+        encoded = engine.ensure_encoded(source, audio_format)
+    except Exception as exc:
+        logger.exception("Encoding %s as %s failed", safe_name, audio_format)
+        return jsonify({"error": f"Encoding failed: {exc}"}), 500
+    if is_new:
+        # Count the encode toward the quota now rather than at the next scan
+        storage_manager.register(os.path.basename(encoded))
+    return send_artifact(encoded, mimetype=engine.FORMATS[audio_format].mimetype, version_of=source)
+
+@app.route('/waveform/<filename>')
+def serve_waveform(filename):
+    """Min/max peaks of a ``.peaks`` file for one zoom level and time window."""
+    safe_name = secure_filename(filename)
+    if not safe_name or not safe_name.endswith('.peaks'):
+        return jsonify({"error": "Invalid filename"}), 400
+
+    path = os.path.join(TEMP_FOLDER, safe_name)
+    try:
+        peaks = engine.PeakFile(path)
+        storage_manager.touch(safe_name)
+    except FileNotFoundError:
+        return jsonify({"error": "Waveform not found"}), 404
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    start = request.args.get('start', default=0.0, type=float)
+    end = request.args.get('end', default=peaks.duration, type=float)
+    level = request.args.get('level', type=int)
+    if level is None:
+        points = request.args.get('points', default=1000, type=int)
+        level = peaks.level_for(max(points, 1), start, end)
+    try:
+        return jsonify(peaks.window(level, start, end))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+@app.route('/jobs')
+def job_stats():
+    return jsonify(job_manager.stats())
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    offset = request.args.get('offset', default=0, type=int)
+    return event_response(job.iter_events(offset))
+
+@app.route('/metrics')
+def metrics():
+    return Response(engine.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/storage/stats')
+def storage_stats():
+    return jsonify({**storage_manager.stats(), "uploads": upload_manager.stats()})
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    debug = os.environ.get('FLASK_DEBUG', '1').lower() not in ('0', 'false', 'no')
+    # The debug reloader runs this file twice: a watcher process that never
+    # serves, and the serving child. Only the process that serves builds the services.
+    if not debug or is_running_from_reloader():
+        create_app()
+    app.run(debug=debug, port=5000)
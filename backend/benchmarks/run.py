@@ -0,0 +1,226 @@
+"""
+Per-stage timing of the analysis engine on synthetic audio.
+
+Usage:
+    python -m benchmarks.run                       # run and print
+    python -m benchmarks.run --save baseline.json  # record a baseline
+    python -m benchmarks.run --baseline baseline.json --threshold 0.25
+
+Demucs and basic-pitch are stubbed out unless ``--demucs``/``--basic-pitch``
+are given: the stubs stand in the synthetic components for separated stems
+and only time the host-side work around the model.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.synth import CASES, BenchmarkCase, render_case
+from engine.instrumentation import peak_rss_bytes
+
+logger = logging.getLogger("benchmarks")
+
+SR = 22050
+SEPARATION_SR = 44100
+# Stage slowdowns smaller than this are treated as timer noise
+MIN_REGRESSION_SECONDS = 0.01
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    walls: List[float] = []
+    cpus: List[float] = []
+    value = None
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        value = fn()
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    return {
+        "wall_seconds": round(statistics.median(walls), 4),
+        "cpu_seconds": round(statistics.median(cpus), 4),
+        "process_peak_rss_mb": round(peak_rss_bytes() / (1024 * 1024), 1),
+        "value": value,
+    }
+
+
+def run_case(case: BenchmarkCase, workdir: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from engine import analysis
+    from engine.rendering import generate_waveform
+    from engine.separation import SeparationResult, separate_audio_demucs, split_drums
+
+    mix, components = render_case(case, SEPARATION_SR)
+    path = os.path.join(workdir, f"{case.name}.wav")
+    sf.write(path, mix, SEPARATION_SR, subtype="FLOAT")
+
+    stages: Dict[str, Dict[str, Any]] = {}
+
+    def stage(name: str, fn: Callable[[], Any], repeat: Optional[int] = None) -> Any:
+        stats = measure(fn, repeat or args.repeat)
+        value = stats.pop("value")
+        stages[name] = stats
+        logger.info("%-28s %-22s %8.3fs wall %8.3fs cpu %8.1f MB", case.name, name,
+                    stats["wall_seconds"], stats["cpu_seconds"], stats["process_peak_rss_mb"])
+        return value
+
+    # FeatureContext memoizes features, so every repeat gets a fresh context
+    # seeded with the shared decode and STFT; "stft" times that front end.
+    ctx = stage("decode", lambda: analysis.FeatureContext.from_file(path))
+    stage("stft", lambda: analysis.FeatureContext(ctx.y, ctx.sr).stft)
+    y, sr, spectrum = ctx.y, ctx.sr, ctx.stft
+
+    def fresh(seconds: Optional[float] = None) -> Any:
+        track = analysis.FeatureContext(y, sr, stft=spectrum)
+        return track.head(seconds) if seconds else track
+
+    bpm, key = stage("detect_bpm_and_key", lambda: analysis.detect_bpm_and_key(fresh(180)))
+    accurate_key = stage("detect_key_accurate", lambda: analysis.get_camelot_key(fresh(180), mode="accurate"))
+    drop_time = stage("detect_drop", lambda: analysis.detect_drop(fresh(180)))
+    intro_end, outro_start = stage("find_mix_points", lambda: analysis.find_mix_points(fresh()))
+    mix_points = {"intro_end": intro_end, "outro_start": outro_start}
+    harmonic_stft = stage("hpss", lambda: fresh().hpss[0])
+    stage(
+        "detect_cue_points",
+        lambda: analysis.detect_cue_points(
+            analysis.FeatureContext(sr=sr, stft=harmonic_stft), mix_points, drop_time
+        ),
+    )
+    stage("generate_waveform", lambda: generate_waveform(y))
+
+    if args.demucs:
+        separation = stage("separate", lambda: separate_audio_demucs(path), repeat=1)
+    else:
+        separation = SeparationResult(
+            samplerate=SEPARATION_SR,
+            stems={name: np.stack([audio, audio]) for name, audio in components.items()},
+        )
+    stem_audio = stage("separate_downmix", lambda: separation.mono(SR))
+    stage("split_drums", lambda: split_drums(stem_audio["drums"], SR))
+
+    melodic = {name: stem_audio[name] for name in ("piano", "guitar", "bass") if name in stem_audio}
+    if args.basic_pitch:
+        from engine.transcription import get_transcription_engine
+
+        stage("transcribe", lambda: get_transcription_engine().transcribe(melodic, SR), repeat=1)
+    else:
+        stage("transcribe_windowing", lambda: _stub_windows(melodic))
+
+    return {
+        "seconds": case.seconds,
+        "expected": {"bpm": case.bpm, "key": case.key},
+        "detected": {
+            "bpm": round(float(bpm), 2),
+            "key": key.camelot,
+            "key_confidence": key.confidence,
+            "key_accurate": accurate_key,
+        },
+        "stages": stages,
+    }
+
+
+def _stub_windows(melodic: Dict[str, np.ndarray]) -> int:
+    """The resample-and-window work done before basic-pitch sees any audio."""
+    import librosa
+
+    from engine.transcription import _window
+
+    # basic-pitch's input rate, window length and overlap (constants of its model)
+    sr, n_samples, overlap = 22050, 43844, 30 * 256
+    count = 0
+    for audio in melodic.values():
+        resampled = librosa.resample(audio, orig_sr=SR, target_sr=sr)
+        count += len(_window(resampled.astype(np.float32), overlap, n_samples - overlap, n_samples))
+    return count
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Describe every stage whose wall time grew by more than ``threshold`` (a fraction)."""
+    regressions: List[str] = []
+    for case_name, case in report["cases"].items():
+        base_case = baseline.get("cases", {}).get(case_name)
+        if base_case is None:
+            continue
+        for stage_name, stats in case["stages"].items():
+            base = base_case["stages"].get(stage_name)
+            if base is None:
+                continue
+            before, after = base["wall_seconds"], stats["wall_seconds"]
+            if after > before * (1 + threshold) and after - before > MIN_REGRESSION_SECONDS:
+                regressions.append(
+                    f"{case_name}/{stage_name}: {before:.3f}s -> {after:.3f}s "
+                    f"(+{(after / before - 1) * 100 if before else float('inf'):.0f}%)"
+                )
+    return regressions
+
+
+def environment() -> Dict[str, str]:
+    import librosa
+    import scipy
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "librosa": librosa.__version__,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Time each analysis stage on synthetic audio.")
+    parser.add_argument("--case", action="append", help="Only run the named case(s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the median is reported")
+    parser.add_argument("--demucs", action="store_true", help="Run real Demucs separation")
+    parser.add_argument("--basic-pitch", action="store_true", help="Run real basic-pitch transcription")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown as a fraction, e.g. 0.2")
+    parser.add_argument("--save", help="Write this run's report to a JSON file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    cases = [case for case in CASES if not args.case or case.name in args.case]
+    if not cases:
+        parser.error(f"no such case; choose from {', '.join(case.name for case in CASES)}")
+
+    report: Dict[str, Any] = {"environment": environment(), "cases": {}}
+    with tempfile.TemporaryDirectory(prefix="engine-bench-") as workdir:
+        for case in cases:
+            report["cases"][case.name] = run_case(case, workdir, args)
+
+    for case_name, case in report["cases"].items():
+        total = sum(stats["wall_seconds"] for stats in case["stages"].values())
+        detected, expected = case["detected"], case["expected"]
+        print(f"{case_name}: {total:.2f}s total, bpm {detected['bpm']} (expected {expected['bpm']}), "
+              f"key {detected['key']} (expected {expected['key']})")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"Saved report to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        if baseline.get("environment") != report["environment"]:
+            print("Note: baseline was recorded in a different environment")
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No stage regressed beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
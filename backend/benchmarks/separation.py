@@ -0,0 +1,97 @@
+"""
+Chunked against single-shot Demucs separation on synthetic audio.
+
+Usage:
+    python -m benchmarks.separation                        # default chunking
+    python -m benchmarks.separation --chunk-seconds 20 --overlap-seconds 4 --workers 4
+    python -m benchmarks.separation --min-snr 30           # fail below 30 dB
+
+Both modes separate the same mix on the CPU. For each stem the report gives
+the wall time and the error of the chunked output relative to the
+single-shot one as a signal-to-noise ratio; the run fails if any stem falls
+below ``--min-snr``. Needs torch and demucs.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import soundfile as sf
+
+from benchmarks.synth import CASES, render_case
+
+logger = logging.getLogger("benchmarks")
+
+SEPARATION_SR = 44100
+
+
+def snr_db(reference: np.ndarray, estimate: np.ndarray) -> float:
+    """Energy of ``reference`` over that of ``estimate - reference``, in dB."""
+    noise = float(np.sum((estimate - reference) ** 2))
+    signal_energy = float(np.sum(reference**2))
+    if noise == 0.0:
+        return float("inf")
+    return 10.0 * np.log10(max(signal_energy, 1e-20) / noise)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare chunked and single-shot CPU separation.")
+    parser.add_argument("--case", default=CASES[1].name, help="Synthetic case to separate")
+    parser.add_argument("--model", default="htdemucs_6s")
+    parser.add_argument("--chunk-seconds", type=float, default=30.0)
+    parser.add_argument("--overlap-seconds", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads-per-worker", type=int, default=2)
+    parser.add_argument("--min-snr", type=float, default=30.0, help="Lowest acceptable per-stem SNR in dB")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    import engine.separation as separation
+    from engine.chunking import ChunkSettings
+
+    # Both runs must use the CPU for the comparison to mean anything.
+    separation._has_cuda = lambda: False
+
+    case = next((case for case in CASES if case.name == args.case), None)
+    if case is None:
+        parser.error(f"no such case; choose from {', '.join(case.name for case in CASES)}")
+
+    settings = ChunkSettings(
+        chunk_seconds=args.chunk_seconds,
+        overlap_seconds=args.overlap_seconds,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+    )
+    with tempfile.TemporaryDirectory(prefix="engine-bench-") as workdir:
+        path = os.path.join(workdir, f"{case.name}.wav")
+        mix, _ = render_case(case, SEPARATION_SR)
+        sf.write(path, mix, SEPARATION_SR, subtype="FLOAT")
+
+        results: Dict[str, separation.SeparationResult] = {}
+        for label, service in (
+            ("single-shot", separation.SeparationService()),
+            ("chunked", separation.SeparationService(chunking=settings)),
+        ):
+            started = time.perf_counter()
+            results[label] = service.submit(path, args.model).result()
+            print(f"{label:>12}: {time.perf_counter() - started:.2f}s")
+            service.shutdown()
+
+    failed = False
+    reference, chunked = results["single-shot"].stems, results["chunked"].stems
+    for name in sorted(reference):
+        snr = snr_db(reference[name], chunked[name])
+        peak = float(np.max(np.abs(reference[name] - chunked[name])))
+        failed |= snr < args.min_snr
+        print(f"{name:>8}: {snr:6.1f} dB SNR, max abs diff {peak:.2e}")
+    print(f"{'FAIL' if failed else 'OK'}: every stem {'not ' if failed else ''}within {args.min_snr:.0f} dB")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
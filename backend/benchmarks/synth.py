@@ -0,0 +1,93 @@
+"""
+Synthetic test material with known ground truth.
+
+Every generator returns mono float32 audio; :func:`render_case` mixes the
+pieces for one benchmark case and also returns the separated components,
+which stand in for Demucs stems when the real model is stubbed out.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Camelot code -> (tonic pitch class, is_minor)
+CAMELOT_TONICS = {
+    "8A": (9, True),  # A minor
+    "8B": (0, False),  # C major
+    "5A": (0, True),  # C minor
+    "11B": (9, False),  # A major
+}
+
+
+@dataclass
+class BenchmarkCase:
+    name: str
+    seconds: float
+    bpm: float
+    key: str
+    # (start_s, end_s) ranges replaced by silence or noise
+    silence: List[Tuple[float, float]] = field(default_factory=list)
+    noise: List[Tuple[float, float]] = field(default_factory=list)
+
+
+CASES = [
+    BenchmarkCase("click_120_8A_30s", 30.0, 120.0, "8A"),
+    BenchmarkCase("click_128_8B_3min", 180.0, 128.0, "8B", silence=[(0.0, 4.0)]),
+    BenchmarkCase("click_174_5A_3min_noise", 180.0, 174.0, "5A", noise=[(60.0, 75.0)]),
+    BenchmarkCase("click_100_11B_6min", 360.0, 100.0, "11B", silence=[(170.0, 178.0)], noise=[(300.0, 310.0)]),
+]
+
+
+def click_track(seconds: float, bpm: float, sr: int, accent_every: int = 4) -> np.ndarray:
+    """Decaying noise-burst kicks on every beat, louder on the downbeat."""
+    y = np.zeros(int(seconds * sr), dtype=np.float32)
+    click_len = int(0.03 * sr)
+    envelope = np.exp(-np.linspace(0.0, 8.0, click_len)).astype(np.float32)
+    body = np.sin(2 * np.pi * 60.0 * np.arange(click_len) / sr).astype(np.float32)
+    click = envelope * body
+    for index, start in enumerate(np.arange(0.0, seconds, 60.0 / bpm)):
+        offset = int(start * sr)
+        gain = 1.0 if index % accent_every == 0 else 0.6
+        segment = y[offset : offset + click_len]
+        segment += gain * click[: len(segment)]
+    return y
+
+
+def tonal_pad(seconds: float, key: str, sr: int, chord_seconds: float = 4.0) -> np.ndarray:
+    """Sustained i-iv-v (or I-IV-V) triads in ``key`` with a slow fade per chord."""
+    tonic, minor = CAMELOT_TONICS[key]
+    third = 3 if minor else 4
+    degrees = [0, 5, 7, 0]
+    n_samples = int(seconds * sr)
+    t = np.arange(n_samples) / sr
+    y = np.zeros(n_samples, dtype=np.float32)
+    chord_len = int(chord_seconds * sr)
+    fade = np.minimum(1.0, np.minimum(np.arange(chord_len), np.arange(chord_len)[::-1]) / (0.05 * sr))
+    for chord_index, start in enumerate(range(0, n_samples, chord_len)):
+        root = tonic + degrees[chord_index % len(degrees)]
+        span = slice(start, min(start + chord_len, n_samples))
+        chord = np.zeros(span.stop - span.start)
+        for interval in (0, third, 7):
+            freq = 220.0 * 2 ** ((root + interval - 9) / 12)
+            chord += np.sin(2 * np.pi * freq * t[span])
+        y[span] = (chord * fade[: len(chord)] / 3).astype(np.float32)
+    return y
+
+
+def render_case(case: BenchmarkCase, sr: int, seed: int = 0) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Mix ``case`` and return ``(mix, components)``."""
+    rng = np.random.default_rng(seed)
+    drums = 0.5 * click_track(case.seconds, case.bpm, sr)
+    pad = 0.3 * tonal_pad(case.seconds, case.key, sr)
+    other = np.zeros_like(pad)
+    for start, end in case.noise:
+        span = slice(int(start * sr), int(end * sr))
+        other[span] = 0.2 * rng.standard_normal(span.stop - span.start).astype(np.float32)
+    components = {"drums": drums, "piano": pad, "other": other}
+    for start, end in case.silence:
+        span = slice(int(start * sr), int(end * sr))
+        for audio in components.values():
+            audio[span] = 0.0
+    mix = sum(components.values()).astype(np.float32)
+    return mix, components
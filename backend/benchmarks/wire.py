@@ -0,0 +1,69 @@
+"""
+Encoding cost and size of a complete message in each wire format.
+
+Usage:
+    python -m benchmarks.wire                      # 7 stems x 2000 points
+    python -m benchmarks.wire --points 8000 --repeat 50
+
+Builds a synthetic result shaped like a full analysis and times encoding it
+as NDJSON and as MessagePack (waveforms packed as float32). Needs msgpack.
+"""
+
+import argparse
+import sys
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from engine.types import AnalysisResult, CompleteMessage, MixPoints
+
+
+def synthetic_result(stems: int, points: int) -> AnalysisResult:
+    rng = np.random.default_rng(0)
+
+    def waveform() -> List[float]:
+        return np.round(rng.random(points), 4).tolist()
+
+    return AnalysisResult(
+        bpm=128,
+        key="8A",
+        texture="Dense",
+        color="#ff0000",
+        loudness=-8.0,
+        mix_points=MixPoints(intro_end="0:32", outro_start="5:10", drop="1:04"),
+        waveform=waveform(),
+        stems={f"stem{index}": waveform() for index in range(stems)},
+        stem_files={"main": "track.wav"},
+        midi_files={},
+        cues=[{"time": float(second), "label": "cue"} for second in range(0, 300, 15)],
+    )
+
+
+def best_of(repeat: int, encode: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare NDJSON and MessagePack encodings of a result.")
+    parser.add_argument("--stems", type=int, default=7)
+    parser.add_argument("--points", type=int, default=2000, help="Waveform points per stem")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    message = CompleteMessage(synthetic_result(args.stems, args.points))
+    for label, encode in (("ndjson", message.to_ndjson), ("msgpack", message.to_msgpack)):
+        seconds = best_of(args.repeat, encode)
+        payload = encode()
+        size = len(payload.encode("utf-8")) if isinstance(payload, str) else len(payload)
+        print(f"{label:>8}: {seconds * 1000:7.2f} ms, {size / 1024:8.1f} KiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
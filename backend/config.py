@@ -1,7 +1,76 @@
+import os
+
 DEFAULT_MODEL = "htdemucs_6s"
 ALLOWED_MODELS = {"htdemucs_6s", "htdemucs_ft"}
+# "full" runs the stem pipeline on the first 3 minutes; "mix" streams the whole file
+ANALYSIS_MODES = {"full", "mix"}
+# "fast" keys from the STFT chroma; "accurate" computes a constant-Q chroma
+DEFAULT_KEY_MODE = "fast"
+KEY_MODES = {"fast", "accurate"}
 
 # Storage
 UPLOAD_FOLDER = "uploads"
 TEMP_FOLDER = "temp_audio"
-TEMP_FILE_TTL_SECONDS = 60 * 60 * 24  # 24 hours
+TEMP_FILE_TTL_SECONDS = 60 * 60 * 24  # 24 hours without access
+# Index of TEMP_FOLDER; each upload and its artifacts are evicted as one unit,
+# least recently used first, once they exceed the quota
+STORAGE_INDEX_PATH = "storage_index.sqlite3"
+STORAGE_MAX_BYTES = 20 * 1024 * 1024 * 1024  # 20 GB
+STORAGE_SCAN_INTERVAL_SECONDS = 5 * 60
+
+# Uploads stream into TEMP_FOLDER in chunks and can be resumed; abandoned ones
+# are dropped after the session TTL. WAV/AIFF is decoded every
+# UPLOAD_DECODE_STEP_BYTES while it arrives.
+UPLOAD_MAX_BYTES = 4 * 1024 * 1024 * 1024  # 4 GB
+UPLOAD_READ_BYTES = 1024 * 1024
+UPLOAD_SESSION_TTL_SECONDS = 60 * 60 * 6  # 6 hours without a chunk
+UPLOAD_DECODE_STEP_BYTES = 8 * 1024 * 1024
+
+# Analysis audio is decoded once per upload and kept as a memory-mapped .npy
+# next to it. The resampler tier trades quality for speed: "best", "high"
+# (librosa's default), "medium" or "fast"; changing it changes cache keys.
+DECODE_CACHE = True
+RESAMPLER_TIER = "high"
+
+# Stored stems are FLAC (lossless) or Opus (preview); /audio/<file>?format=
+# re-encodes any stored file into one of AUDIO_FORMATS and keeps the encode
+STEM_FORMAT = "flac"
+AUDIO_FORMATS = {"flac", "opus", "wav"}
+# Set when a proxy that understands X-Sendfile (or X-Accel-Redirect via its
+# own mapping) serves TEMP_FOLDER; otherwise files go through wsgi.file_wrapper
+USE_X_SENDFILE = False
+
+# Result cache
+RESULT_CACHE_FOLDER = "result_cache"
+RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+
+# Metadata lookups
+METADATA_ENDPOINT = "https://musicbrainz.org/ws/2/recording"
+METADATA_CACHE_FOLDER = "metadata_cache"
+METADATA_CACHE_TTL_SECONDS = 60 * 60 * 24 * 7  # 1 week
+# MusicBrainz allows 1 request/s per client. The limit is kept per process, so
+# an ingest run alongside the API server should use a longer interval.
+METADATA_MIN_INTERVAL_SECONDS = 1.0
+
+# CPU separation: overlapping chunks across a process pool; workers x threads
+# bounds the cores Demucs uses. Ignored when CUDA is available. Chunk edges
+# make the stems approximate, so it stays off until
+# `python -m benchmarks.separation --min-snr <dB>` passes for these settings.
+SEPARATION_CHUNKED = False
+SEPARATION_CHUNK_SECONDS = 30.0
+SEPARATION_OVERLAP_SECONDS = 2.0
+SEPARATION_THREADS_PER_WORKER = 2
+SEPARATION_WORKERS = max(1, (os.cpu_count() or 1) // SEPARATION_THREADS_PER_WORKER)
+
+# Processes for per-stem waveforms, peaks and cues, shared by all jobs
+STEM_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2))
+
+# Analysis jobs
+JOB_WORKERS = 2
+JOB_MAX_QUEUE_DEPTH = 8
+JOB_RETENTION_SECONDS = 60 * 60  # 1 hour
+
+# Library ingestion
+LIBRARY_DB_PATH = "library.sqlite3"
+LIBRARY_ARTIFACT_FOLDER = "library_artifacts"
+INGEST_WORKERS = 2
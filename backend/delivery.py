@@ -0,0 +1,53 @@
+"""
+HTTP delivery of stored audio and MIDI artifacts.
+
+Responses carry a strong ETag (the file's content hash) and Last-Modified,
+answer conditional requests with 304 and byte ranges with 206, and hand the
+file to the server's ``wsgi.file_wrapper`` (sendfile) or, with
+``USE_X_SENDFILE``, to the fronting proxy. A URL carrying ``?v=<hash>``
+names one immutable version of the file and may be cached for a year;
+without it clients revalidate every time, which costs a 304.
+"""
+
+import os
+from typing import Optional
+
+from flask import Response, request, send_file
+
+import engine
+
+# A year, the longest lifetime caches honour
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def send_artifact(path: str, mimetype: Optional[str] = None, version_of: Optional[str] = None) -> Response:
+    """
+    Serve ``path`` with validators, range support and a cache policy.
+
+    Args:
+        path: File to send.
+        mimetype: Overrides the type guessed from the extension.
+        version_of: File whose content hash the ``v`` query parameter is
+            checked against, when ``path`` is derived from it (an encode).
+            Defaults to ``path`` itself.
+    """
+    # Memoized per (path, size, mtime), so repeat requests do not rehash
+    digest = engine.file_digest(path)
+    version = request.args.get("v")
+    immutable = version is not None and version == (
+        digest if version_of is None else engine.file_digest(version_of)
+    )
+
+    response = send_file(
+        os.path.abspath(path),
+        mimetype=mimetype,
+        conditional=True,
+        etag=digest,
+        max_age=IMMUTABLE_MAX_AGE if immutable else None,
+    )
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
@@ -1,180 +1,601 @@
+import hashlib
 import logging
 import os
-from typing import Dict, Generator, List
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Generator, Iterable, List, Optional, Tuple
 
-import librosa
-import soundfile as sf
+import numpy as np
 
-from . import analysis
-from .types import AnalysisResult, ErrorMessage, MixPoints, ProgressMessage, complete_message
-from .metadata import fetch_metadata_rich
-from .rendering import generate_midi_from_audio, generate_waveform
-from .separation import DemucsError, separate_audio_demucs, split_drums
+from . import analysis, decode, key, segmentation
+from .cache import ENGINE_VERSION, ResultCache
+from .instrumentation import ANALYSES, StageTimer, render_metrics
+from .types import (
+    AnalysisResult,
+    CompleteMessage,
+    ErrorMessage,
+    Message,
+    MixPoints,
+    PartialMessage,
+    ProgressMessage,
+    complete_message,
+)
+from .metadata import configure_metadata, fetch_metadata_rich, get_metadata_client
+from .peaks import PeakFile, PeakPyramidBuilder, write_peaks
+from .rendering import generate_waveform
+from .persistence import DIGEST_LENGTH, file_digest, persist_audio
+from .chunking import ChunkSettings
+from .decode import RESAMPLER_TIERS, configure_decoding
+from .encoding import FORMATS, ensure_encoded, headroom_gain
+from .separation import (
+    DemucsError,
+    configure_separation,
+    separate_audio_demucs,
+    split_drums,
+    submit_separation,
+    wait_for_separation,
+)
+from .stems import collect, configure_stem_pool, get_stem_pool, process_stem
+from .stages import (
+    BPM,
+    CUES,
+    DRUM_SPLIT,
+    KEY,
+    LOUDNESS,
+    METADATA,
+    MIDI,
+    MIX_POINTS,
+    SECTIONS,
+    SEPARATION,
+    STEMS,
+    TEXTURE,
+    WAVEFORM,
+)
+from .stages import resolve as resolve_stages
+from .streaming import BlockReader, GrowingFileDecoder, StreamingAnalyzer
+from .transcription import get_transcription_engine
 
 logger = logging.getLogger(__name__)
 
 
-def analyze_audio(filepath: str, model_name: str = "htdemucs_6s") -> Generator[str, None, None]:
-    logger.info("Starting analysis for %s with model %s", filepath, model_name)
+ANALYSIS_WINDOW_SECONDS = 180
+# Rate the mix is decoded to for analysis
+ANALYSIS_SR = 22050
+# How long a finished analysis waits on a still-running metadata lookup
+METADATA_WAIT_SECONDS = 10
+
+# Separated stem name -> key used for it in AnalysisResult.stems
+STEM_LABELS = {
+    "vocals": "vocal",
+    "bass": "bass",
+    "kick": "kick",
+    "hats": "hihats",
+    "piano": "piano",
+    "guitar": "guitar",
+    "other": "other",
+}
+MELODIC_STEMS = ["piano", "guitar", "bass"]
+
+# Side work that overlaps the main pipeline (loudness metering) without
+# holding up the message stream.
+_background = ThreadPoolExecutor(max_workers=2, thread_name_prefix="analysis-background")
 
-    try:
-        yield ProgressMessage(message="Loading audio file...", percent=5).to_ndjson()
-        y, sr = librosa.load(filepath, duration=180)
-        total_duration = librosa.get_duration(y=y, sr=sr)
-    except Exception as exc:
-        logger.exception("Failed to load audio file %s", filepath)
-        yield ErrorMessage(message=f"Audio load failed: {exc}").to_ndjson()
-        return
 
+def _measure_mix_loudness(filepath: str, ctx: analysis.FeatureContext) -> analysis.LoudnessStats:
+    """Meter the file at its native rate, falling back to the decoded mono signal."""
     try:
-        yield ProgressMessage(message="Detecting BPM & Key...", percent=10).to_ndjson()
-        bpm, key = analysis.detect_bpm_and_key(y, sr)
+        return analysis.measure_loudness_file(filepath)
     except Exception as exc:
-        logger.exception("BPM/Key detection failed for %s", filepath)
-        yield ErrorMessage(message=f"BPM/Key detection failed: {exc}").to_ndjson()
-        return
+        logger.warning("Native-rate loudness unavailable for %s (%s); metering decoded audio", filepath, exc)
+        return analysis.measure_loudness(ctx.y, ctx.sr)
 
-    yield ProgressMessage(message="Fetching metadata...", percent=20).to_ndjson()
-    filename = os.path.basename(filepath)
+
+def _measure_stem_loudness(stems: Dict[str, tuple]) -> Dict[str, Dict[str, float]]:
+    """BS.1770 summary per stem label, from ``{name: (audio, sr)}``."""
+    loudness: Dict[str, Dict[str, float]] = {}
+    for name, (audio, sr) in stems.items():
+        if name in STEM_LABELS:
+            loudness[STEM_LABELS[name]] = analysis.measure_loudness(audio, sr).summary()
+    return loudness
+
+
+def _stem_files(filepath: str, stems_dict: Dict[str, str]) -> Dict[str, str]:
+    """AnalysisResult.stem_files: role -> file name, empty for stems that were not written."""
+    return {
+        "main": os.path.basename(filepath),
+        "vocal": os.path.basename(stems_dict.get("vocals", "")),
+        "bass": os.path.basename(stems_dict.get("bass", "")),
+        "kick": os.path.basename(stems_dict.get("kick", "")),
+        "hihats": os.path.basename(stems_dict.get("hats", "")),
+        "piano": os.path.basename(stems_dict.get("piano", "")),
+        "guitar": os.path.basename(stems_dict.get("guitar", "")),
+        "other": os.path.basename(stems_dict.get("other", "")),
+    }
+
+
+def _collect_metadata(metadata: Optional[Future], filename: str, timer: StageTimer) -> Dict[str, str]:
+    """Wait for a metadata lookup, if one was started, and tag it with ``filename``."""
     meta: Dict[str, str] = {}
-    try:
-        meta = fetch_metadata_rich(filename)
-    except Exception as exc:
-        logger.warning("Metadata fetch failed for %s: %s", filename, exc)
+    if metadata is not None:
+        with timer.stage(METADATA):
+            try:
+                meta = dict(metadata.result(timeout=METADATA_WAIT_SECONDS))
+            except Exception as exc:
+                logger.warning("Metadata fetch failed for %s: %s", filename, exc)
+                timer.fail(METADATA)
     meta["filename"] = filename
+    return meta
+
+
+def analyze_audio(
+    filepath: str,
+    model_name: str = "htdemucs_6s",
+    cache: Optional[ResultCache] = None,
+    output_dir: Optional[str] = None,
+    include_timings: bool = False,
+    key_mode: str = key.FAST,
+    stages: Optional[Iterable[str]] = None,
+    stem_format: str = "flac",
+    audio: Optional[Tuple[np.ndarray, int]] = None,
+) -> Generator[Message, None, None]:
+    """
+    Run the full analysis pipeline, yielding progress/partial/error/complete
+    messages; :mod:`engine.types` encodes them as NDJSON or MessagePack.
+
+    Separation is queued as soon as the cache misses. Meanwhile a quick pass
+    sends a ``summary`` partial (tempo, key, character, waveform, mix points);
+    stems, cues, stem files and MIDI follow as partials when each is ready.
+
+    Args:
+        filepath: Audio file to analyze.
+        model_name: Demucs model used for stem separation.
+        cache: Optional result cache consulted before and filled after the run.
+        output_dir: Where stem/MIDI artifacts are written. Defaults to the
+            directory containing ``filepath``.
+        include_timings: Attach per-stage wall/CPU/memory figures to the
+            result. They are recorded in the ``/metrics`` histograms either way.
+        key_mode: ``"fast"`` (STFT chroma) or ``"accurate"`` (constant-Q chroma)
+            key detection.
+        stages: Stages to run (see :mod:`engine.stages`); their prerequisites
+            are added and ``None`` runs everything. Fields of skipped stages
+            keep their empty defaults.
+        stem_format: Encoding of the stored stems, a key of
+            :data:`engine.encoding.FORMATS` (``"flac"``, ``"opus"`` or ``"wav"``).
+        audio: ``(y, sr)`` of ``filepath`` already decoded to mono at
+            :data:`ANALYSIS_SR` (e.g. by a :class:`GrowingFileDecoder` during
+            the upload); it is added to the decode cache. The file is loaded
+            (see :mod:`engine.decode`) when omitted.
+    """
+    plan = resolve_stages(stages)
+    stem_extension = FORMATS[stem_format].extension
+    logger.info("Starting analysis for %s with model %s (stages: %s)", filepath, model_name, ",".join(plan))
+    artifact_dir = output_dir or os.path.dirname(filepath)
+    timer = StageTimer()
+
+    filename = os.path.basename(filepath)
+    cache_key: Optional[str] = None
+    if cache is not None:
+        # Keyed on the file's content, so a hit skips decoding altogether.
+        with timer.stage("cache"):
+            variant = f"key={key_mode}|stages={','.join(plan)}|stems={stem_format}|tier={decode.get_settings().tier}"
+            try:
+                cache_key = ResultCache.make_key(file_digest(filepath), ANALYSIS_SR, model_name, variant=variant)
+            except OSError:
+                logger.warning("Could not hash %s for the result cache", filepath, exc_info=True)
+            cached = cache.get(cache_key, artifact_dir) if cache_key is not None else None
+        if cached is not None:
+            logger.info("Serving cached analysis for %s (%s)", filepath, cache_key[:12])
+            ANALYSES.inc(outcome="cached")
+            yield ProgressMessage(message="Loaded cached analysis", percent=100)
+            cached.stem_files["main"] = filename
+            # The entry may come from the same content uploaded under another name
+            cached.meta = _collect_metadata(
+                get_metadata_client().submit(filename) if METADATA in plan else None, filename, timer
+            )
+            cached.file_hashes = {
+                name: digest for name, digest in cached.file_hashes.items() if name != cached.stem_files.get("main")
+            }
+            cached.file_hashes[filename] = file_digest(filepath)
+            if include_timings:
+                cached.timings = timer.to_dict()
+            yield complete_message(cached)
+            return
 
-    yield ProgressMessage(message=f"Separating ({model_name})...", percent=30).to_ndjson()
     try:
-        demucs_cache_dir = os.path.join(os.path.dirname(filepath), "temp_audio")
-        stems_dict = separate_audio_demucs(
-            filepath,
-            demucs_cache_dir,
-            model_name=model_name,
-        )
-    except DemucsError as exc:
-        logger.exception("Demucs separation failed for %s", filepath)
-        yield ErrorMessage(message=f"Stem separation failed: {exc}").to_ndjson()
+        yield ProgressMessage(message="Loading audio file...", percent=5)
+        with timer.stage("load"):
+            if audio is not None:
+                ctx = analysis.FeatureContext(*audio)
+                _background.submit(decode.store_mono, filepath, *audio)
+            else:
+                # A memory-mapped decode from an earlier run when there is one
+                ctx = analysis.FeatureContext(decode.load_mono(filepath, ANALYSIS_SR), ANALYSIS_SR)
+            sr = ctx.sr
+            head = ctx.head(ANALYSIS_WINDOW_SECONDS)
+    except Exception as exc:
+        logger.exception("Failed to load audio file %s", filepath)
+        ANALYSES.inc(outcome="error")
+        yield ErrorMessage(message=f"Audio load failed: {exc}")
         return
 
-    yield ProgressMessage(message="Splitting Drums (Kick/Hats)...", percent=70).to_ndjson()
-    if "drums" in stems_dict:
-        try:
-            drum_y, _ = librosa.load(stems_dict["drums"], sr=sr)
-            drum_split = split_drums(drum_y, sr)
-            if drum_split:
-                kick_y, hats_y = drum_split
-                base_name = os.path.splitext(filepath)[0]
-                kick_path = f"{base_name}_kick.wav"
-                hats_path = f"{base_name}_hats.wav"
-                sf.write(kick_path, kick_y, sr)
-                sf.write(hats_path, hats_y, sr)
-                stems_dict["kick"] = kick_path
-                stems_dict["hats"] = hats_path
-        except Exception:
-            logger.exception("Drum splitting failed for %s", stems_dict.get("drums"))
-
-    yield ProgressMessage(message="Generating Waveforms...", percent=80).to_ndjson()
+    # Separation, network and metering work overlap the quick pass below.
+    separation_future = submit_separation(filepath, model_name=model_name) if SEPARATION in plan else None
+    metadata = get_metadata_client().submit(filename) if METADATA in plan else None
+    mix_loudness = _background.submit(_measure_mix_loudness, filepath, ctx) if LOUDNESS in plan else None
+    main_digest = _background.submit(file_digest, filepath)
+    # File name -> content hash of every deliverable file, for versioned URLs
+    file_hashes: Dict[str, str] = {}
+
+    bpm = 0.0
+    key_detail: Optional[Dict[str, object]] = None
     try:
-        y_full, _ = librosa.load(filepath, sr=sr)
+        yield ProgressMessage(message="Detecting BPM & Key...", percent=10)
+        if BPM in plan:
+            with timer.stage(BPM):
+                bpm = analysis.detect_bpm(head)
+        if KEY in plan:
+            with timer.stage(KEY):
+                key_estimate = key.detect_key(head, key_mode, bpm)
+                # Windowed estimates over the whole track follow key changes.
+                curve = key.key_curve(ctx, mode=key_mode, bpm=bpm)
+                key_detail = {**key_estimate.to_dict(), "mode": key_mode, "curve": curve}
     except Exception as exc:
-        logger.exception("Failed to load full audio for waveform generation for %s", filepath)
-        yield ErrorMessage(message=f"Waveform generation failed: {exc}").to_ndjson()
+        logger.exception("BPM/Key detection failed for %s", filepath)
+        ANALYSES.inc(outcome="error")
+        if separation_future is not None:
+            separation_future.cancel()
+        yield ErrorMessage(message=f"BPM/Key detection failed: {exc}")
         return
 
-    def _waveform_for_path(path: str) -> List[float]:
-        try:
-            y_stem, _ = librosa.load(path, sr=sr)
-            return generate_waveform(y_stem)
-        except Exception:
-            logger.exception("Waveform generation failed for %s", path)
-            return [0.0] * 150
-
-    waveform = generate_waveform(y_full)
-    stem_waveforms: Dict[str, List[float]] = {}
-    if "vocals" in stems_dict:
-        stem_waveforms["vocal"] = _waveform_for_path(stems_dict["vocals"])
-    if "bass" in stems_dict:
-        stem_waveforms["bass"] = _waveform_for_path(stems_dict["bass"])
-    if "kick" in stems_dict:
-        stem_waveforms["kick"] = _waveform_for_path(stems_dict["kick"])
-    if "hats" in stems_dict:
-        stem_waveforms["hihats"] = _waveform_for_path(stems_dict["hats"])
-    if "piano" in stems_dict:
-        stem_waveforms["piano"] = _waveform_for_path(stems_dict["piano"])
-    if "guitar" in stems_dict:
-        stem_waveforms["guitar"] = _waveform_for_path(stems_dict["guitar"])
-    if "other" in stems_dict:
-        stem_waveforms["other"] = _waveform_for_path(stems_dict["other"])
-
-    yield ProgressMessage(message="Final Analysis...", percent=90).to_ndjson()
+    texture = color = ""
+    mix_points = MixPoints(intro_end="", outro_start="", drop=None)
+    cue_params: Dict[str, object] = {}
     try:
-        texture, color = analysis.analyze_texture_and_color(y, sr)
-        drop_time = analysis.detect_drop(y, sr)
-        intro_end, outro_start = analysis.find_mix_points(y_full, sr, total_duration)
+        if TEXTURE in plan or MIX_POINTS in plan:
+            yield ProgressMessage(message="Analyzing mix character...", percent=15)
+        if TEXTURE in plan:
+            with timer.stage(TEXTURE):
+                texture, color = analysis.analyze_texture_and_color(ctx)
+        if MIX_POINTS in plan:
+            with timer.stage(MIX_POINTS):
+                drop_time = analysis.detect_drop(head)
+                intro_end, outro_start = analysis.find_mix_points(ctx)
+            mix_points = MixPoints(
+                intro_end=intro_end,
+                outro_start=outro_start,
+                drop=analysis.format_time(drop_time) if drop_time else None,
+            )
+            cue_params = {
+                "mix_points": {"intro_end": intro_end, "outro_start": outro_start},
+                "drop_time": drop_time,
+            }
     except Exception as exc:
         logger.exception("High-level analysis failed for %s", filepath)
-        yield ErrorMessage(message=f"Analysis failed: {exc}").to_ndjson()
+        ANALYSES.inc(outcome="error")
+        if separation_future is not None:
+            separation_future.cancel()
+        yield ErrorMessage(message=f"Analysis failed: {exc}")
         return
 
-    mix_points_dict = {
-        "intro_end": intro_end,
-        "outro_start": outro_start,
-    }
-    mix_points = MixPoints(
-        intro_end=intro_end,
-        outro_start=outro_start,
-        drop=analysis.format_time(drop_time) if drop_time else None,
-    )
+    sections: List[Dict[str, object]] = []
+    if SECTIONS in plan:
+        with timer.stage(SECTIONS):
+            try:
+                sections = segmentation.detect_sections(ctx, bpm)
+            except Exception:
+                logger.exception("Section detection failed for %s", filepath)
+                timer.fail(SECTIONS)
 
-    cues: List[Dict[str, object]] = []
-    try:
-        if "vocals" in stems_dict:
-            y_voc, _ = librosa.load(stems_dict["vocals"], sr=sr)
-            cues = analysis.detect_cue_points(y_full, y_voc, sr, mix_points_dict, drop_time)
-        else:
-            y_harm, _ = librosa.effects.hpss(y_full)
-            cues = analysis.detect_cue_points(y_full, y_harm, sr, mix_points_dict, drop_time)
-    except Exception:
-        logger.exception("Cue detection failed for %s", filepath)
+    base_name = os.path.join(artifact_dir, os.path.splitext(filename)[0])
+    waveform: List[float] = []
+    peak_files: Dict[str, str] = {}
+    if WAVEFORM in plan:
+        with timer.stage(WAVEFORM):
+            waveform = generate_waveform(ctx.y)
+            try:
+                peak_files["main"] = os.path.basename(write_peaks(ctx.y, sr, f"{base_name}.peaks"))
+            except Exception:
+                logger.exception("Peak pyramid failed for %s", filepath)
+                timer.fail(WAVEFORM)
 
+    # Everything a deck needs to load the track; stems, cues and MIDI follow.
+    summary: Dict[str, object] = {"stages": plan, "stem_files": {"main": filename}}
+    if BPM in plan:
+        summary["bpm"] = int(round(bpm))
+    if KEY in plan:
+        summary.update(key=key_detail["camelot"], key_detail=key_detail)
+    if TEXTURE in plan:
+        summary.update(texture=texture, color=color, genre=f"{texture} {color}")
+    if MIX_POINTS in plan:
+        summary["mix_points"] = mix_points.to_dict()
+    if SECTIONS in plan:
+        summary["sections"] = sections
+    if WAVEFORM in plan:
+        summary.update(waveform=waveform, peak_files=dict(peak_files))
+    yield PartialMessage(stage="summary", data=summary)
+
+    stem_waveforms: Dict[str, List[float]] = {}
+    stem_files: Dict[str, str] = {"main": filename}
     midi_files: Dict[str, str] = {}
-    melodic_stems = ["piano", "guitar", "bass"]
-    for stem_name in melodic_stems:
-        stem_path = stems_dict.get(stem_name)
-        if stem_path and os.path.exists(stem_path):
+    cues: List[Dict[str, object]] = []
+    stem_loudness: Optional[Future] = None
+    if separation_future is not None:
+        yield ProgressMessage(message=f"Separating ({model_name})...", percent=30)
+        try:
+            with timer.stage(SEPARATION):
+                separation = wait_for_separation(separation_future, filepath)
+                stem_audio = separation.mono(sr)
+        except DemucsError as exc:
+            logger.exception("Demucs separation failed for %s", filepath)
+            ANALYSES.inc(outcome="error")
+            yield ErrorMessage(message=f"Stem separation failed: {exc}")
+            return
+
+        artifacts = {
+            f"{base_name}_{name}{stem_extension}": (audio, separation.samplerate)
+            for name, audio in separation.stems.items()
+        }
+        stems_dict: Dict[str, str] = {name: f"{base_name}_{name}{stem_extension}" for name in separation.stems}
+
+        if DRUM_SPLIT in plan and "drums" in stem_audio:
+            yield ProgressMessage(message="Splitting Drums (Kick/Hats)...", percent=70)
+            with timer.stage(DRUM_SPLIT):
+                drum_split = split_drums(stem_audio["drums"], sr)
+            if drum_split:
+                for name, audio in zip(("kick", "hats"), drum_split):
+                    path = f"{base_name}_{name}{stem_extension}"
+                    stem_audio[name] = audio
+                    artifacts[path] = (audio, sr)
+                    stems_dict[name] = path
+            else:
+                timer.fail(DRUM_SPLIT)
+
+        if STEMS in plan:
+            # One gain for every stored stem, so they keep their balance.
+            gain = headroom_gain((audio for audio, _ in artifacts.values()), FORMATS[stem_format])
+            if gain != 1.0:
+                logger.info("Scaling the stems of %s by %.2f dB to fit %s", filepath, 20 * np.log10(gain), stem_format)
+                artifacts = {path: (audio * gain, rate) for path, (audio, rate) in artifacts.items()}
+
+        if LOUDNESS in plan:
+            # Measured from what is stored, so it matches the delivered files.
+            stem_loudness = _background.submit(
+                _measure_stem_loudness, {name: artifacts[path] for name, path in stems_dict.items()}
+            )
+
+        # Everything downstream works on the in-memory arrays; the files are only
+        # needed by the time the client asks for them.
+        persisted = persist_audio(artifacts) if STEMS in plan else None
+        melodic_audio = {name: stem_audio[name] for name in MELODIC_STEMS if name in stem_audio}
+        transcription = (
+            get_transcription_engine().submit(melodic_audio, sr) if MIDI in plan and melodic_audio else None
+        )
+
+        # Without the stems stage only the vocal stem is processed, for its cues.
+        stem_names = [
+            stem_name
+            for stem_name in STEM_LABELS
+            if stem_name in stem_audio and (STEMS in plan or (stem_name == "vocals" and CUES in plan))
+        ]
+        if stem_names:
+            yield ProgressMessage(message="Generating Waveforms...", percent=80)
+        pool = get_stem_pool()
+        stem_futures = {
+            stem_name: pool.submit(
+                process_stem,
+                stem_name,
+                stem_audio[stem_name],
+                sr,
+                cue_params if stem_name == "vocals" and CUES in plan else None,
+                f"{base_name}_{stem_name}.peaks" if STEMS in plan else None,
+            )
+            for stem_name in stem_names
+        }
+
+        if CUES in plan and "vocals" not in stem_audio:
+            with timer.stage(CUES):
+                try:
+                    cues = analysis.detect_cue_points(ctx.harmonic, **cue_params)
+                except Exception:
+                    logger.exception("Cue detection failed for %s", filepath)
+                    timer.fail(CUES)
+            yield PartialMessage(stage="cues", data={"cues": cues})
+
+        # Stem tasks (waveform, peaks and, for vocals, cues) have been running in
+        # the pool since they were submitted; this is the time spent waiting on them.
+        stems_wall = stems_cpu = 0.0
+        for index, (stem_name, future) in enumerate(stem_futures.items()):
+            wall, cpu = time.perf_counter(), time.thread_time()
+            output = collect(future, stem_name)
+            stems_wall += time.perf_counter() - wall
+            stems_cpu += time.thread_time() - cpu
+            if output.errors:
+                logger.warning("Stem %s of %s had failures: %s", stem_name, filepath, "; ".join(output.errors))
+                timer.fail(STEMS)
+            if STEMS in plan:
+                label = STEM_LABELS[stem_name]
+                stem_waveforms[label] = output.waveform or [0.0] * 150
+                if output.peaks is not None:
+                    peak_files[label] = os.path.basename(output.peaks)
+                yield PartialMessage(
+                    stage="stem",
+                    data={"name": label, "waveform": stem_waveforms[label], "peaks": peak_files.get(label)},
+                )
+            if output.cues is not None:
+                cues = output.cues
+                yield PartialMessage(stage="cues", data={"cues": cues})
             yield ProgressMessage(
-                message=f"Transcribing MIDI: {stem_name.upper()}...", percent=90
-            ).to_ndjson()
+                message=f"Processed stem: {stem_name.upper()}",
+                percent=80 + (5 * (index + 1)) // len(stem_futures),
+            )
+        if stem_futures:
+            timer.record(STEMS if STEMS in plan else CUES, stems_wall, stems_cpu)
+
+        if persisted is not None:
+            with timer.stage("persist"):
+                try:
+                    written = persisted.result()
+                except Exception:
+                    logger.exception("Stem persistence failed for %s", filepath)
+                    timer.fail("persist")
+                    written = {}
+            stems_dict = {name: path for name, path in stems_dict.items() if path in written}
+            file_hashes.update((os.path.basename(path), written[path]) for path in stems_dict.values())
+            stem_files = _stem_files(filepath, stems_dict)
+            yield PartialMessage(stage="stem_files", data={"stem_files": stem_files})
+
+        if transcription is not None:
+            yield ProgressMessage(
+                message=f"Transcribing MIDI: {', '.join(name.upper() for name in melodic_audio)}...",
+                percent=90,
+            )
+            with timer.stage(MIDI):
+                try:
+                    transcriptions = transcription.result()
+                except Exception:
+                    logger.exception("MIDI transcription failed for %s", filepath)
+                    timer.fail(MIDI)
+                    transcriptions = {}
+                for stem_name, transcribed in transcriptions.items():
+                    # Keep the file name basic-pitch's predict_and_save used to produce.
+                    midi_path = f"{base_name}_{stem_name}_basic_pitch.mid"
+                    try:
+                        with open(midi_path, "wb") as handle:
+                            handle.write(transcribed.midi)
+                        midi_files[stem_name] = os.path.basename(midi_path)
+                        file_hashes[midi_files[stem_name]] = hashlib.sha256(transcribed.midi).hexdigest()[:DIGEST_LENGTH]
+                    except OSError:
+                        logger.exception("Failed to write MIDI file %s", midi_path)
+                        timer.fail(MIDI)
+            yield PartialMessage(stage="midi", data={"midi_files": midi_files})
+
+    meta = _collect_metadata(metadata, filename, timer)
+
+    loudness_detail: Optional[Dict[str, object]] = None
+    stems_loudness: Dict[str, Dict[str, float]] = {}
+    if mix_loudness is not None:
+        with timer.stage(LOUDNESS):
             try:
-                midi_path = generate_midi_from_audio(stem_path, os.path.dirname(filepath))
-                if midi_path:
-                    midi_files[stem_name] = os.path.basename(midi_path)
+                loudness_detail = mix_loudness.result().to_dict()
             except Exception:
-                logger.exception("MIDI transcription failed for %s", stem_path)
+                logger.exception("Loudness measurement failed for %s", filepath)
+                timer.fail(LOUDNESS)
+            if stem_loudness is not None:
+                try:
+                    stems_loudness = stem_loudness.result()
+                except Exception:
+                    logger.exception("Stem loudness measurement failed for %s", filepath)
+                    timer.fail(LOUDNESS)
+
+    try:
+        file_hashes[filename] = main_digest.result()
+    except OSError:
+        logger.exception("Hashing %s failed", filepath)
 
     result = AnalysisResult(
         bpm=int(round(bpm)),
-        key=key,
+        key=key_detail["camelot"] if key_detail else "",
         texture=texture,
         color=color,
-        loudness=-14.0,
+        loudness=loudness_detail["integrated_lufs"] if loudness_detail else None,
         mix_points=mix_points,
         waveform=waveform,
         stems=stem_waveforms,
-        stem_files={
-            "main": os.path.basename(filepath),
-            "vocal": os.path.basename(stems_dict.get("vocals", "")),
-            "bass": os.path.basename(stems_dict.get("bass", "")),
-            "kick": os.path.basename(stems_dict.get("kick", "")),
-            "hihats": os.path.basename(stems_dict.get("hats", "")),
-            "piano": os.path.basename(stems_dict.get("piano", "")),
-            "guitar": os.path.basename(stems_dict.get("guitar", "")),
-            "other": os.path.basename(stems_dict.get("other", "")),
-        },
+        stem_files=stem_files,
         midi_files=midi_files,
         cues=cues,
         meta=meta,
-        genre=f"{texture} {color}",
+        genre=f"{texture} {color}" if texture else "",
+        sections=sections,
+        loudness_detail=loudness_detail,
+        stem_loudness=stems_loudness,
+        peak_files=peak_files,
+        key_detail=key_detail,
+        stages=plan,
+        file_hashes=file_hashes,
     )
 
+    if cache is not None and cache_key is not None:
+        cache.put(cache_key, result)
+
+    # Timings describe this run, so they are attached after caching.
+    if include_timings:
+        result.timings = timer.to_dict()
+    ANALYSES.inc(outcome="complete")
+    yield complete_message(result)
+
+
+def analyze_mix(filepath: str, block_seconds: float = 10.0) -> Generator[Message, None, None]:
+    """
+    Streaming analysis for full-length tracks and DJ mixes.
+
+    The file is decoded block by block, so memory stays flat regardless of
+    length and the whole file (not just the first three minutes) is covered.
+    No stems are separated; the result carries tempo/key/energy curves instead.
+    """
+    logger.info("Starting streaming analysis for %s", filepath)
+    filename = os.path.basename(filepath)
+
+    try:
+        yield ProgressMessage(message="Opening audio stream...", percent=5)
+        reader = BlockReader(filepath, block_seconds=block_seconds)
+        analyzer = StreamingAnalyzer(reader.sr)
+        try:
+            meter = analysis.LoudnessMeter(reader.native_sr, channels=reader.channels)
+            native_metering = True
+        except ValueError as exc:
+            logger.warning("Metering the decoded mono signal of %s: %s", filepath, exc)
+            meter = analysis.LoudnessMeter(reader.sr, channels=1)
+            native_metering = False
+        peaks = PeakPyramidBuilder(reader.sr)
+        last_percent = 5
+        for native, block, position in reader.frames():
+            meter.process(native if native_metering else block)
+            analyzer.process(block)
+            peaks.process(block)
+            percent = 5 + int(90 * position / reader.duration) if reader.duration else 5
+            if percent >= last_percent + 5:
+                last_percent = percent
+                yield ProgressMessage(
+                    message=f"Analyzing mix... {analysis.format_time(position)}", percent=percent
+                )
+        summary = analyzer.finish()
+        loudness = meter.finish()
+    except Exception as exc:
+        logger.exception("Streaming analysis failed for %s", filepath)
+        yield ErrorMessage(message=f"Streaming analysis failed: {exc}")
+        return
+
+    peak_files: Dict[str, str] = {}
+    try:
+        peaks_path = f"{os.path.splitext(filepath)[0]}.peaks"
+        peak_files["main"] = os.path.basename(peaks.write(peaks_path))
+    except Exception:
+        logger.exception("Peak pyramid failed for %s", filepath)
+
+    mix_points_dict = {"intro_end": summary.intro_end, "outro_start": summary.outro_start}
+    result = AnalysisResult(
+        bpm=int(round(summary.bpm)),
+        key=summary.key,
+        texture=summary.texture,
+        color=summary.color,
+        loudness=loudness.integrated_lufs,
+        mix_points=MixPoints(
+            intro_end=summary.intro_end,
+            outro_start=summary.outro_start,
+            drop=analysis.format_time(summary.drop_time) if summary.drop_time else None,
+        ),
+        waveform=summary.waveform,
+        stems={},
+        stem_files={"main": filename},
+        midi_files={},
+        cues=analysis.mix_point_cues(mix_points_dict, summary.drop_time),
+        meta={"filename": filename},
+        genre=f"{summary.texture} {summary.color}",
+        sections=summary.sections,
+        curves=summary.curves,
+        loudness_detail=loudness.to_dict(),
+        peak_files=peak_files,
+        file_hashes={filename: file_digest(filepath)},
+    )
     yield complete_message(result)
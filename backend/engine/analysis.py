@@ -1,82 +1,417 @@
 import logging
-from typing import Dict, List, Optional, Tuple
+from dataclasses import asdict, dataclass, field
+from functools import cached_property
+from typing import Any, Dict, List, Optional, Tuple
 
 import librosa
 import numpy as np
+import soundfile as sf
+from scipy import signal
+
+from . import key, segmentation
+from .timefmt import format_time
 
 logger = logging.getLogger(__name__)
 
 
-def detect_bpm_and_key(y: np.ndarray, sr: int) -> Tuple[float, str]:
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-    tempo = librosa.beat.tempo(onset_envelope=onset_env, sr=sr)
-    bpm = float(tempo[0]) if tempo.size else 0.0
-    key = get_camelot_key(y, sr)
-    return bpm, key
+class FeatureContext:
+    """
+    Per-track front end shared by every analysis function.
+
+    Features are computed on first access and memoized, so a track is decoded
+    and transformed once no matter how many descriptors read from it. Frame
+    features are all derived from the same STFT and share its frame grid.
+    """
+
+    def __init__(
+        self,
+        y: Optional[np.ndarray] = None,
+        sr: int = 22050,
+        n_fft: int = 2048,
+        hop_length: int = 512,
+        stft: Optional[np.ndarray] = None,
+    ) -> None:
+        if y is None and stft is None:
+            raise ValueError("FeatureContext needs a signal or an STFT")
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self._heads: Dict[float, "FeatureContext"] = {}
+        if y is not None:
+            self.__dict__["y"] = y
+        if stft is not None:
+            self.__dict__["stft"] = stft
+
+    @classmethod
+    def from_file(cls, path: str, sr: int = 22050) -> "FeatureContext":
+        y, sr = librosa.load(path, sr=sr)
+        return cls(y, sr)
+
+    @cached_property
+    def y(self) -> np.ndarray:
+        return librosa.istft(self.stft, hop_length=self.hop_length, n_fft=self.n_fft)
+
+    @cached_property
+    def duration(self) -> float:
+        return len(self.y) / self.sr
+
+    @cached_property
+    def stft(self) -> np.ndarray:
+        return librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length)
+
+    @cached_property
+    def magnitude(self) -> np.ndarray:
+        return np.abs(self.stft)
+
+    @cached_property
+    def onset_env(self) -> np.ndarray:
+        mel = librosa.feature.melspectrogram(
+            S=self.magnitude**2, sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length
+        )
+        return librosa.onset.onset_strength(
+            S=librosa.power_to_db(mel), sr=self.sr, hop_length=self.hop_length
+        )
+
+    @cached_property
+    def rms(self) -> np.ndarray:
+        return librosa.feature.rms(
+            S=self.magnitude, frame_length=self.n_fft, hop_length=self.hop_length
+        )[0]
+
+    @cached_property
+    def spectral_centroid(self) -> np.ndarray:
+        return librosa.feature.spectral_centroid(
+            S=self.magnitude, sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length
+        )[0]
+
+    @cached_property
+    def chroma(self) -> np.ndarray:
+        return librosa.feature.chroma_cqt(y=self.y, sr=self.sr, hop_length=self.hop_length)
+
+    @cached_property
+    def chroma_stft(self) -> np.ndarray:
+        power = self.magnitude**2
+        # Tuning drifts slowly; every 8th frame estimates it for a fraction of the cost.
+        tuning = librosa.estimate_tuning(S=power[:, ::8], sr=self.sr, n_fft=self.n_fft)
+        return librosa.feature.chroma_stft(
+            S=power, sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length, tuning=tuning
+        )
+
+    @cached_property
+    def hpss(self) -> Tuple[np.ndarray, np.ndarray]:
+        return librosa.decompose.hpss(self.stft)
+
+    @cached_property
+    def harmonic(self) -> "FeatureContext":
+        return self._derived(self.hpss[0])
+
+    @cached_property
+    def percussive(self) -> "FeatureContext":
+        return self._derived(self.hpss[1])
+
+    def head(self, seconds: float) -> "FeatureContext":
+        """Return a context over the first ``seconds`` of the track, reusing this STFT."""
+        if seconds >= self.duration:
+            return self
+        if seconds not in self._heads:
+            n_samples = int(seconds * self.sr)
+            n_frames = 1 + n_samples // self.hop_length
+            child = FeatureContext(
+                self.y[:n_samples],
+                self.sr,
+                self.n_fft,
+                self.hop_length,
+                stft=self.stft[:, :n_frames],
+            )
+            if "hpss" in self.__dict__:
+                child.__dict__["hpss"] = tuple(S[:, :n_frames] for S in self.hpss)
+            self._heads[seconds] = child
+        return self._heads[seconds]
+
+    def frames_to_time(self, frames) -> np.ndarray:
+        return librosa.frames_to_time(frames, sr=self.sr, hop_length=self.hop_length)
+
+    def time_to_frames(self, seconds: float) -> int:
+        return int(seconds * self.sr) // self.hop_length
+
+    def _derived(self, stft: np.ndarray) -> "FeatureContext":
+        return FeatureContext(sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length, stft=stft)
+
+
+# BS.1770 K-weighting, parameterised so the biquads can be designed at any
+# sample rate (reproduces the ITU 48 kHz coefficients).
+_K_SHELF = {"gain_db": 3.999843853973347, "fc": 1681.974450955533, "q": 0.7071752369554196}
+_K_HIGHPASS = {"fc": 38.13547087602444, "q": 0.5003270373238773}
+# BS.1770 channel weights by channel count, in the WAVE default speaker
+# order: quad FL FR BL BR, 5.0 FL FR FC BL BR, 5.1 FL FR FC LFE BL BR. The
+# LFE is excluded and surrounds are weighted +1.5 dB. Other counts (e.g.
+# 3 channels, LCR or 2.1) are ambiguous without a channel mask.
+CHANNEL_WEIGHTS = {
+    1: (1.0,),
+    2: (1.0, 1.0),
+    4: (1.0, 1.0, 1.41, 1.41),
+    5: (1.0, 1.0, 1.0, 1.41, 1.41),
+    6: (1.0, 1.0, 1.0, 0.0, 1.41, 1.41),
+}
+_LUFS_OFFSET = -0.691
+_SILENCE_LUFS = -70.0
+
+
+@dataclass
+class LoudnessStats:
+    integrated_lufs: float
+    loudness_range_lu: float
+    true_peak_dbtp: float
+    sample_peak_dbfs: float
+    # 1 Hz curves: short-term (3 s window, first value ending at 3 s) and the
+    # loudest momentary (400 ms) block within each second
+    short_term_lufs: List[float] = field(default_factory=list)
+    momentary_max_lufs: List[float] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "integrated_lufs": self.integrated_lufs,
+            "loudness_range_lu": self.loudness_range_lu,
+            "true_peak_dbtp": self.true_peak_dbtp,
+            "sample_peak_dbfs": self.sample_peak_dbfs,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class LoudnessMeter:
+    """
+    Streaming ITU-R BS.1770-4 / EBU R128 meter.
+
+    Feed ``(samples, channels)`` blocks of any size to :meth:`process`; the
+    channel count must be one of :data:`CHANNEL_WEIGHTS`. Filter
+    state is carried across blocks, mean-square energy is kept per 100 ms
+    sub-block, and true peak is measured on a 4x polyphase-oversampled copy.
+    Memory grows by one float per 100 ms of audio.
+    """
+
+    OVERSAMPLE = 4
+    _TP_MARGIN = 32  # input samples of context kept either side of each oversampled chunk
+
+    def __init__(self, sr: int, channels: int = 2) -> None:
+        self.sr = sr
+        self.channels = channels
+        self._sos = _k_weighting_sos(sr)
+        self._zi = np.zeros((self._sos.shape[0], 2, channels))
+        if channels not in CHANNEL_WEIGHTS:
+            raise ValueError(f"No BS.1770 layout for {channels} channels; expected one of {sorted(CHANNEL_WEIGHTS)}")
+        self._weights = np.array(CHANNEL_WEIGHTS[channels])
+        self._step = int(round(0.1 * sr))
+        self._remainder = np.zeros((0, channels))
+        self._energies: List[float] = []
+        self._tp_carry = np.zeros((0, channels))
+        self._true_peak = 0.0
+        self._sample_peak = 0.0
+
+    def process(self, block: np.ndarray) -> None:
+        block = np.asarray(block, dtype=np.float64).reshape(len(block), -1)[:, : self.channels]
+        if len(block) == 0:
+            return
+        self._sample_peak = max(self._sample_peak, float(np.max(np.abs(block))))
+        self._update_true_peak(block)
+
+        weighted, self._zi = signal.sosfilt(self._sos, block, axis=0, zi=self._zi)
+        weighted = np.concatenate([self._remainder, weighted])
+        n_steps = len(weighted) // self._step
+        if n_steps:
+            squares = weighted[: n_steps * self._step] ** 2
+            per_step = squares.reshape(n_steps, self._step, self.channels).mean(axis=1)
+            self._energies.extend((per_step @ self._weights).tolist())
+        self._remainder = weighted[n_steps * self._step :]
+
+    def finish(self) -> LoudnessStats:
+        if len(self._tp_carry):
+            self._update_true_peak(np.zeros((self._TP_MARGIN, self.channels)), final=True)
+
+        z = np.asarray(self._energies)
+        momentary = _sliding_mean(z, 4)
+        short_term = _sliding_mean(z, 30)
+        integrated = _gated_loudness(momentary)
+        return LoudnessStats(
+            integrated_lufs=integrated,
+            loudness_range_lu=_loudness_range(short_term),
+            true_peak_dbtp=_to_db(self._true_peak),
+            sample_peak_dbfs=_to_db(self._sample_peak),
+            short_term_lufs=_floor_lufs(_energy_to_lufs(short_term[::10])),
+            momentary_max_lufs=_floor_lufs(_per_second_max(_energy_to_lufs(momentary))),
+        )
+
+    def _update_true_peak(self, block: np.ndarray, final: bool = False) -> None:
+        margin = self._TP_MARGIN
+        buffer = np.concatenate([self._tp_carry, block])
+        if len(buffer) <= 2 * margin and not final:
+            self._tp_carry = buffer
+            return
+        upsampled = signal.resample_poly(buffer, self.OVERSAMPLE, 1, axis=0)
+        start = margin if len(self._tp_carry) else 0
+        end = len(buffer) if final else len(buffer) - margin
+        valid = upsampled[start * self.OVERSAMPLE : end * self.OVERSAMPLE]
+        if valid.size:
+            self._true_peak = max(self._true_peak, float(np.max(np.abs(valid))))
+        self._tp_carry = buffer[len(buffer) - 2 * margin :] if not final else np.zeros((0, self.channels))
+
+
+def measure_loudness(y: np.ndarray, sr: int) -> LoudnessStats:
+    """Loudness of an in-memory signal, ``(samples,)`` or ``(channels, samples)``."""
+    frames = y.T if y.ndim == 2 else y[:, np.newaxis]
+    meter = LoudnessMeter(sr, channels=frames.shape[1])
+    meter.process(frames)
+    return meter.finish()
+
+
+def measure_loudness_file(path: str, block_seconds: float = 10.0) -> LoudnessStats:
+    """Loudness of a file at its native rate and channel layout, in one streaming pass."""
+    info = sf.info(path)
+    meter = LoudnessMeter(info.samplerate, channels=info.channels)
+    for block in sf.blocks(path, blocksize=int(block_seconds * info.samplerate), dtype="float32", always_2d=True):
+        meter.process(block)
+    return meter.finish()
+
+
+def _k_weighting_sos(sr: int) -> np.ndarray:
+    """Pre-filter (high shelf) and RLB high-pass as second-order sections at ``sr``."""
+    K = np.tan(np.pi * _K_SHELF["fc"] / sr)
+    Q = _K_SHELF["q"]
+    Vh = 10 ** (_K_SHELF["gain_db"] / 20.0)
+    Vb = Vh**0.4996667741545416
+    a0 = 1.0 + K / Q + K * K
+    shelf = [
+        (Vh + Vb * K / Q + K * K) / a0,
+        2.0 * (K * K - Vh) / a0,
+        (Vh - Vb * K / Q + K * K) / a0,
+        1.0,
+        2.0 * (K * K - 1.0) / a0,
+        (1.0 - K / Q + K * K) / a0,
+    ]
+
+    K = np.tan(np.pi * _K_HIGHPASS["fc"] / sr)
+    Q = _K_HIGHPASS["q"]
+    a0 = 1.0 + K / Q + K * K
+    highpass = [1.0, -2.0, 1.0, 1.0, 2.0 * (K * K - 1.0) / a0, (1.0 - K / Q + K * K) / a0]
+    return np.array([shelf, highpass])
+
+
+def _sliding_mean(z: np.ndarray, width: int) -> np.ndarray:
+    if len(z) < width:
+        return np.zeros(0)
+    cumulative = np.concatenate([[0.0], np.cumsum(z)])
+    return (cumulative[width:] - cumulative[:-width]) / width
+
+
+def _energy_to_lufs(energy: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore"):
+        return _LUFS_OFFSET + 10 * np.log10(energy)
+
+
+def _gated_loudness(blocks: np.ndarray) -> float:
+    loudness = _energy_to_lufs(blocks)
+    gated = blocks[loudness > -70.0]
+    if gated.size == 0:
+        return _SILENCE_LUFS
+    relative_gate = _energy_to_lufs(np.mean(gated)) - 10.0
+    gated = blocks[(loudness > -70.0) & (loudness > relative_gate)]
+    return round(float(_energy_to_lufs(np.mean(gated))), 2)
+
+
+def _loudness_range(short_term: np.ndarray) -> float:
+    loudness = _energy_to_lufs(short_term)
+    gated = short_term[loudness > -70.0]
+    if gated.size == 0:
+        return 0.0
+    relative_gate = _energy_to_lufs(np.mean(gated)) - 20.0
+    kept = loudness[(loudness > -70.0) & (loudness > relative_gate)]
+    if kept.size == 0:
+        return 0.0
+    low, high = np.percentile(kept, [10, 95])
+    return round(float(high - low), 2)
+
+
+def _per_second_max(values: np.ndarray) -> np.ndarray:
+    n_seconds = len(values) // 10
+    return values[: n_seconds * 10].reshape(n_seconds, 10).max(axis=1)
+
+
+def _floor_lufs(values: np.ndarray) -> List[float]:
+    return [round(float(v), 2) for v in np.maximum(values, _SILENCE_LUFS)]
+
+
+def _to_db(peak: float) -> float:
+    return round(float(20 * np.log10(peak)), 2) if peak > 0 else _SILENCE_LUFS
+
+
+def detect_bpm(ctx: FeatureContext) -> float:
+    tempo = librosa.feature.tempo(onset_envelope=ctx.onset_env, sr=ctx.sr, hop_length=ctx.hop_length)
+    return float(tempo[0]) if tempo.size else 0.0
+
+
+def detect_bpm_and_key(ctx: FeatureContext, key_mode: str = key.FAST) -> Tuple[float, key.KeyEstimate]:
+    bpm = detect_bpm(ctx)
+    return bpm, key.detect_key(ctx, key_mode, bpm)
+
+
+def analyze_texture_and_color(ctx: FeatureContext) -> Tuple[str, str]:
+    window = ctx.head(30)
+    harm_energy = np.mean(window.harmonic.rms)
+    perc_energy = np.mean(window.percussive.rms)
 
+    avg_cent = np.mean(window.spectral_centroid)
+    return classify_texture(harm_energy, perc_energy), classify_color(avg_cent)
 
-def analyze_texture_and_color(y: np.ndarray, sr: int) -> Tuple[str, str]:
-    y_slice = y[: sr * 30]
-    y_harm, y_perc = librosa.effects.hpss(y_slice)
-    harm_energy = np.mean(librosa.feature.rms(y=y_harm))
-    perc_energy = np.mean(librosa.feature.rms(y=y_perc))
 
+def classify_texture(harm_energy: float, perc_energy: float) -> str:
     if perc_energy > harm_energy * 1.5:
-        texture = "Rhythmic"
-    elif harm_energy > perc_energy * 1.2:
-        texture = "Melodic"
-    else:
-        texture = "Balanced"
+        return "Rhythmic"
+    if harm_energy > perc_energy * 1.2:
+        return "Melodic"
+    return "Balanced"
 
-    cent = librosa.feature.spectral_centroid(y=y_slice, sr=sr)
-    avg_cent = np.mean(cent)
 
+def classify_color(avg_cent: float) -> str:
     if avg_cent < 1500:
-        color = "Deep"
-    elif avg_cent < 2500:
-        color = "Warm"
-    elif avg_cent < 3500:
-        color = "Crisp"
-    else:
-        color = "Bright"
+        return "Deep"
+    if avg_cent < 2500:
+        return "Warm"
+    if avg_cent < 3500:
+        return "Crisp"
+    return "Bright"
 
-    return texture, color
 
+def detect_drop(ctx: FeatureContext) -> Optional[float]:
+    onset_env = ctx.onset_env
+    rms = librosa.util.fix_length(ctx.rms, size=len(onset_env))
+    return drop_from_energy(onset_env * rms, ctx.sr / ctx.hop_length)
 
-def detect_drop(y: np.ndarray, sr: int) -> Optional[float]:
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-    rms = librosa.feature.rms(y=y)[0]
-    rms = librosa.util.fix_length(rms, size=len(onset_env))
-    energy = onset_env * rms
 
-    window_size = int(sr * 2.0 / 512)
+def drop_from_energy(energy: np.ndarray, frame_rate: float) -> Optional[float]:
+    """Time of the strongest sustained energy peak after the first 30 seconds."""
+    window_size = max(1, int(2.0 * frame_rate))
     energy_smooth = np.convolve(energy, np.ones(window_size) / window_size, mode="same")
 
-    skip_samples = int(30 * sr / 512)  # Skip first 30s (intro)
+    skip_samples = int(30 * frame_rate)  # Skip first 30s (intro)
     if len(energy_smooth) <= skip_samples:
         return None
 
     valid_section = energy_smooth[skip_samples:]
     max_idx = int(np.argmax(valid_section)) + skip_samples
-    times = librosa.times_like(onset_env, sr=sr)
-    return float(times[max_idx])
+    return float(max_idx / frame_rate)
 
 
 def detect_cue_points(
-    y: np.ndarray,
-    y_harm: np.ndarray,
-    sr: int,
+    harm: FeatureContext,
     mix_points: Optional[Dict[str, str]] = None,
     drop_time: Optional[float] = None,
 ) -> List[Dict[str, object]]:
+    """Find vocal ranges in ``harm`` (a vocal stem or harmonic component) plus mix cues."""
     cues: List[Dict[str, object]] = []
 
-    rms_harm = librosa.feature.rms(
-        y=y_harm, frame_length=2048, hop_length=512
-    )[0]
-    cent = librosa.feature.spectral_centroid(
-        y=y_harm, sr=sr, n_fft=2048, hop_length=512
-    )[0]
+    rms_harm = harm.rms
+    cent = harm.spectral_centroid
 
     if np.max(rms_harm) > 0:
         rms_norm = (rms_harm - np.min(rms_harm)) / (np.max(rms_harm) - np.min(rms_harm))
@@ -86,47 +421,53 @@ def detect_cue_points(
     vocal_freq_weight = np.exp(-((cent - 1500) ** 2) / (2 * 1000**2))
     vocal_activity = rms_norm * vocal_freq_weight
 
-    window_size = int(sr * 2.0 / 512)
+    window_size = harm.time_to_frames(2.0)
     vocal_smooth = np.convolve(
         vocal_activity, np.ones(window_size) / window_size, mode="same"
     )
 
     is_vocal = vocal_smooth > 0.25
-    times = librosa.times_like(vocal_activity, sr=sr)
+    times = harm.frames_to_time(np.arange(len(vocal_activity) + 1))
 
     all_vocal_energy = vocal_smooth[is_vocal]
     avg_vocal_energy = float(np.mean(all_vocal_energy)) if len(all_vocal_energy) > 0 else 0
 
-    current_start: Optional[float] = None
-    for i, active in enumerate(is_vocal):
-        if active and current_start is None:
-            current_start = float(times[i])
-        elif not active and current_start is not None:
-            duration = float(times[i] - current_start)
-            if duration > 4.0:
-                section_energy = float(
-                    np.mean(vocal_smooth[int(current_start * sr / 512) : int(times[i] * sr / 512)])
-                )
-                label = "VOCAL VERSE"
-                if section_energy > avg_vocal_energy * 1.2:
-                    label = "VOCAL CHORUS"
-                elif section_energy < avg_vocal_energy * 0.8:
-                    label = "VOCAL AD-LIB/BRIDGE"
-
-                cues.append(
-                    {
-                        "id": f"vocal_{len(cues)}",
-                        "label": label,
-                        "time": format_time(current_start),
-                        "startTime": current_start,
-                        "endTime": float(times[i]),
-                        "duration": round(duration, 1),
-                        "type": "range",
-                        "color": "#3b82f6" if "CHORUS" not in label else "#8b5cf6",
-                    }
-                )
-            current_start = None
+    starts, ends = segmentation.runs(is_vocal)
+    durations = times[ends] - times[starts]
+    long_enough = durations > 4.0
+    starts, ends, durations = starts[long_enough], ends[long_enough], durations[long_enough]
+    section_energy = segmentation.segment_means(vocal_smooth, starts, ends)
+    labels = np.where(
+        section_energy > avg_vocal_energy * 1.2,
+        "VOCAL CHORUS",
+        np.where(section_energy < avg_vocal_energy * 0.8, "VOCAL AD-LIB/BRIDGE", "VOCAL VERSE"),
+    )
+
+    for index, (start, end, duration, label) in enumerate(zip(starts, ends, durations, labels)):
+        start_time = float(times[start])
+        cues.append(
+            {
+                "id": f"vocal_{index}",
+                "label": str(label),
+                "time": format_time(start_time),
+                "startTime": start_time,
+                "endTime": float(times[end]),
+                "duration": round(float(duration), 1),
+                "type": "range",
+                "color": "#8b5cf6" if label == "VOCAL CHORUS" else "#3b82f6",
+            }
+        )
+
+    cues.extend(mix_point_cues(mix_points, drop_time))
+    cues.sort(key=lambda x: x["startTime"])
+    return cues
+
 
+def mix_point_cues(
+    mix_points: Optional[Dict[str, str]] = None,
+    drop_time: Optional[float] = None,
+) -> List[Dict[str, object]]:
+    cues: List[Dict[str, object]] = []
     if mix_points:
         if mix_points.get("intro_end") and mix_points["intro_end"] != "00:00":
             cues.append(
@@ -167,84 +508,42 @@ def detect_cue_points(
     return cues
 
 
-def find_mix_points(y: np.ndarray, sr: int, duration_sec: float) -> Tuple[str, str]:
+def find_mix_points(ctx: FeatureContext) -> Tuple[str, str]:
+    return mix_points_from_rms(ctx.rms, ctx.sr / ctx.hop_length, ctx.duration)
+
+
+def mix_points_from_rms(rms: np.ndarray, frame_rate: float, duration_sec: float) -> Tuple[str, str]:
+    """Intro end / outro start from an RMS envelope sampled at ``frame_rate`` Hz."""
     intro_end = "00:00"
     outro_start = "00:00"
 
     intro_dur = min(45, duration_sec / 4)
-    y_intro = y[: int(intro_dur * sr)]
-    rms_intro = librosa.feature.rms(y=y_intro)[0]
+    rms_intro = rms[: 1 + int(intro_dur * frame_rate)]
     if len(rms_intro) > 0:
-        times = librosa.times_like(rms_intro, sr=sr)
         threshold = float(np.max(rms_intro) * 0.6)
         jump_idx = np.where(rms_intro > threshold)[0]
         if len(jump_idx) > 0:
-            intro_end = format_time(float(times[jump_idx[0]]))
+            intro_end = format_time(float(jump_idx[0] / frame_rate))
 
     outro_dur = min(45, duration_sec / 4)
-    y_outro = y[-int(outro_dur * sr) :]
-    rms_outro = librosa.feature.rms(y=y_outro)[0]
+    outro_offset = int((duration_sec - outro_dur) * frame_rate)
+    rms_outro = rms[outro_offset:]
     if len(rms_outro) > 0:
-        times_outro = librosa.times_like(rms_outro, sr=sr)
         threshold_out = float(np.max(rms_outro) * 0.4)
         loud_idx = np.where(rms_outro > threshold_out)[0]
         if len(loud_idx) > 0:
-            last_loud = int(loud_idx[-1])
-            start_offset = duration_sec - outro_dur
-            abs_time = start_offset + float(times_outro[last_loud])
-            outro_start = format_time(abs_time)
+            last_loud = outro_offset + int(loud_idx[-1])
+            outro_start = format_time(float(last_loud / frame_rate))
 
     return intro_end, outro_start
 
 
-def get_camelot_key(y: np.ndarray, sr: int) -> str:
-    came_lot_map = {
-        "C": "8B",
-        "Am": "8A",
-        "G": "9B",
-        "Em": "9A",
-        "D": "10B",
-        "Bm": "10A",
-        "A": "11B",
-        "F#m": "11A",
-        "E": "12B",
-        "C#m": "12A",
-        "B": "1B",
-        "G#m": "1A",
-        "F#": "2B",
-        "D#m": "2A",
-        "Gb": "2B",
-        "Ebm": "2A",
-        "Db": "3B",
-        "Bbm": "3A",
-        "C#": "3B",
-        "A#m": "3A",
-        "Ab": "4B",
-        "Fm": "4A",
-        "G#": "4B",
-        "Eb": "5B",
-        "Cm": "5A",
-        "D#": "5B",
-        "Bb": "6B",
-        "Gm": "6A",
-        "A#": "6B",
-        "F": "7B",
-        "Dm": "7A",
-    }
-
-    chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-    chroma_avg = np.mean(chroma, axis=1)
-    maj_template = [1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1]
-    min_template = [1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0]
-    maj_corrs = [np.corrcoef(chroma_avg, np.roll(maj_template, i))[0, 1] for i in range(12)]
-    min_corrs = [np.corrcoef(chroma_avg, np.roll(min_template, i))[0, 1] for i in range(12)]
-    notes = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
-    if np.max(maj_corrs) > np.max(min_corrs):
-        root = notes[int(np.argmax(maj_corrs))]
-        return came_lot_map.get(root, root)
-
-    root = notes[int(np.argmax(min_corrs))]
-    return came_lot_map.get(f"{root}m", f"{root}m")
+def get_camelot_key(ctx: FeatureContext, mode: str = key.FAST) -> str:
+    return key.detect_key(ctx, mode).camelot
+
+
+def key_from_chroma(chroma_avg: np.ndarray) -> str:
+    return key.estimate_key(chroma_avg).camelot
 
 
 def time_to_seconds_raw(t_str: str) -> int:
@@ -252,20 +551,14 @@ def time_to_seconds_raw(t_str: str) -> int:
     return minutes * 60 + seconds
 
 
-def format_time(seconds: float) -> str:
-    return f"{int(seconds // 60):02d}:{int(seconds % 60):02d}"
-
-
-def detect_danceability(y: np.ndarray, sr: int, bpm: float) -> int:
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-    pulse = librosa.beat.plp(onset_envelope=onset_env, sr=sr)
+def detect_danceability(ctx: FeatureContext, bpm: float) -> int:
+    pulse = librosa.beat.plp(onset_envelope=ctx.onset_env, sr=ctx.sr, hop_length=ctx.hop_length)
     beat_strength = np.mean(pulse)
     return min(100, int(beat_strength * 100 * 1.5))
 
 
-def analyze_spectral_contrast(y: np.ndarray, sr: int) -> str:
-    S = np.abs(librosa.stft(y))
-    contrast = librosa.feature.spectral_contrast(S=S, sr=sr)
+def analyze_spectral_contrast(ctx: FeatureContext) -> str:
+    contrast = librosa.feature.spectral_contrast(S=ctx.magnitude, sr=ctx.sr, n_fft=ctx.n_fft)
     mean_contrast = np.mean(contrast)
 
     if mean_contrast < 15:
@@ -277,7 +570,8 @@ def analyze_spectral_contrast(y: np.ndarray, sr: int) -> str:
     return "High Definition"
 
 
-def calculate_dynamic_range(y: np.ndarray) -> float:
+def calculate_dynamic_range(ctx: FeatureContext) -> float:
+    y = ctx.y
     rms = float(np.sqrt(np.mean(y**2)))
     peak = float(np.max(np.abs(y)))
     if rms == 0:
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from .types import AnalysisResult
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a change to the engine alters the contents of AnalysisResult,
+# so stale cache entries are never served for the new output.
+ENGINE_VERSION = "7"
+
+
+class ResultCache:
+    """
+    Persistent, size-bounded store of analysis results keyed by file content.
+
+    Entries are JSON files named after the content key. The least recently
+    used entries are evicted once the directory grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        Path(directory).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_digest: str, sr: int, model_name: str, variant: str = "") -> str:
+        """
+        Hash the file's content digest together with everything that shapes the result.
+
+        Keying on the file rather than the decoded samples gives an upload
+        decoded while it arrived the same key as the same file loaded
+        normally, whose resampled samples can differ in the last bits.
+        ``variant`` carries any further analysis options (such as the key mode).
+        """
+        digest = hashlib.sha256()
+        digest.update(f"{content_digest}|{sr}|{model_name}|{ENGINE_VERSION}|{variant}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str, artifact_dir: str) -> Optional[AnalysisResult]:
+        """
+        Return the cached result for ``key`` if its stem/MIDI/peak files still exist.
+
+        Args:
+            key: Content key produced by :meth:`make_key`.
+            artifact_dir: Directory the referenced artifact files live in.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                result = AnalysisResult.from_dict(json.load(handle))
+        except FileNotFoundError:
+            return self._miss()
+        except (OSError, ValueError, TypeError, KeyError) as exc:
+            logger.warning("Discarding unreadable cache entry %s: %s", path, exc)
+            self._discard(path)
+            return self._miss()
+
+        if not _artifacts_present(result, artifact_dir):
+            logger.info("Cache entry %s references missing artifacts, discarding", key)
+            self._discard(path)
+            return self._miss()
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def put(self, key: str, result: AnalysisResult) -> None:
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(result.to_dict(), handle)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.exception("Failed to write cache entry %s", path)
+            self._discard(tmp_path)
+            return
+        self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        entries = list(self._entries())
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes,
+            }
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                self._discard(path)
+                total -= size
+                self.evictions += 1
+
+    def _entries(self) -> Iterable[tuple]:
+        try:
+            with os.scandir(self.directory) as scan:
+                for entry in scan:
+                    if not entry.name.endswith(".json"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, stat.st_size, stat.st_mtime
+        except FileNotFoundError:
+            return
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+        return None
+
+    @staticmethod
+    def _discard(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _artifacts_present(result: AnalysisResult, artifact_dir: str) -> bool:
+    names = [name for role, name in result.stem_files.items() if role != "main"]
+    names.extend(result.midi_files.values())
+    names.extend(result.peak_files.values())
+    return all(os.path.exists(os.path.join(artifact_dir, name)) for name in names if name)
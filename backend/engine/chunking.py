@@ -0,0 +1,160 @@
+"""
+Chunked, multi-process Demucs separation for CPU-only hosts.
+
+The normalized mix is cut into overlapping chunks that are separated in
+parallel by a pool of worker processes, each pinned to a fixed number of
+torch threads so that ``workers * threads_per_worker`` bounds the cores used.
+The separated chunks are joined with linear crossfades over the overlaps,
+whose weights sum to one, so that away from the model's own edge effects the
+result matches a single-shot separation.
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Models loaded in this worker process, by name
+_worker_models: Dict[str, object] = {}
+
+
+@dataclass
+class ChunkSettings:
+    chunk_seconds: float = 30.0
+    overlap_seconds: float = 2.0
+    workers: int = 2
+    threads_per_worker: int = 2
+
+
+def plan_chunks(n_samples: int, chunk_samples: int, overlap_samples: int) -> List[Tuple[int, int]]:
+    """``(start, end)`` sample spans of width ``chunk_samples`` overlapping by ``overlap_samples``."""
+    if n_samples <= chunk_samples:
+        return [(0, n_samples)]
+    overlap_samples = min(overlap_samples, chunk_samples // 2)
+    step = chunk_samples - overlap_samples
+    starts = list(range(0, n_samples - overlap_samples, step))
+    spans = [(start, min(start + chunk_samples, n_samples)) for start in starts]
+    # Fold a short last chunk into the one before it so every chunk has context.
+    if len(spans) > 1 and spans[-1][1] - spans[-1][0] < chunk_samples // 2:
+        spans.pop()
+        spans[-1] = (spans[-1][0], n_samples)
+    return spans
+
+
+def crossfade_weights(spans: List[Tuple[int, int]]) -> List[np.ndarray]:
+    """Per-chunk weights: linear ramps across each overlap with the neighbouring chunk, 1 elsewhere."""
+    weights = []
+    for index, (start, end) in enumerate(spans):
+        weight = np.ones(end - start, dtype=np.float32)
+        if index > 0:
+            fade_in = spans[index - 1][1] - start
+            if fade_in > 0:
+                weight[:fade_in] = (np.arange(fade_in) + 0.5) / fade_in
+        if index < len(spans) - 1:
+            fade_out = end - spans[index + 1][0]
+            if fade_out > 0:
+                weight[-fade_out:] = (np.arange(fade_out)[::-1] + 0.5) / fade_out
+        weights.append(weight)
+    return weights
+
+
+def overlap_add(chunks: List[np.ndarray], spans: List[Tuple[int, int]], n_samples: int) -> np.ndarray:
+    """Crossfade ``(..., chunk_length)`` chunks laid out at ``spans`` into one ``(..., n_samples)`` array."""
+    out = np.zeros(chunks[0].shape[:-1] + (n_samples,), dtype=np.float32)
+    for chunk, (start, end), weight in zip(chunks, spans, crossfade_weights(spans)):
+        out[..., start:end] += chunk[..., : end - start] * weight
+    return out
+
+
+def _init_worker(threads: int) -> None:
+    import torch
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+
+def _separate_chunk(model_name: str, chunk: np.ndarray) -> np.ndarray:
+    """Separate one normalized ``(channels, samples)`` chunk into ``(sources, channels, samples)``."""
+    import torch
+    from demucs.apply import apply_model
+    from demucs.pretrained import get_model
+
+    model = _worker_models.get(model_name)
+    if model is None:
+        model = get_model(model_name)
+        model.eval()
+        _worker_models[model_name] = model
+    with torch.no_grad():
+        sources = apply_model(
+            model, torch.from_numpy(chunk)[None], device="cpu", split=True, overlap=0.25, progress=False
+        )
+    return sources[0].numpy()
+
+
+class ChunkedSeparator:
+    """Process pool that separates one track at a time, chunk by chunk."""
+
+    def __init__(self, settings: Optional[ChunkSettings] = None) -> None:
+        self.settings = settings or ChunkSettings()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn, as for the stem pool: children must not inherit torch state
+                self._pool = ProcessPoolExecutor(
+                    max_workers=max(1, self.settings.workers),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(max(1, self.settings.threads_per_worker),),
+                )
+            return self._pool
+
+    def separate(
+        self, model_name: str, mix: np.ndarray, samplerate: int, abandoned: Callable[[], bool] = lambda: False
+    ) -> np.ndarray:
+        """
+        Separate a normalized ``(channels, samples)`` mix.
+
+        Returns ``(sources, channels, samples)`` in the model's source order.
+        ``abandoned`` is checked before waiting on each chunk; once it returns
+        True the chunks not yet started are cancelled and CancelledError is
+        raised.
+        """
+        n_samples = mix.shape[-1]
+        spans = plan_chunks(
+            n_samples,
+            max(1, int(self.settings.chunk_seconds * samplerate)),
+            int(self.settings.overlap_seconds * samplerate),
+        )
+        logger.info(
+            "Separating %d chunk(s) with %s on %d worker(s) x %d thread(s)",
+            len(spans), model_name, self.settings.workers, self.settings.threads_per_worker,
+        )
+        pool = self._get_pool()
+        futures = [
+            pool.submit(_separate_chunk, model_name, np.ascontiguousarray(mix[:, start:end], dtype=np.float32))
+            for start, end in spans
+        ]
+        chunks = []
+        for future in futures:
+            if abandoned():
+                for pending in futures:
+                    pending.cancel()
+                raise CancelledError()
+            chunks.append(future.result())
+        return overlap_add(chunks, spans, n_samples)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
@@ -0,0 +1,147 @@
+"""
+Decoded-PCM cache for the analysis load.
+
+Decoding a compressed upload and resampling it to the analysis rate costs
+more than most analysis stages, and re-analyses of the same file repeat it.
+The mono float32 signal is therefore kept as a ``.npy`` file next to the
+source, named after the file's content hash, the rate and the resampler
+tier, and later loads memory-map it instead of decoding again.
+
+Tiers trade resampling quality for speed; ``"high"`` is what
+``librosa.load`` uses by default.
+"""
+
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import librosa
+import numpy as np
+
+from .persistence import file_digest
+
+logger = logging.getLogger(__name__)
+
+# Tier -> soxr quality recipe
+RESAMPLER_TIERS: Dict[str, str] = {
+    "best": "VHQ",
+    "high": "HQ",
+    "medium": "MQ",
+    "fast": "LQ",
+}
+# Hex digits of the content hash in cache file names
+CACHE_DIGEST_LENGTH = 16
+# Cache files share this many locks, so the lock table stays a fixed size
+LOCK_STRIPES = 64
+
+
+@dataclass
+class DecodeSettings:
+    cache: bool = True
+    tier: str = "high"
+    # Called with the path of each new cache file, e.g. to index it for eviction
+    on_write: Optional[Callable[[str], None]] = None
+
+
+_settings = DecodeSettings()
+_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def configure_decoding(**options) -> DecodeSettings:
+    """Replace the shared settings, e.g. to pick a resampler tier or turn the cache off."""
+    global _settings
+    settings = DecodeSettings(**options)
+    if settings.tier not in RESAMPLER_TIERS:
+        raise ValueError(f"Unknown resampler tier {settings.tier!r}; expected one of {sorted(RESAMPLER_TIERS)}")
+    _settings = settings
+    return settings
+
+
+def get_settings() -> DecodeSettings:
+    return _settings
+
+
+def cache_path(path: str, sr: int, tier: Optional[str] = None, digest: Optional[str] = None) -> str:
+    """Where the decode of ``path`` at ``sr`` with ``tier`` is kept."""
+    digest = digest or file_digest(path)
+    tier = tier or _settings.tier
+    return f"{os.path.splitext(path)[0]}.{digest[:CACHE_DIGEST_LENGTH]}.{sr}.{tier}.npy"
+
+
+def load_mono(path: str, sr: int = 22050) -> np.ndarray:
+    """
+    Mono float32 signal of ``path`` at ``sr``, from the cache when possible.
+
+    A cached signal comes back as a read-only memory map. A miss decodes
+    the file, writes the cache file and maps that. Concurrent loads of the
+    same file wait for the first one instead of decoding twice.
+    """
+    settings = _settings
+    if not settings.cache:
+        return _decode(path, sr, settings.tier)
+
+    target = cache_path(path, sr, settings.tier)
+    with _lock_for(target):
+        cached = _open(target)
+        if cached is not None:
+            return cached
+        y = _decode(path, sr, settings.tier)
+        try:
+            _write(target, y)
+        except OSError:
+            logger.warning("Could not cache the decode of %s", path, exc_info=True)
+            return y
+        logger.info("Cached %.1fs decode of %s at %d Hz", len(y) / sr, os.path.basename(path), sr)
+        return _open(target) if os.path.exists(target) else y
+
+
+def store_mono(path: str, y: np.ndarray, sr: int) -> None:
+    """Cache a signal decoded elsewhere (e.g. during the upload) with the current tier."""
+    if not _settings.cache:
+        return
+    target = cache_path(path, sr, _settings.tier)
+    with _lock_for(target):
+        if not os.path.exists(target):
+            _write(target, y)
+
+
+def _lock_for(target: str) -> threading.Lock:
+    return _locks[hash(target) % LOCK_STRIPES]
+
+
+def _decode(path: str, sr: int, tier: str) -> np.ndarray:
+    res_type = f"soxr_{RESAMPLER_TIERS[tier].lower()}"
+    y, _ = librosa.load(path, sr=sr, res_type=res_type)
+    return y
+
+
+def _open(target: str) -> Optional[np.ndarray]:
+    try:
+        return np.asarray(np.load(target, mmap_mode="r"))
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.warning("Discarding unreadable decode cache %s", target)
+        os.remove(target)
+        return None
+
+
+def _write(target: str, y: np.ndarray) -> None:
+    partial = f"{target}.part"
+    try:
+        with open(partial, "wb") as handle:
+            np.save(handle, np.asarray(y, dtype=np.float32))
+        os.replace(partial, target)
+    except Exception:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        raise
+    if _settings.on_write is not None:
+        try:
+            _settings.on_write(target)
+        except Exception:
+            logger.warning("on_write hook failed for %s", target, exc_info=True)
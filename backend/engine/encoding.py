@@ -0,0 +1,136 @@
+"""
+Audio encodings for stored stems and on-the-fly delivery.
+
+Stems are stored as FLAC (24-bit, lossless for playback purposes) by default
+or as Opus for previews. Any stored file can also be re-encoded on request;
+encodes are written next to their source and reused while the source is
+unchanged.
+"""
+
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import soundfile as sf
+from scipy import signal
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    extension: str
+    container: str
+    subtype: str
+    mimetype: str
+
+
+FORMATS: Dict[str, AudioFormat] = {
+    "flac": AudioFormat(".flac", "FLAC", "PCM_24", "audio/flac"),
+    "opus": AudioFormat(".opus", "OGG", "OPUS", "audio/ogg"),
+    "wav": AudioFormat(".wav", "WAV", "FLOAT", "audio/wav"),
+}
+# Rates libopus accepts; anything else is resampled to 48 kHz
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# Encode targets share this many locks, so the lock table stays a fixed size
+LOCK_STRIPES = 64
+
+_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def format_for_path(path: str) -> AudioFormat:
+    extension = os.path.splitext(path)[1].lower()
+    for audio_format in FORMATS.values():
+        if audio_format.extension == extension:
+            return audio_format
+    raise ValueError(f"Unsupported audio extension {extension!r}")
+
+
+def write_audio(path: str, audio: np.ndarray, samplerate: int, audio_format: Optional[AudioFormat] = None) -> None:
+    """
+    Write ``(samples,)`` or ``(channels, samples)`` audio.
+
+    The format defaults to the one named by the extension. Formats without
+    headroom above full scale (all but float WAV) clip rather than wrap
+    around; files that belong together, like a track's stems, should be
+    brought into range first with one :func:`headroom_gain`.
+    """
+    audio_format = audio_format or format_for_path(path)
+    frames = np.asarray(audio, dtype=np.float32)
+    frames = frames.T if frames.ndim == 2 else frames
+    if audio_format.subtype != "FLOAT":
+        frames = np.clip(frames, -1.0, 1.0)
+    if audio_format.subtype == "OPUS" and samplerate not in OPUS_RATES:
+        common = np.gcd(48000, samplerate)
+        frames = signal.resample_poly(frames, 48000 // common, samplerate // common, axis=0).astype(np.float32)
+        samplerate = 48000
+    sf.write(path, frames, samplerate, format=audio_format.container, subtype=audio_format.subtype)
+
+
+def headroom_gain(arrays: Iterable[np.ndarray], audio_format: AudioFormat) -> float:
+    """
+    One gain that brings the loudest of ``arrays`` to full scale in ``audio_format``.
+
+    Separated stems routinely peak above 1.0. Scaling every stem of a track
+    by the same gain, instead of each by its own peak, keeps their balance
+    and keeps them summing to (a scaled copy of) the mix. 1.0 when nothing
+    overshoots or the format stores floats.
+    """
+    if audio_format.subtype == "FLOAT":
+        return 1.0
+    peak = max((float(np.abs(audio).max()) for audio in arrays if np.size(audio)), default=0.0)
+    return 1.0 / peak if peak > 1.0 else 1.0
+
+
+def encoded_path(source: str, format_name: str) -> str:
+    """Where the ``format_name`` encode of ``source`` is kept."""
+    return os.path.splitext(source)[0] + FORMATS[format_name].extension
+
+
+def ensure_encoded(source: str, format_name: str) -> str:
+    """
+    Path of ``source`` encoded as ``format_name``, encoding it first if needed.
+
+    An existing encode is reused unless the source is newer. Concurrent
+    requests for the same encode wait for the first one instead of encoding
+    twice, and the file only appears once it is complete.
+    """
+    if format_name not in FORMATS:
+        raise ValueError(f"Unknown audio format {format_name!r}; expected one of {sorted(FORMATS)}")
+    target = encoded_path(source, format_name)
+    if os.path.abspath(target) == os.path.abspath(source):
+        return source
+
+    with _locks[hash(target) % LOCK_STRIPES]:
+        source_mtime = os.stat(source).st_mtime
+        try:
+            if os.stat(target).st_mtime >= source_mtime:
+                return target
+        except FileNotFoundError:
+            pass
+        try:
+            audio, samplerate = sf.read(source, dtype="float32", always_2d=True)
+            audio = audio.T
+        except sf.LibsndfileError:
+            # Uploads can be in containers libsndfile cannot read (e.g. M4A)
+            import librosa
+
+            audio, samplerate = librosa.load(source, sr=None, mono=False)
+        partial = f"{target}.part"
+        try:
+            # The temporary name hides the extension, so pass the format.
+            write_audio(partial, audio, samplerate, FORMATS[format_name])
+            os.replace(partial, target)
+        except Exception:
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+            raise
+        logger.info("Encoded %s as %s", os.path.basename(source), format_name)
+        return target
+
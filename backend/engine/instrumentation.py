@@ -0,0 +1,221 @@
+import bisect
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Seconds; spans a quick cached lookup up to a long CPU-only separation.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process so far, or 0 where it cannot be read."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes elsewhere
+        return int(peak if sys.platform == "darwin" else peak * 1024)
+    try:
+        import psutil
+    except ImportError:
+        return 0
+    # Windows reports the peak working set, its equivalent of peak RSS
+    return int(getattr(psutil.Process().memory_info(), "peak_wset", 0))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        ...
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        if not values and not self.labelnames:
+            values[()] = 0.0
+        return [f"{self.name}{self._format_labels(key)} {value:g}" for key, value in sorted(values.items())]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{self._format_labels(key)} {value:g}" for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._series[key] = (counts, total + value)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        lines: List[str] = []
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {total:g}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        PEAK_RSS.set(peak_rss_bytes())
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram("analysis_stage_seconds", "Wall time per analysis stage.", ["stage"])
+)
+STAGE_CPU_SECONDS = REGISTRY.register(
+    Histogram("analysis_stage_cpu_seconds", "CPU time of the analysis thread per stage.", ["stage"])
+)
+STAGE_ERRORS = REGISTRY.register(
+    Counter("analysis_stage_errors_total", "Analysis stages that failed.", ["stage"])
+)
+ANALYSES = REGISTRY.register(
+    Counter("analysis_runs_total", "Finished analyses by outcome.", ["outcome"])
+)
+DEMUCS_TIMEOUTS = REGISTRY.register(
+    Counter("demucs_timeouts_total", "Demucs separations abandoned after their timeout.")
+)
+PEAK_RSS = REGISTRY.register(
+    Gauge("process_peak_rss_bytes", "Peak resident set size of the API process.")
+)
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition of every engine metric."""
+    return REGISTRY.render()
+
+
+class StageTimer:
+    """
+    Per-analysis record of wall time, CPU time and peak memory by stage.
+
+    Each finished stage is also observed into the process-wide histograms.
+    CPU time is that of the calling thread; work handed to the separation,
+    transcription or stem pools shows up as wall time only. Memory is the
+    process's high-water mark when the stage ended, so it never drops from
+    one stage to the next and includes every concurrent job.
+    """
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        except Exception:
+            self.fail(name)
+            raise
+        finally:
+            self.record(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def record(self, name: str, wall_seconds: float, cpu_seconds: float) -> None:
+        STAGE_SECONDS.observe(wall_seconds, stage=name)
+        STAGE_CPU_SECONDS.observe(cpu_seconds, stage=name)
+        entry = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0})
+        entry["wall_seconds"] = round(entry["wall_seconds"] + wall_seconds, 4)
+        entry["cpu_seconds"] = round(entry["cpu_seconds"] + cpu_seconds, 4)
+        entry["process_peak_rss_mb"] = round(peak_rss_bytes() / (1024 * 1024), 1)
+
+    def fail(self, name: str) -> None:
+        """Count a stage failure that was handled rather than raised."""
+        STAGE_ERRORS.inc(stage=name)
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        return {name: dict(entry) for name, entry in self.stages.items()}
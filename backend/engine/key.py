@@ -0,0 +1,149 @@
+"""
+Key estimation against Krumhansl-Kessler profiles.
+
+All 24 major/minor profiles are z-scored once into a ``(24, 12)`` matrix, so
+scoring any number of chroma vectors is a single matrix product whose
+entries are Pearson correlations.
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Tuple
+
+import librosa
+import numpy as np
+
+from . import segmentation
+
+FAST = "fast"
+ACCURATE = "accurate"
+KEY_MODES = (FAST, ACCURATE)
+# Fast-mode pooling (about 0.37 s at 22050 Hz / 512 hop) when no tempo is known
+FAST_BLOCK_FRAMES = 16
+
+NOTES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+# Camelot code by tonic pitch class
+MAJOR_CAMELOT = ["8B", "3B", "10B", "5B", "12B", "7B", "2B", "9B", "4B", "11B", "6B", "1B"]
+MINOR_CAMELOT = ["5A", "12A", "7A", "2A", "9A", "4A", "11A", "6A", "1A", "8A", "3A", "10A"]
+
+# Krumhansl & Kessler (1982) probe-tone ratings, tonic first
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+
+def _zscore(values: np.ndarray, axis: int) -> np.ndarray:
+    centered = values - values.mean(axis=axis, keepdims=True)
+    scale = centered.std(axis=axis, keepdims=True)
+    return centered / np.where(scale > 0, scale, 1.0)
+
+
+# Rows 0-11 are C..B major, rows 12-23 C..B minor.
+_PROFILES = _zscore(
+    np.stack([np.roll(MAJOR_PROFILE, tonic) for tonic in range(12)] + [np.roll(MINOR_PROFILE, tonic) for tonic in range(12)]),
+    axis=1,
+)
+_CAMELOT = MAJOR_CAMELOT + MINOR_CAMELOT
+_NAMES = NOTES + [f"{note}m" for note in NOTES]
+
+
+@dataclass
+class KeyEstimate:
+    camelot: str
+    name: str
+    # Correlation of the best profile and its margin over the runner-up
+    score: float
+    confidence: float
+    runner_up: str
+    runner_up_score: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def score_profiles(chroma: np.ndarray) -> np.ndarray:
+    """Correlation of each column of ``(12, n)`` chroma with all 24 profiles, as ``(24, n)``."""
+    chroma = np.asarray(chroma, dtype=np.float64).reshape(12, -1)
+    return _PROFILES @ _zscore(chroma, axis=0) / 12.0
+
+
+def estimate_keys(chroma: np.ndarray) -> List[KeyEstimate]:
+    """One estimate per column of ``(12, n)`` chroma."""
+    scores = score_profiles(chroma)
+    order = np.argsort(scores, axis=0)
+    best, second = order[-1], order[-2]
+    columns = np.arange(scores.shape[1])
+    best_scores, second_scores = scores[best, columns], scores[second, columns]
+    return [
+        KeyEstimate(
+            camelot=_CAMELOT[b],
+            name=_NAMES[b],
+            score=round(float(top), 4),
+            confidence=round(float(top - runner), 4),
+            runner_up=_CAMELOT[s],
+            runner_up_score=round(float(runner), 4),
+        )
+        for b, s, top, runner in zip(best, second, best_scores, second_scores)
+    ]
+
+
+def estimate_key(chroma: np.ndarray) -> KeyEstimate:
+    """Estimate from one 12-bin chroma vector (or the mean of ``(12, n)`` chroma)."""
+    chroma = np.asarray(chroma, dtype=np.float64)
+    if chroma.ndim == 2:
+        chroma = chroma.mean(axis=1)
+    return estimate_keys(chroma[:, np.newaxis])[0]
+
+
+def track_chroma(ctx, mode: str = FAST, bpm: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ``(12, n)`` chroma of an analysis FeatureContext and the ``n + 1`` frame
+    boundaries of its columns.
+
+    ``fast`` averages the context's STFT chroma over each beat of the grid
+    at ``bpm`` (see :func:`segmentation.beat_grid`), or over fixed blocks
+    when no tempo is known, so scoring sees a few hundred columns rather
+    than every frame; ``accurate`` keeps the full-resolution constant-Q
+    chroma, which resolves low notes better but needs its own transform.
+    """
+    if mode == ACCURATE:
+        chroma = ctx.chroma
+        return chroma, np.arange(chroma.shape[1] + 1)
+    if mode != FAST:
+        raise ValueError(f"Unknown key mode {mode!r}; expected one of {KEY_MODES}")
+    chroma = ctx.chroma_stft
+    n_frames = chroma.shape[1]
+    beats = segmentation.beat_grid(ctx.onset_env, ctx.sr / ctx.hop_length, bpm) if bpm > 0 else np.zeros(0, dtype=int)
+    if len(beats) < 2:
+        beats = np.arange(FAST_BLOCK_FRAMES, n_frames, FAST_BLOCK_FRAMES)
+    synced, starts, ends = segmentation.beat_sync(chroma, beats[beats < n_frames], n_frames)
+    return synced, np.append(starts, ends[-1])
+
+
+def detect_key(ctx, mode: str = FAST, bpm: float = 0.0) -> KeyEstimate:
+    """Key of the whole context; ``bpm``, when known, sets the fast mode's beat grid."""
+    return estimate_key(track_chroma(ctx, mode, bpm)[0])
+
+
+def key_curve(
+    ctx, window_seconds: float = 30.0, hop_seconds: float = 10.0, mode: str = FAST, bpm: float = 0.0
+) -> List[Dict[str, Any]]:
+    """
+    Key estimates over sliding windows, for following key changes.
+
+    Chroma is computed once; window means come from a cumulative sum over
+    its columns and all windows are scored in one matrix product.
+    """
+    chroma, bounds = track_chroma(ctx, mode, bpm)
+    frame_rate = ctx.sr / ctx.hop_length
+    n_frames = int(bounds[-1])
+    width = max(1, int(window_seconds * frame_rate))
+    hop = max(1, int(hop_seconds * frame_rate))
+    starts = np.arange(0, max(n_frames - width, 0) + 1, hop)
+    ends = np.minimum(starts + width, n_frames)
+    # Columns whose first frame falls inside each window
+    first = np.minimum(np.searchsorted(bounds[:-1], starts), chroma.shape[1] - 1)
+    last = np.maximum(np.searchsorted(bounds[:-1], ends), first + 1)
+    means = segmentation.segment_means(chroma, first, last)
+    return [
+        {"time": round(float(start / frame_rate), 2), "end": round(float(end / frame_rate), 2), **estimate.to_dict()}
+        for start, end, estimate in zip(starts, ends, estimate_keys(means))
+    ]
@@ -1,37 +1,220 @@
+import hashlib
+import json
 import logging
 import os
 import re
-from typing import Dict
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
 MUSICBRAINZ_ENDPOINT = "https://musicbrainz.org/ws/2/recording"
 USER_AGENT = "GeminiDJ/2.0 (contact@gemini.com)"
 
+# Upload names carry a uuid4().hex prefix that would defeat query caching.
+_UPLOAD_PREFIX = re.compile(r"^[0-9a-f]{32}_")
 
-def fetch_metadata_rich(filename: str, timeout_seconds: int = 10) -> Dict[str, str]:
-    query = clean_filename_str(os.path.splitext(filename)[0])
-    params = {"query": query, "fmt": "json", "limit": 1}
-    headers = {"User-Agent": USER_AGENT}
 
+class RateLimiter:
+    """
+    Space calls at least ``min_interval_seconds`` apart across all threads.
+
+    The spacing holds within one process only. Separate processes (the API
+    server and an ingest run, or ingest's workers) each need their own
+    share of the service's allowance, e.g. a multiple of the interval.
+    """
+
+    def __init__(self, min_interval_seconds: float) -> None:
+        self.min_interval_seconds = min_interval_seconds
+        self._next_allowed = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_allowed - now
+            self._next_allowed = max(now, self._next_allowed) + self.min_interval_seconds
+        if delay > 0:
+            time.sleep(delay)
+
+
+class MetadataClient:
+    """
+    MusicBrainz recording lookups shared by every analysis in the process.
+
+    Requests go through one pooled session and a rate limiter shared by the
+    whole process (not by other processes; see :class:`RateLimiter`).
+    Identical queries that are already in flight share a single request, and
+    answers are cached on disk for ``ttl_seconds`` under the normalized query.
+    Lookups run on a small thread pool so the pipeline never waits on the
+    network until it actually needs the result.
+    """
+
+    def __init__(
+        self,
+        endpoint: str = MUSICBRAINZ_ENDPOINT,
+        cache_dir: Optional[str] = None,
+        ttl_seconds: float = 7 * 24 * 60 * 60,
+        min_interval_seconds: float = 1.0,
+        timeout_seconds: float = 10.0,
+        workers: int = 4,
+    ) -> None:
+        self.endpoint = endpoint
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.timeout_seconds = timeout_seconds
+        self.rate_limiter = RateLimiter(min_interval_seconds)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="metadata")
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def close(self) -> None:
+        """Finish queued lookups, then release the thread pool and pooled connections."""
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def submit(self, filename: str) -> Future:
+        """Start a lookup for ``filename`` in the background."""
+        return self._executor.submit(self.lookup, filename)
+
+    def lookup(self, filename: str) -> Dict[str, str]:
+        """
+        Metadata for ``filename``, from the disk cache or MusicBrainz.
+
+        Returns an empty dict when nothing matches or the service is
+        unreachable; failures are not cached.
+        """
+        query = normalize_query(filename)
+        if not query:
+            return {}
+        cached = self._cache_get(query)
+        if cached is not None:
+            return dict(cached)
+
+        with self._lock:
+            future = self._in_flight.get(query)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[query] = future
+
+        if not leader:
+            return dict(future.result())
+
+        meta: Dict[str, str] = {}
+        try:
+            meta, cacheable = self._fetch(query)
+            if cacheable:
+                self._cache_put(query, meta)
+        finally:
+            with self._lock:
+                del self._in_flight[query]
+            future.set_result(meta)
+        return dict(meta)
+
+    def _fetch(self, query: str) -> Tuple[Dict[str, str], bool]:
+        self.rate_limiter.wait()
+        try:
+            response = self.session.get(
+                self.endpoint,
+                params={"query": query, "fmt": "json", "limit": 1},
+                timeout=self.timeout_seconds,
+            )
+            response.raise_for_status()
+            payload = response.json()
+        except requests.RequestException as exc:
+            logger.warning("Metadata lookup failed for %r: %s", query, exc)
+            return {}, False
+        except ValueError as exc:
+            logger.warning("Metadata response could not be decoded for %r: %s", query, exc)
+            return {}, False
+        return parse_recording(payload), True
+
+    def _cache_path(self, query: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"{hashlib.sha1(query.encode('utf-8')).hexdigest()}.json")
+
+    def _cache_get(self, query: str) -> Optional[Dict[str, str]]:
+        path = self._cache_path(query)
+        if path is None:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                entry = json.load(handle)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            logger.warning("Ignoring unreadable metadata cache entry %s: %s", path, exc)
+            return None
+        if time.time() - entry.get("stored_at", 0) > self.ttl_seconds or entry.get("query") != query:
+            return None
+        return entry.get("meta") or {}
+
+    def _cache_put(self, query: str, meta: Dict[str, str]) -> None:
+        path = self._cache_path(query)
+        if path is None:
+            return
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump({"query": query, "stored_at": time.time(), "meta": meta}, handle)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.exception("Failed to write metadata cache entry %s", path)
+
+
+_client: Optional[MetadataClient] = None
+_client_lock = threading.Lock()
+
+
+def configure_metadata(**options: Any) -> MetadataClient:
+    """Replace the shared client, e.g. to set the cache folder or endpoint."""
+    global _client
+    client = MetadataClient(**options)
+    with _client_lock:
+        previous, _client = _client, client
+    if previous is not None:
+        previous.close()
+    return client
+
+
+def get_metadata_client() -> MetadataClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MetadataClient()
+        return _client
+
+
+def fetch_metadata_rich(filename: str, timeout_seconds: int = 10) -> Dict[str, str]:
+    """Blocking lookup through the shared client; ``timeout_seconds`` bounds the wait."""
     try:
-        response = requests.get(
-            MUSICBRAINZ_ENDPOINT,
-            params=params,
-            headers=headers,
-            timeout=timeout_seconds,
-        )
-        response.raise_for_status()
-        payload = response.json()
-    except requests.RequestException as exc:
-        logger.warning("Metadata lookup failed for %s: %s", filename, exc)
-        return {}
-    except ValueError as exc:
-        logger.warning("Metadata response could not be decoded for %s: %s", filename, exc)
+        return get_metadata_client().submit(filename).result(timeout=timeout_seconds)
+    except FutureTimeoutError:
+        logger.warning("Metadata lookup timed out for %s", filename)
         return {}
 
+
+def normalize_query(filename: str) -> str:
+    stem = _UPLOAD_PREFIX.sub("", os.path.splitext(os.path.basename(filename))[0])
+    return " ".join(clean_filename_str(stem).lower().split())
+
+
+def parse_recording(payload: Dict[str, Any]) -> Dict[str, str]:
     recordings = payload.get("recordings") or payload.get("recording-list") or []
     if not recordings:
         return {}
@@ -0,0 +1,174 @@
+import logging
+import os
+import struct
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# File layout (little endian):
+#   header  "PEAK" magic, u16 version, u16 level count, u32 sample rate,
+#           u32 samples per peak at level 0, u64 samples, f32 scale
+#   index   u64 peak count per level
+#   data    per level, ``count`` (min, max) int8 pairs scaled by ``scale / 127``
+PEAK_MAGIC = b"PEAK"
+PEAK_VERSION = 1
+_HEADER = struct.Struct("<4sHHIIQf")
+
+BASE_SAMPLES_PER_PEAK = 64
+LEVEL_FACTOR = 4
+MIN_TOP_LEVEL_PEAKS = 256
+
+
+class PeakPyramidBuilder:
+    """
+    Accumulate min/max waveform peaks at several zoom levels.
+
+    Blocks of any size are reduced to level-0 peaks (``base_samples`` samples
+    each) as they arrive; coarser levels are ``LEVEL_FACTOR``-fold reductions
+    of the level below, computed once in :meth:`finish`. Only the level-0
+    peaks are held in memory, so a whole mix can be fed block by block.
+    """
+
+    def __init__(self, sr: int, base_samples: int = BASE_SAMPLES_PER_PEAK) -> None:
+        self.sr = sr
+        self.base_samples = base_samples
+        self.n_samples = 0
+        self._carry = np.zeros(0, dtype=np.float32)
+        self._mins: List[np.ndarray] = []
+        self._maxs: List[np.ndarray] = []
+
+    def process(self, block: np.ndarray) -> None:
+        """Add a block of mono samples."""
+        block = np.asarray(block, dtype=np.float32)
+        self.n_samples += len(block)
+        buffer = np.concatenate([self._carry, block])
+        n_peaks = len(buffer) // self.base_samples
+        frames = buffer[: n_peaks * self.base_samples].reshape(n_peaks, self.base_samples)
+        self._mins.append(frames.min(axis=1))
+        self._maxs.append(frames.max(axis=1))
+        self._carry = buffer[n_peaks * self.base_samples :]
+
+    def finish(self) -> List[np.ndarray]:
+        """Return one ``(n, 2)`` float32 array of (min, max) per level, finest first."""
+        if len(self._carry):
+            self._mins.append(self._carry.min(keepdims=True))
+            self._maxs.append(self._carry.max(keepdims=True))
+        mins = np.concatenate(self._mins) if self._mins else np.zeros(0, dtype=np.float32)
+        maxs = np.concatenate(self._maxs) if self._maxs else np.zeros(0, dtype=np.float32)
+        self._carry = np.zeros(0, dtype=np.float32)
+        self._mins, self._maxs = [mins], [maxs]
+
+        levels = [np.stack([mins, maxs], axis=1)]
+        while len(levels[-1]) > MIN_TOP_LEVEL_PEAKS:
+            previous = levels[-1]
+            n_peaks = -(-len(previous) // LEVEL_FACTOR)
+            padded = np.pad(previous, ((0, n_peaks * LEVEL_FACTOR - len(previous)), (0, 0)), mode="edge")
+            grouped = padded.reshape(n_peaks, LEVEL_FACTOR, 2)
+            levels.append(np.stack([grouped[:, :, 0].min(axis=1), grouped[:, :, 1].max(axis=1)], axis=1))
+        return levels
+
+    def write(self, path: str) -> str:
+        """Write the pyramid to ``path`` atomically and return it."""
+        levels = self.finish()
+        scale = float(max((np.abs(level).max() for level in levels if level.size), default=0.0))
+        quantize = 127.0 / scale if scale > 0 else 0.0
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as handle:
+            handle.write(
+                _HEADER.pack(PEAK_MAGIC, PEAK_VERSION, len(levels), self.sr, self.base_samples, self.n_samples, scale)
+            )
+            handle.write(np.array([len(level) for level in levels], dtype="<u8").tobytes())
+            for level in levels:
+                handle.write(np.round(level * quantize).astype(np.int8).tobytes())
+        os.replace(tmp_path, path)
+        return path
+
+
+def write_peaks(y: np.ndarray, sr: int, path: str) -> str:
+    builder = PeakPyramidBuilder(sr)
+    builder.process(y)
+    return builder.write(path)
+
+
+class PeakFile:
+    """
+    Read-only view of a ``.peaks`` file.
+
+    The peak data is memory-mapped, so serving a window at any zoom level only
+    touches the bytes inside that window.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as handle:
+            header = handle.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError(f"{path} is not a peak file")
+            magic, version, n_levels, sr, base_samples, n_samples, scale = _HEADER.unpack(header)
+            if magic != PEAK_MAGIC or version != PEAK_VERSION:
+                raise ValueError(f"{path} is not a version {PEAK_VERSION} peak file")
+            counts = np.frombuffer(handle.read(8 * n_levels), dtype="<u8").astype(int)
+
+        self.sr = sr
+        self.base_samples = base_samples
+        self.n_samples = n_samples
+        self.scale = scale
+        self.duration = n_samples / sr if sr else 0.0
+        offset = _HEADER.size + 8 * n_levels
+        if counts.sum():
+            data = np.memmap(path, dtype=np.int8, mode="r", offset=offset)
+        else:
+            data = np.zeros(0, dtype=np.int8)
+        self._levels: List[np.ndarray] = []
+        start = 0
+        for count in counts:
+            self._levels.append(data[start : start + 2 * count].reshape(count, 2))
+            start += 2 * count
+
+    @property
+    def n_levels(self) -> int:
+        return len(self._levels)
+
+    def samples_per_peak(self, level: int) -> int:
+        return self.base_samples * LEVEL_FACTOR**level
+
+    def level_for(self, points: int, start: float, end: float) -> int:
+        """Coarsest level that still has at least ``points`` peaks between ``start`` and ``end``."""
+        span_samples = max(end - start, 0.0) * self.sr
+        for level in reversed(range(self.n_levels)):
+            if span_samples / self.samples_per_peak(level) >= points:
+                return level
+        return 0
+
+    def window(self, level: int, start: float = 0.0, end: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Peaks of one level between ``start`` and ``end`` seconds.
+
+        Args:
+            level: Zoom level, 0 being the finest.
+            start: Window start in seconds.
+            end: Window end in seconds; defaults to the end of the track.
+        """
+        if not 0 <= level < self.n_levels:
+            raise ValueError(f"level must be between 0 and {self.n_levels - 1}")
+        end = self.duration if end is None else min(end, self.duration)
+        start = min(max(start, 0.0), end)
+        per_peak = self.samples_per_peak(level)
+        peaks = self._levels[level]
+        first = int(start * self.sr // per_peak)
+        last = min(len(peaks), int(-(-end * self.sr // per_peak)))
+        window = np.asarray(peaks[first:last], dtype=np.float32) * (1.0 / 127.0)
+        return {
+            "level": level,
+            "levels": self.n_levels,
+            "samples_per_peak": per_peak,
+            "sample_rate": self.sr,
+            "start": round(first * per_peak / self.sr, 4),
+            "end": round(last * per_peak / self.sr, 4),
+            "duration": round(self.duration, 4),
+            # Peaks are relative to the track's loudest sample, which is ``scale`` full-scale
+            "scale": round(self.scale, 6),
+            "min": np.round(window[:, 0], 3).tolist(),
+            "max": np.round(window[:, 1], 3).tolist(),
+        }
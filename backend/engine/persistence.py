@@ -0,0 +1,80 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Tuple
+
+import numpy as np
+
+from .encoding import write_audio
+
+logger = logging.getLogger(__name__)
+
+# One writer thread: disk writes never compete with each other, and the
+# analysis thread only ever waits on them when it needs the files.
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-writer")
+
+# Hex digits of SHA-256 kept for content hashes: 128 bits
+DIGEST_LENGTH = 32
+# Content hashes remembered per (path, size, mtime)
+DIGEST_CACHE_SIZE = 4096
+
+_digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """
+    Content hash of a file, used for ETags, versioned artifact URLs and the
+    decode cache. Computed once per version of the file.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        cached = _digests.get(key)
+        if cached is not None:
+            _digests.move_to_end(key)
+            return cached
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    value = digest.hexdigest()[:DIGEST_LENGTH]
+    with _digests_lock:
+        _digests[key] = value
+        while len(_digests) > DIGEST_CACHE_SIZE:
+            _digests.popitem(last=False)
+    return value
+
+
+def persist_audio(files: Dict[str, Tuple[np.ndarray, int]]) -> Future:
+    """
+    Write audio artifacts to disk in one background step.
+
+    Args:
+        files: Mapping of destination path to ``(audio, samplerate)``. Audio is
+            either mono ``(samples,)`` or ``(channels, samples)``; the
+            extension picks the encoding (see :mod:`engine.encoding`).
+
+    Returns:
+        A future resolving to ``{path: content hash}`` for every file that was
+        written successfully.
+    """
+    return _writer.submit(_write_all, dict(files))
+
+
+def _write_all(files: Dict[str, Tuple[np.ndarray, int]]) -> Dict[str, str]:
+    written: Dict[str, str] = {}
+    for path, (audio, samplerate) in files.items():
+        try:
+            write_audio(path, audio, samplerate)
+            written[path] = file_digest(path)
+        except Exception:
+            logger.exception("Failed to persist %s", path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return written
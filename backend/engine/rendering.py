@@ -9,45 +9,31 @@ logger = logging.getLogger(__name__)
 
 
 def generate_waveform(y: np.ndarray, points: int = 150) -> List[float]:
-    hop_length = len(y) // points
-    hop_length = max(hop_length, 1)
-
-    waveform: List[float] = []
-    for i in range(points):
-        segment = y[i * hop_length : (i + 1) * hop_length]
-        if len(segment) > 0:
-            val = float(np.max(np.abs(segment)))
-            waveform.append(val)
-        else:
-            waveform.append(0.0)
-
-    max_val = max(waveform) if waveform else 0
+    hop_length = max(len(y) // points, 1)
+    n_full = min(len(y) // hop_length, points)
+    frames = y[: n_full * hop_length].reshape(n_full, hop_length)
+    waveform = np.zeros(points)
+    if n_full:
+        waveform[:n_full] = np.maximum(frames.max(axis=1), -frames.min(axis=1))
+
+    max_val = waveform.max() if points else 0
     if max_val > 0:
-        waveform = [float(round(v / max_val, 3)) for v in waveform]
-
-    return waveform
+        waveform = np.round(waveform / max_val, 3)
+    return [float(v) for v in waveform]
 
 
 def generate_midi_from_audio(audio_path: str, output_dir: str) -> Optional[str]:
+    from .transcription import get_transcription_engine
+
+    base_name = os.path.splitext(os.path.basename(audio_path))[0]
+    midi_path = os.path.join(output_dir, f"{base_name}_basic_pitch.mid")
     try:
-        from basic_pitch.inference import predict_and_save
-
-        os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
-        predict_and_save(
-            audio_path_list=[audio_path],
-            output_directory=output_dir,
-            save_midi=True,
-            save_model_outputs=False,
-            save_notes=False,
-        )
+        y, sr = librosa.load(audio_path, sr=22050)
+        transcription = get_transcription_engine().transcribe({base_name: y}, sr)[base_name]
+        with open(midi_path, "wb") as handle:
+            handle.write(transcription.midi)
     except Exception:
         logger.exception("MIDI generation failed for %s", audio_path)
         return None
 
-    base_name = os.path.splitext(os.path.basename(audio_path))[0]
-    midi_path = os.path.join(output_dir, f"{base_name}_basic_pitch.mid")
-    if os.path.exists(midi_path):
-        return midi_path
-
-    logger.warning("MIDI file not found after generation attempt for %s", audio_path)
-    return None
+    return midi_path
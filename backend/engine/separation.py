@@ -1,14 +1,19 @@
 import logging
-import os
-import shutil
-import subprocess
-import sys
-from typing import Dict, Optional, Tuple
+import queue
+import threading
+from functools import partial
+from concurrent.futures import CancelledError, Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
 
 import librosa
 import numpy as np
 from scipy import signal
 
+from .chunking import ChunkedSeparator, ChunkSettings
+from .instrumentation import DEMUCS_TIMEOUTS
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,55 +21,333 @@ class DemucsError(RuntimeError):
     """Raised when Demucs separation fails."""
 
 
-def separate_audio_demucs(
-    filepath: str,
-    out_dir: str,
-    model_name: str = "htdemucs_6s",
-    timeout_seconds: int = 600,
-) -> Dict[str, str]:
-    if not os.path.exists(out_dir):
-        os.makedirs(out_dir)
-
-    track_name = os.path.splitext(os.path.basename(filepath))[0]
-    output_root = os.path.join(out_dir, "separated")
-    cmd = [
-        sys.executable,
-        "-m",
-        "demucs.separate",
-        "-n",
-        model_name,
-        "-o",
-        output_root,
-        "--device",
-        "cuda" if _has_cuda() else "cpu",
-        filepath,
-    ]
-
-    logger.info("Running Demucs (%s) with timeout %ss: %s", model_name, timeout_seconds, " ".join(cmd))
+class SeparationCancelled(DemucsError):
+    """Raised inside the service when every track of a running batch was abandoned."""
+
+
+DEMUCS_STEMS = ["vocals", "drums", "bass", "other", "piano", "guitar"]
+
+
+@dataclass
+class SeparationResult:
+    samplerate: int
+    stems: Dict[str, np.ndarray]
+
+    def mono(self, sr: int) -> Dict[str, np.ndarray]:
+        """Downmix and resample every stem to ``sr`` for the analysis stages."""
+        return {
+            name: librosa.resample(
+                np.mean(audio, axis=0), orig_sr=self.samplerate, target_sr=sr
+            ).astype(np.float32, copy=False)
+            for name, audio in self.stems.items()
+        }
+
+
+class SeparationFuture(Future):
+    """
+    Future of a queued separation.
+
+    ``cancel()`` drops a job that is still queued, as usual, and also marks
+    a running one as abandoned; the service stops it at its next checkpoint
+    (between tracks and chunks; a single network pass is not interrupted).
+    ``started`` is set once the service takes the job off the queue.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.abandoned = threading.Event()
+        self.started = threading.Event()
+
+    def cancel(self) -> bool:
+        self.abandoned.set()
+        return super().cancel()
+
+    def set_running_or_notify_cancel(self) -> bool:
+        running = super().set_running_or_notify_cancel()
+        if running:
+            self.started.set()
+        return running
+
+
+@dataclass
+class _SeparationJob:
+    filepath: str
+    model_name: str
+    future: SeparationFuture = field(default_factory=SeparationFuture)
+
+
+class SeparationService:
+    """
+    Long-lived Demucs worker that keeps each model resident between tracks.
+
+    Tracks are submitted over a queue and separated on a single background
+    thread. Jobs queued for the same model are padded to a common length and
+    run through the network as one batch of up to ``max_batch`` tracks.
+
+    With ``chunking`` set, CPU separation instead runs one track at a time as
+    overlapping chunks on a :class:`ChunkedSeparator` process pool.
+    """
+
+    def __init__(
+        self,
+        max_batch: int = 2,
+        batch_window_seconds: float = 0.05,
+        chunking: Optional[ChunkSettings] = None,
+    ) -> None:
+        self.max_batch = max(1, max_batch)
+        self.chunker = ChunkedSeparator(chunking) if chunking is not None else None
+        self.batch_window_seconds = batch_window_seconds
+        self._queue: "queue.Queue[Optional[_SeparationJob]]" = queue.Queue()
+        self._models: Dict[str, object] = {}
+        # (samplerate, audio_channels, sources) of models only the chunk workers hold
+        self._model_shapes: Dict[str, Tuple[int, int, List[str]]] = {}
+        self._backlog: List[_SeparationJob] = []
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, filepath: str, model_name: str) -> SeparationFuture:
+        self._ensure_started()
+        job = _SeparationJob(filepath=filepath, model_name=model_name)
+        self._queue.put(job)
+        return job.future
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            thread, self._thread = self._thread, None
+        thread.join()
+        if self.chunker is not None:
+            self.chunker.shutdown()
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="demucs-separation", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            abandoned = partial(self._abandoned, batch)
+            try:
+                results = self._separate_batch(batch[0].model_name, [job.filepath for job in batch], abandoned)
+            except SeparationCancelled as exc:
+                logger.info("Stopped a Demucs batch of %d abandoned track(s)", len(batch))
+                for job in batch:
+                    job.future.set_exception(exc)
+                continue
+            except Exception as exc:
+                logger.exception("Demucs batch of %d track(s) failed", len(batch))
+                for job in batch:
+                    job.future.set_exception(exc)
+                continue
+            for job, result in zip(batch, results):
+                job.future.set_result(result)
+
+    @staticmethod
+    def _abandoned(batch: List[_SeparationJob]) -> bool:
+        """True once every job of ``batch`` has been cancelled by its waiter."""
+        return all(job.future.abandoned.is_set() for job in batch)
+
+    def _next_batch(self) -> Optional[List[_SeparationJob]]:
+        first = self._backlog.pop(0) if self._backlog else self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        for job in list(self._backlog):
+            if len(batch) >= self.max_batch:
+                break
+            if job.model_name == first.model_name:
+                self._backlog.remove(job)
+                batch.append(job)
+
+        while len(batch) < self.max_batch:
+            try:
+                job = self._queue.get(timeout=self.batch_window_seconds)
+            except queue.Empty:
+                break
+            if job is None:
+                self._queue.put(None)
+                break
+            if job.model_name == first.model_name:
+                batch.append(job)
+            else:
+                self._backlog.append(job)
+        return batch
+
+    def _load_model(self, model_name: str):
+        model = self._models.get(model_name)
+        if model is None:
+            from demucs.pretrained import get_model
+
+            logger.info("Loading Demucs model %s", model_name)
+            model = get_model(model_name)
+            model.eval()
+            self._models[model_name] = model
+        return model
+
+    def _model_shape(self, model_name: str) -> Tuple[int, int, List[str]]:
+        """Sample rate, channel count and source names, without keeping the model resident."""
+        shape = self._model_shapes.get(model_name)
+        if shape is None:
+            from demucs.pretrained import get_model
+
+            model = self._models.get(model_name) or get_model(model_name)
+            shape = (model.samplerate, model.audio_channels, list(model.sources))
+            self._model_shapes[model_name] = shape
+        return shape
+
+    def _separate_batch(
+        self, model_name: str, filepaths: List[str], abandoned: Callable[[], bool] = lambda: False
+    ) -> List[SeparationResult]:
+        import torch
+        from demucs.apply import apply_model
+
+        device = "cuda" if _has_cuda() else "cpu"
+        if device == "cpu" and self.chunker is not None:
+            return [self._separate_chunked(model_name, path, abandoned) for path in filepaths]
+        model = self._load_model(model_name)
+
+        mixes = []
+        for path in filepaths:
+            _check(abandoned)
+            wav, _ = librosa.load(path, sr=model.samplerate, mono=False)
+            wav = np.atleast_2d(wav)
+            if wav.shape[0] != model.audio_channels:
+                wav = np.repeat(wav.mean(axis=0, keepdims=True), model.audio_channels, axis=0)
+            mixes.append(torch.from_numpy(np.ascontiguousarray(wav, dtype=np.float32)))
+
+        lengths = [mix.shape[-1] for mix in mixes]
+        batch = torch.zeros(len(mixes), model.audio_channels, max(lengths))
+        refs = []
+        for i, mix in enumerate(mixes):
+            ref = mix.mean(0)
+            mean, std = ref.mean(), ref.std() + 1e-8
+            refs.append((mean, std))
+            batch[i, :, : lengths[i]] = (mix - mean) / std
+
+        _check(abandoned)
+        logger.info("Separating %d track(s) with %s on %s", len(filepaths), model_name, device)
+        with torch.no_grad():
+            sources = apply_model(model, batch, device=device, split=True, overlap=0.25, progress=False)
+
+        results = []
+        for i, (mean, std) in enumerate(refs):
+            track_sources = sources[i, :, :, : lengths[i]] * std + mean
+            stems = {
+                name: track_sources[s_idx].cpu().numpy().astype(np.float32, copy=False)
+                for s_idx, name in enumerate(model.sources)
+            }
+            results.append(SeparationResult(samplerate=model.samplerate, stems=stems))
+        return results
+
+    def _separate_chunked(
+        self, model_name: str, filepath: str, abandoned: Callable[[], bool] = lambda: False
+    ) -> SeparationResult:
+        # The workers hold the only resident copies of the model.
+        _check(abandoned)
+        samplerate, channels, source_names = self._model_shape(model_name)
+        wav, _ = librosa.load(filepath, sr=samplerate, mono=False)
+        wav = np.atleast_2d(wav).astype(np.float32, copy=False)
+        if wav.shape[0] != channels:
+            wav = np.repeat(wav.mean(axis=0, keepdims=True), channels, axis=0)
+
+        # Normalize over the whole track, as single-shot separation does, so
+        # every chunk sees the same scaling.
+        ref = wav.mean(axis=0)
+        mean, std = float(ref.mean()), float(ref.std()) + 1e-8
+        try:
+            separated = self.chunker.separate(model_name, (wav - mean) / std, samplerate, abandoned)
+        except CancelledError as exc:
+            raise SeparationCancelled("Separation abandoned") from exc
+        sources = separated * std + mean
+        stems = {name: sources[s_idx] for s_idx, name in enumerate(source_names)}
+        return SeparationResult(samplerate=samplerate, stems=stems)
+
+
+def _check(abandoned: Callable[[], bool]) -> None:
+    if abandoned():
+        raise SeparationCancelled("Separation abandoned")
+
+
+_service: Optional[SeparationService] = None
+_service_lock = threading.Lock()
+
+
+def configure_separation(**options) -> SeparationService:
+    """Replace the shared service, e.g. to enable chunked CPU separation."""
+    global _service
+    with _service_lock:
+        previous, _service = _service, SeparationService(**options)
+    if previous is not None:
+        previous.shutdown()
+    return _service
+
+
+def get_separation_service() -> SeparationService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SeparationService()
+        return _service
+
+
+def submit_separation(filepath: str, model_name: str = "htdemucs_6s") -> SeparationFuture:
+    """Queue ``filepath`` for separation and return at once; see :func:`wait_for_separation`."""
+    logger.info("Queueing Demucs (%s) separation: %s", model_name, filepath)
+    return get_separation_service().submit(filepath, model_name)
+
+
+def wait_for_separation(
+    future: Future, filepath: str, timeout_seconds: int = 600, queue_timeout_seconds: int = 3600
+) -> SeparationResult:
+    """
+    Result of a :func:`submit_separation` future.
+
+    ``queue_timeout_seconds`` bounds the wait for the service to take the
+    job; ``timeout_seconds`` starts once it has, so a track queued behind a
+    long batch is not abandoned before it ever runs. On either timeout the
+    future is cancelled, which also stops a separation that is already
+    running at its next checkpoint instead of leaving it to hold the
+    service thread.
+    """
+    started = getattr(future, "started", None)
+    if started is not None and not started.wait(queue_timeout_seconds) and not future.done():
+        future.cancel()
+        DEMUCS_TIMEOUTS.inc()
+        raise DemucsError(f"Demucs did not start within {queue_timeout_seconds}s")
     try:
-        subprocess.run(cmd, check=True, timeout=timeout_seconds)
-    except subprocess.TimeoutExpired as exc:
+        result: SeparationResult = future.result(timeout=timeout_seconds)
+    except FutureTimeoutError as exc:
+        future.cancel()
+        DEMUCS_TIMEOUTS.inc()
         raise DemucsError(f"Demucs timed out after {timeout_seconds}s") from exc
-    except subprocess.CalledProcessError as exc:
-        raise DemucsError(f"Demucs failed with exit code {exc.returncode}") from exc
-
-    demucs_out_dir = os.path.join(output_root, model_name, track_name)
-    stems: Dict[str, str] = {}
-    target_dir = os.path.dirname(filepath)
-    base_name = os.path.splitext(os.path.basename(filepath))[0]
-
-    demucs_stems = ["vocals", "drums", "bass", "other", "piano", "guitar"]
-    for d_stem in demucs_stems:
-        src = os.path.join(demucs_out_dir, f"{d_stem}.wav")
-        if os.path.exists(src):
-            dst = os.path.join(target_dir, f"{base_name}_{d_stem}.wav")
-            shutil.copy2(src, dst)
-            stems[d_stem] = dst
-        else:
+    except Exception as exc:
+        raise DemucsError(f"Demucs failed: {exc}") from exc
+
+    for d_stem in DEMUCS_STEMS:
+        if d_stem not in result.stems:
             logger.warning("Demucs output missing expected stem %s for %s", d_stem, filepath)
 
-    shutil.rmtree(demucs_out_dir, ignore_errors=True)
-    return stems
+    return result
+
+
+def separate_audio_demucs(
+    filepath: str,
+    model_name: str = "htdemucs_6s",
+    timeout_seconds: int = 600,
+) -> SeparationResult:
+    return wait_for_separation(submit_separation(filepath, model_name), filepath, timeout_seconds)
 
 
 def split_drums(y: np.ndarray, sr: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
@@ -0,0 +1,73 @@
+"""
+The analysis stage graph.
+
+Each stage names the stages whose output it reads. A request for some
+stages runs those plus everything they depend on, so a tempo-only request
+never queues a separation.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+BPM = "bpm"
+KEY = "key"
+TEXTURE = "texture"
+MIX_POINTS = "mix_points"
+SECTIONS = "sections"
+WAVEFORM = "waveform"
+LOUDNESS = "loudness"
+METADATA = "metadata"
+SEPARATION = "separation"
+DRUM_SPLIT = "drum_split"
+STEMS = "stems"
+CUES = "cues"
+MIDI = "midi"
+
+# Stage -> stages it needs, in the order the pipeline runs them
+DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    BPM: (),
+    KEY: (),
+    TEXTURE: (),
+    MIX_POINTS: (),
+    SECTIONS: (BPM,),
+    WAVEFORM: (),
+    LOUDNESS: (),
+    METADATA: (),
+    SEPARATION: (),
+    DRUM_SPLIT: (SEPARATION,),
+    STEMS: (SEPARATION, DRUM_SPLIT),
+    # Cues come from the vocal stem and are placed relative to the mix points
+    CUES: (SEPARATION, MIX_POINTS),
+    MIDI: (SEPARATION,),
+}
+ALL_STAGES: Tuple[str, ...] = tuple(DEPENDENCIES)
+
+
+def resolve(requested: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    The requested stages plus their prerequisites, in pipeline order.
+
+    ``None`` selects every stage. Raises ``ValueError`` for unknown names.
+    """
+    if requested is None:
+        return list(ALL_STAGES)
+    requested = list(requested)
+    unknown = sorted(set(requested) - set(DEPENDENCIES))
+    if unknown:
+        raise ValueError(f"Unknown analysis stage(s): {', '.join(unknown)}")
+
+    selected = set()
+    pending = list(requested)
+    while pending:
+        stage = pending.pop()
+        if stage not in selected:
+            selected.add(stage)
+            pending.extend(DEPENDENCIES[stage])
+    return [stage for stage in ALL_STAGES if stage in selected]
+
+
+def parse(value: Union[str, Iterable[str], None]) -> Optional[List[str]]:
+    """Parse a ``stages`` request parameter (comma-separated or a list); empty means all stages."""
+    if not value:
+        return None
+    names = value.split(",") if isinstance(value, str) else value
+    return resolve(name.strip() for name in names if name.strip())
@@ -0,0 +1,96 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from . import analysis
+from .peaks import write_peaks
+from .rendering import generate_waveform
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StemOutput:
+    name: str
+    waveform: Optional[List[float]] = None
+    peaks: Optional[str] = None
+    cues: Optional[List[Dict[str, object]]] = None
+    errors: List[str] = field(default_factory=list)
+
+
+def process_stem(
+    name: str,
+    audio: np.ndarray,
+    sr: int,
+    cue_params: Optional[Dict[str, object]] = None,
+    peaks_path: Optional[str] = None,
+) -> StemOutput:
+    """Waveform, peak pyramid and (if ``cue_params`` is given) cue detection for one stem."""
+    output = StemOutput(name=name)
+    try:
+        output.waveform = generate_waveform(audio)
+    except Exception as exc:
+        logger.exception("Waveform generation failed for %s stem", name)
+        output.errors.append(f"waveform: {exc}")
+
+    if peaks_path is not None:
+        try:
+            output.peaks = write_peaks(audio, sr, peaks_path)
+        except Exception as exc:
+            logger.exception("Peak pyramid failed for %s stem", name)
+            output.errors.append(f"peaks: {exc}")
+
+    if cue_params is not None:
+        try:
+            output.cues = analysis.detect_cue_points(analysis.FeatureContext(audio, sr), **cue_params)
+        except Exception as exc:
+            logger.exception("Cue detection failed for %s stem", name)
+            output.errors.append(f"cues: {exc}")
+    return output
+
+
+def collect(future: Future, name: str) -> StemOutput:
+    """Wait for a stem task, turning a crashed worker into a reported failure."""
+    try:
+        return future.result()
+    except Exception as exc:
+        logger.exception("Stem task for %s failed", name)
+        return StemOutput(name=name, errors=[str(exc)])
+
+
+# Default worker cap; separation (chunked or not) uses the other cores
+DEFAULT_STEM_WORKERS = 4
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = max(1, min(DEFAULT_STEM_WORKERS, os.cpu_count() or 1))
+_pool_lock = threading.Lock()
+
+
+def configure_stem_pool(workers: int) -> None:
+    """Cap the stem pool at ``workers`` processes; a running pool is replaced."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        previous, _pool = _pool, None
+        _pool_workers = max(1, workers)
+    if previous is not None:
+        previous.shutdown(wait=False)
+
+
+def get_stem_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all analyses, capped by :func:`configure_stem_pool`."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork: the parent holds torch/TF state and
+            # worker threads that must not be duplicated into children.
+            _pool = ProcessPoolExecutor(
+                max_workers=_pool_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
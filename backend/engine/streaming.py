@@ -0,0 +1,385 @@
+import logging
+import math
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import librosa
+import numpy as np
+import soundfile as sf
+import soxr
+from scipy import signal
+
+from . import analysis, decode, key, segmentation
+from .rendering import generate_waveform
+
+logger = logging.getLogger(__name__)
+
+# Uncompressed containers libsndfile can read while the file is still growing
+GROWING_FORMATS = {"WAV", "WAVEX", "AIFF", "W64", "RF64"}
+GROWING_SUBTYPES = {"PCM_S8", "PCM_U8", "PCM_16", "PCM_24", "PCM_32", "FLOAT", "DOUBLE"}
+# Bytes after which a file that still cannot be opened is taken to be unsupported
+GROWING_HEADER_BYTES = 64 * 1024
+
+
+@dataclass
+class StreamingSummary:
+    duration: float
+    bpm: float
+    key: str
+    texture: str
+    color: str
+    drop_time: Optional[float]
+    intro_end: str
+    outro_start: str
+    waveform: List[float]
+    curves: List[Dict[str, Any]] = field(default_factory=list)
+    sections: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class BlockReader:
+    """
+    Read a file as consecutive mono blocks at (roughly) ``target_sr``.
+
+    Decoding goes through ``soundfile.blocks`` so only one block is held at a
+    time. Rates that are an integer multiple of the target are decimated with
+    a stateful anti-alias filter, which keeps block boundaries seamless;
+    anything else is analyzed at its native rate.
+    """
+
+    def __init__(self, path: str, block_seconds: float = 10.0, target_sr: int = 22050) -> None:
+        self.path = path
+        info = sf.info(path)
+        self.native_sr = info.samplerate
+        self.channels = info.channels
+        self.duration = info.frames / info.samplerate if info.samplerate else 0.0
+        factor = max(1, info.samplerate // target_sr)
+        self.factor = factor if info.samplerate % factor == 0 else 1
+        self.sr = info.samplerate // self.factor
+        self.blocksize = int(block_seconds * info.samplerate) // self.factor * self.factor
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, float]]:
+        """Yield ``(mono_block, seconds_read_so_far)``."""
+        for _, mono, position in self.frames():
+            yield mono, position
+
+    def frames(self) -> Iterator[Tuple[np.ndarray, np.ndarray, float]]:
+        """
+        Yield ``(native_block, mono_block, seconds_read_so_far)``.
+
+        ``native_block`` is the decoded ``(samples, channels)`` block at the
+        file's own rate, for consumers such as the loudness meter that must
+        not see the downmixed, decimated signal.
+        """
+        sos = zi = None
+        if self.factor > 1:
+            sos = signal.butter(8, 0.45 * self.sr, "lp", fs=self.native_sr, output="sos")
+            zi = np.zeros((sos.shape[0], 2))
+        read = 0
+        for block in sf.blocks(self.path, blocksize=self.blocksize, dtype="float32", always_2d=True):
+            mono = block.mean(axis=1)
+            read += len(mono)
+            if sos is not None:
+                mono, zi = signal.sosfilt(sos, mono, zi=zi)
+                mono = mono[:: self.factor].astype(np.float32)
+            yield block, mono, read / self.native_sr
+
+
+class GrowingFileDecoder:
+    """
+    Decode a file to mono at ``target_sr`` while it is still being written.
+
+    Call :meth:`advance` whenever more of the file has arrived and
+    :meth:`finish` once it is complete, possibly under its final name.
+    libsndfile only sees the frames present when a file is opened, so each
+    pass reopens it and seeks to where the previous one stopped. Resampling
+    streams through soxr at the configured resampler tier (see
+    :mod:`engine.decode`), so the result matches loading the finished file
+    to within resampler rounding at block edges, not bit for bit; the result
+    cache keys on the file's content, so both paths share entries.
+    Compressed files cannot be read before they are complete;
+    :attr:`supported` turns false and they are left to a normal load.
+    """
+
+    def __init__(self, target_sr: int = 22050, block_frames: int = 1 << 16) -> None:
+        self.target_sr = target_sr
+        self.block_frames = block_frames
+        self.quality = decode.RESAMPLER_TIERS[decode.get_settings().tier]
+        # None until the header has arrived
+        self.supported: Optional[bool] = None
+        self._position = 0
+        self._resampler: Optional[soxr.ResampleStream] = None
+        self._blocks: List[np.ndarray] = []
+
+    def advance(self, path: str) -> None:
+        """Decode the frames of ``path`` written since the last call."""
+        if self.supported is False:
+            return
+        try:
+            handle = sf.SoundFile(path)
+        except RuntimeError:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            if self.supported is None and size >= GROWING_HEADER_BYTES:
+                self.supported = False
+            return
+        with handle:
+            if self.supported is None:
+                self.supported = handle.format in GROWING_FORMATS and handle.subtype in GROWING_SUBTYPES
+                if not self.supported:
+                    return
+                if handle.samplerate != self.target_sr:
+                    self._resampler = soxr.ResampleStream(
+                        handle.samplerate, self.target_sr, 1, dtype="float32", quality=self.quality
+                    )
+            handle.seek(self._position)
+            while True:
+                block = handle.read(self.block_frames, dtype="float32", always_2d=True)
+                if not len(block):
+                    break
+                self._position += len(block)
+                mono = block.mean(axis=1)
+                self._blocks.append(self._resampler.resample_chunk(mono) if self._resampler else mono)
+
+    def finish(self, path: str) -> Optional[Tuple[np.ndarray, int]]:
+        """Decode the rest of the complete file; ``(y, sr)``, or ``None`` if it is not supported."""
+        self.advance(path)
+        if not self.supported:
+            return None
+        if self._resampler is not None:
+            self._blocks.append(self._resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+        y = np.concatenate(self._blocks) if self._blocks else np.zeros(0, dtype=np.float32)
+        self._blocks = []
+        return y, self.target_sr
+
+
+class StreamingAnalyzer:
+    """
+    Incremental onset/RMS/chroma/energy accumulators over a stream of blocks.
+
+    Frame features are reduced to roughly one-second buckets as they arrive,
+    and tempo/key/energy curves are emitted every ``step_seconds`` over the
+    trailing ``window_seconds``. The working set is one block plus a few
+    floats per second of audio, however long the input is.
+    """
+
+    def __init__(
+        self,
+        sr: int,
+        n_fft: int = 2048,
+        hop_length: int = 512,
+        window_seconds: float = 30.0,
+        step_seconds: float = 10.0,
+        texture_seconds: float = 30.0,
+    ) -> None:
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.frame_rate = sr / hop_length
+        self.bucket_frames = max(1, round(self.frame_rate))
+        self.bucket_rate = self.frame_rate / self.bucket_frames
+        self.window_buckets = max(1, round(window_seconds * self.bucket_rate))
+        self.step_buckets = max(1, round(step_seconds * self.bucket_rate))
+
+        self._fft_window = signal.get_window("hann", n_fft)
+        self._mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft)
+        self._chroma_basis = librosa.filters.chroma(sr=sr, n_fft=n_fft)
+        self._low_bins = int(np.searchsorted(np.fft.rfftfreq(n_fft, 1.0 / sr), 150.0))
+
+        self.n_samples = 0
+        self._carry = np.zeros(0, dtype=np.float32)
+        self._prev_mel_db: Optional[np.ndarray] = None
+        self._pending: Dict[str, List[np.ndarray]] = {"onset": [], "rms": [], "peak": [], "bass": [], "chroma": []}
+
+        self._onset_buckets: Deque[np.ndarray] = deque(maxlen=self.window_buckets)
+        self._chroma_buckets: Deque[np.ndarray] = deque(maxlen=self.window_buckets)
+        self._energy: List[float] = []
+        self._rms: List[float] = []
+        self._peaks: List[float] = []
+        self._bass: List[float] = []
+        self._chroma_total = np.zeros(12)
+        self.curves: List[Dict[str, Any]] = []
+
+        self._texture_frames = int(texture_seconds * self.frame_rate)
+        self._texture_mags: Optional[List[np.ndarray]] = []
+        self._texture_count = 0
+        self._texture: Optional[Tuple[str, str]] = None
+
+    def process(self, block: np.ndarray) -> None:
+        self.n_samples += len(block)
+        buffer = np.concatenate([self._carry, block])
+        if len(buffer) < self.n_fft:
+            self._carry = buffer
+            return
+        frames = librosa.util.frame(buffer, frame_length=self.n_fft, hop_length=self.hop_length)
+        consumed = frames.shape[1] * self.hop_length
+        self._carry = buffer[consumed:]
+        self._process_frames(frames)
+
+    def finish(self) -> StreamingSummary:
+        if len(self._carry):
+            tail = np.pad(self._carry, (0, self.n_fft - len(self._carry)))
+            self._carry = np.zeros(0, dtype=np.float32)
+            self._process_frames(librosa.util.frame(tail, frame_length=self.n_fft, hop_length=self.hop_length))
+        self._flush_buckets(final=True)
+        if self._texture is None:
+            self._finish_texture()
+
+        duration = self.n_samples / self.sr
+        energy = np.asarray(self._energy)
+        rms = np.asarray(self._rms)
+        intro_end, outro_start = analysis.mix_points_from_rms(rms, self.bucket_rate, duration)
+        texture, color = self._texture or ("Balanced", "Warm")
+        bpm = self._summary_bpm()
+        return StreamingSummary(
+            duration=duration,
+            bpm=bpm,
+            key=analysis.key_from_chroma(self._chroma_total) if self._chroma_total.any() else "",
+            texture=texture,
+            color=color,
+            drop_time=analysis.drop_from_energy(energy, self.bucket_rate) if len(energy) else None,
+            intro_end=intro_end,
+            outro_start=outro_start,
+            waveform=self._waveform(),
+            curves=self.curves,
+            sections=self._sections(bpm, duration),
+        )
+
+    def _process_frames(self, frames: np.ndarray) -> None:
+        mag = np.abs(np.fft.rfft(frames * self._fft_window[:, np.newaxis], axis=0))
+        power = mag**2
+
+        mel_db = librosa.power_to_db(self._mel_basis @ power, ref=1.0, top_db=None)
+        previous = self._prev_mel_db if self._prev_mel_db is not None else mel_db[:, :1]
+        diff = np.diff(np.concatenate([previous, mel_db], axis=1), axis=1)
+        self._prev_mel_db = mel_db[:, -1:]
+
+        chroma = self._chroma_basis @ power
+        chroma /= np.maximum(chroma.max(axis=0, keepdims=True), 1e-10)
+
+        self._pending["onset"].append(np.maximum(diff, 0.0).mean(axis=0))
+        self._pending["rms"].append(np.sqrt(np.mean(frames**2, axis=0)))
+        self._pending["peak"].append(np.abs(frames).max(axis=0))
+        self._pending["bass"].append(power[: self._low_bins].sum(axis=0) / np.maximum(power.sum(axis=0), 1e-12))
+        self._pending["chroma"].append(chroma)
+
+        if self._texture_mags is not None:
+            self._texture_mags.append(mag[:, : self._texture_frames - self._texture_count])
+            self._texture_count += self._texture_mags[-1].shape[1]
+            if self._texture_count >= self._texture_frames:
+                self._finish_texture()
+
+        self._flush_buckets()
+
+    def _flush_buckets(self, final: bool = False) -> None:
+        onset = np.concatenate(self._pending["onset"]) if self._pending["onset"] else np.zeros(0)
+        n_full = len(onset) // self.bucket_frames
+        n_buckets = n_full + (1 if final and len(onset) % self.bucket_frames else 0)
+        if n_buckets == 0:
+            return
+        rms = np.concatenate(self._pending["rms"])
+        peak = np.concatenate(self._pending["peak"])
+        bass = np.concatenate(self._pending["bass"])
+        chroma = np.concatenate(self._pending["chroma"], axis=1)
+
+        for index in range(n_buckets):
+            span = slice(index * self.bucket_frames, (index + 1) * self.bucket_frames)
+            bucket_onset = onset[span]
+            self._onset_buckets.append(bucket_onset)
+            bucket_chroma = chroma[:, span].sum(axis=1)
+            self._chroma_buckets.append(bucket_chroma)
+            self._chroma_total += bucket_chroma
+            self._energy.append(float(np.mean(bucket_onset * rms[span])))
+            self._rms.append(float(np.mean(rms[span])))
+            self._peaks.append(float(np.max(peak[span])))
+            self._bass.append(float(np.mean(bass[span])))
+            if len(self._rms) % self.step_buckets == 0 or (final and index == n_buckets - 1):
+                self._emit_curve_point()
+
+        consumed = n_buckets * self.bucket_frames
+        self._pending = {
+            "onset": [onset[consumed:]],
+            "rms": [rms[consumed:]],
+            "peak": [peak[consumed:]],
+            "bass": [bass[consumed:]],
+            "chroma": [chroma[:, consumed:]],
+        }
+
+    def _emit_curve_point(self) -> None:
+        onset = np.concatenate(self._onset_buckets)
+        tempo = librosa.feature.tempo(onset_envelope=onset, sr=self.sr, hop_length=self.hop_length)
+        step_rms = self._rms[-self.step_buckets :]
+        window_start = max(0, len(self._rms) - len(self._onset_buckets))
+        chroma = np.sum(self._chroma_buckets, axis=0)
+        estimate = key.estimate_key(chroma) if chroma.any() else None
+        self.curves.append(
+            {
+                "time": round(window_start / self.bucket_rate, 2),
+                "end": round(len(self._rms) / self.bucket_rate, 2),
+                "bpm": round(float(tempo[0]), 2) if tempo.size else 0.0,
+                "key": estimate.camelot if estimate else "",
+                "key_confidence": estimate.confidence if estimate else 0.0,
+                "energy_db": round(float(20 * np.log10(max(np.mean(step_rms), 1e-10))), 2),
+                "onset_strength": round(float(np.mean(onset)), 4),
+            }
+        )
+
+    def _finish_texture(self) -> None:
+        mags = self._texture_mags
+        self._texture_mags = None
+        if not mags:
+            return
+        mag = np.concatenate(mags, axis=1)
+        if mag.shape[1] == 0:
+            return
+        harmonic, percussive = librosa.decompose.hpss(mag)
+        harm_energy = np.mean(librosa.feature.rms(S=harmonic, frame_length=self.n_fft))
+        perc_energy = np.mean(librosa.feature.rms(S=percussive, frame_length=self.n_fft))
+        centroid = librosa.feature.spectral_centroid(S=mag, sr=self.sr, n_fft=self.n_fft)
+        self._texture = (
+            analysis.classify_texture(harm_energy, perc_energy),
+            analysis.classify_color(float(np.mean(centroid))),
+        )
+
+    def _sections(self, bpm: float, duration: float) -> List[Dict[str, Any]]:
+        """Sections over the ~1 s buckets, with bars approximated from the summary tempo."""
+        if bpm <= 0 or not self._rms:
+            return []
+        bar_buckets = max(1, round(segmentation.BEATS_PER_BAR * 60.0 / bpm * self.bucket_rate))
+        return segmentation.sections_from_features(
+            energy=np.asarray(self._rms),
+            bass=np.asarray(self._bass),
+            times=np.arange(len(self._rms)) / self.bucket_rate,
+            end_time=duration,
+            unit_per_bar=bar_buckets,
+        )
+
+    def _summary_bpm(self) -> float:
+        """Onset-strength-weighted median of the windowed tempo estimates."""
+        points = [point for point in self.curves if point["bpm"] > 0]
+        if not points:
+            return 0.0
+        bpms = np.array([point["bpm"] for point in points])
+        weights = np.array([point["onset_strength"] for point in points]) + 1e-9
+        order = np.argsort(bpms)
+        cumulative = np.cumsum(weights[order])
+        return float(bpms[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+
+    def _waveform(self, points: int = 150) -> List[float]:
+        peaks = np.asarray(self._peaks)
+        if len(peaks) == 0:
+            return [0.0] * points
+        if len(peaks) < points:
+            peaks = np.repeat(peaks, math.ceil(points / len(peaks)))
+        return generate_waveform(peaks, points)
+
+
+def analyze_stream(path: str, block_seconds: float = 10.0) -> StreamingSummary:
+    reader = BlockReader(path, block_seconds=block_seconds)
+    analyzer = StreamingAnalyzer(reader.sr)
+    for block, _ in reader:
+        analyzer.process(block)
+    return analyzer.finish()
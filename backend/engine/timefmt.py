@@ -0,0 +1,8 @@
+"""
+Display formatting of track positions, shared by the analysis modules.
+"""
+
+
+def format_time(seconds: float) -> str:
+    """``MM:SS`` of a position in seconds, as shown on mix points and sections."""
+    return f"{int(seconds // 60):02d}:{int(seconds % 60):02d}"
@@ -0,0 +1,175 @@
+import io
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import librosa
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# basic-pitch overlaps consecutive windows by this many output frames and
+# trims half of the overlap from each side when stitching them back.
+N_OVERLAPPING_FRAMES = 30
+
+
+@dataclass
+class Transcription:
+    # (start_s, end_s, midi_pitch, amplitude) per note
+    notes: List[Tuple[float, float, int, float]]
+    midi: bytes
+
+
+@dataclass
+class _TranscriptionJob:
+    audios: Dict[str, np.ndarray]
+    sr: int
+    future: Future = field(default_factory=Future)
+
+
+class TranscriptionEngine:
+    """
+    Resident basic-pitch model that transcribes batches of in-memory audio.
+
+    The model is loaded on first use and kept for the life of the process.
+    Every stem of every request that is queued when the worker wakes up is
+    cut into model windows and pushed through the network together, in
+    chunks of at most ``max_windows_per_batch`` windows.
+    """
+
+    def __init__(self, max_windows_per_batch: int = 64, batch_window_seconds: float = 0.05) -> None:
+        self.max_windows_per_batch = max(1, max_windows_per_batch)
+        self.batch_window_seconds = batch_window_seconds
+        self._queue: "queue.Queue[_TranscriptionJob]" = queue.Queue()
+        self._model = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, audios: Dict[str, np.ndarray], sr: int) -> Future:
+        """
+        Queue mono stems for transcription.
+
+        Args:
+            audios: Mapping of stem name to mono float audio.
+            sr: Sample rate of every array in ``audios``.
+
+        Returns:
+            A future resolving to a mapping of stem name to :class:`Transcription`.
+        """
+        self._ensure_started()
+        job = _TranscriptionJob(audios=dict(audios), sr=sr)
+        self._queue.put(job)
+        return job.future
+
+    def transcribe(self, audios: Dict[str, np.ndarray], sr: int) -> Dict[str, Transcription]:
+        return self.submit(audios, sr).result()
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="basic-pitch-transcription", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get(timeout=self.batch_window_seconds))
+                except queue.Empty:
+                    break
+            batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self._transcribe_batch(batch)
+            except Exception as exc:
+                logger.exception("Transcription batch of %d request(s) failed", len(batch))
+                for job in batch:
+                    job.future.set_exception(exc)
+                continue
+            for job, result in zip(batch, results):
+                job.future.set_result(result)
+
+    def _load_model(self):
+        if self._model is None:
+            os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+            from basic_pitch import ICASSP_2022_MODEL_PATH
+            from basic_pitch.inference import Model
+
+            logger.info("Loading basic-pitch model")
+            self._model = Model(ICASSP_2022_MODEL_PATH)
+        return self._model
+
+    def _transcribe_batch(self, batch: List[_TranscriptionJob]) -> List[Dict[str, Transcription]]:
+        from basic_pitch.constants import AUDIO_N_SAMPLES, AUDIO_SAMPLE_RATE, FFT_HOP
+        from basic_pitch.inference import unwrap_output
+        from basic_pitch.note_creation import model_output_to_notes
+
+        model = self._load_model()
+        overlap_len = N_OVERLAPPING_FRAMES * FFT_HOP
+        hop_size = AUDIO_N_SAMPLES - overlap_len
+
+        # Window every stem of every request, remembering which rows are whose.
+        spans: List[Tuple[int, str, int, int, int]] = []
+        windows: List[np.ndarray] = []
+        offset = 0
+        for job_index, job in enumerate(batch):
+            for name, audio in job.audios.items():
+                if job.sr != AUDIO_SAMPLE_RATE:
+                    audio = librosa.resample(audio, orig_sr=job.sr, target_sr=AUDIO_SAMPLE_RATE)
+                stem_windows = _window(audio.astype(np.float32, copy=False), overlap_len, hop_size, AUDIO_N_SAMPLES)
+                windows.append(stem_windows)
+                spans.append((job_index, name, offset, offset + len(stem_windows), len(audio)))
+                offset += len(stem_windows)
+
+        stacked = np.concatenate(windows)[..., np.newaxis]
+        outputs: Dict[str, List[np.ndarray]] = {}
+        for start in range(0, len(stacked), self.max_windows_per_batch):
+            predicted = model.predict(stacked[start : start + self.max_windows_per_batch])
+            for key, value in predicted.items():
+                outputs.setdefault(key, []).append(np.asarray(value))
+        merged = {key: np.concatenate(parts) for key, parts in outputs.items()}
+        logger.info("Transcribed %d window(s) across %d stem(s)", len(stacked), len(spans))
+
+        results: List[Dict[str, Transcription]] = [{} for _ in batch]
+        for job_index, name, start, end, n_samples in spans:
+            model_output = {
+                key: unwrap_output(value[start:end], n_samples, N_OVERLAPPING_FRAMES)
+                for key, value in merged.items()
+            }
+            midi_data, note_events = model_output_to_notes(model_output, onset_thresh=0.5, frame_thresh=0.3)
+            buffer = io.BytesIO()
+            midi_data.write(buffer)
+            results[job_index][name] = Transcription(
+                notes=[(float(n[0]), float(n[1]), int(n[2]), float(n[3])) for n in note_events],
+                midi=buffer.getvalue(),
+            )
+        return results
+
+
+def _window(audio: np.ndarray, overlap_len: int, hop_size: int, window_len: int) -> np.ndarray:
+    """Cut audio into the overlapping, zero-padded windows basic-pitch expects."""
+    padded = np.concatenate([np.zeros(overlap_len // 2, dtype=np.float32), audio])
+    n_windows = max(1, -(-len(padded) // hop_size))
+    total = (n_windows - 1) * hop_size + window_len
+    padded = np.pad(padded, (0, max(0, total - len(padded))))
+    return np.lib.stride_tricks.sliding_window_view(padded, window_len)[::hop_size][:n_windows]
+
+
+_engine: Optional[TranscriptionEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_transcription_engine() -> TranscriptionEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = TranscriptionEngine()
+        return _engine
@@ -1,41 +1,103 @@
+"""
+Result and stream message types.
+
+Messages serialize to either wire format at the edge: NDJSON (one JSON
+object per line, the default) or MessagePack, where each message is one map
+and waveforms travel as packed little-endian float32 arrays (extension type
+:data:`FLOAT32_EXT`) instead of hundreds of decimal strings.
+"""
+
 import json
-from dataclasses import asdict, dataclass, field
-from typing import Any, Dict, List, Optional
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+# MessagePack extension type of a packed ``<f4`` array
+FLOAT32_EXT = 1
+
+
+class _Message(ABC):
+    """Wire encodings shared by the stream messages; subclasses provide ``to_dict``."""
+
+    __slots__ = ()
+
+    @abstractmethod
+    def to_dict(self) -> Dict[str, Any]:
+        ...
+
+    def to_ndjson(self) -> str:
+        return _to_ndjson(self.to_dict())
 
+    def to_msgpack(self) -> bytes:
+        return _to_msgpack(self._packed_dict())
 
-@dataclass
-class ProgressMessage:
+    def _packed_dict(self) -> Dict[str, Any]:
+        return self.to_dict()
+
+
+@dataclass(slots=True)
+class ProgressMessage(_Message):
     message: str
     percent: int
     type: str = "progress"
 
-    def to_ndjson(self) -> str:
-        return _to_ndjson(asdict(self))
+    def to_dict(self) -> Dict[str, Any]:
+        return {"message": self.message, "percent": self.percent, "type": self.type}
 
 
-@dataclass
-class ErrorMessage:
+@dataclass(slots=True)
+class ErrorMessage(_Message):
     message: str
     type: str = "error"
 
-    def to_ndjson(self) -> str:
-        return _to_ndjson(asdict(self))
+    def to_dict(self) -> Dict[str, Any]:
+        return {"message": self.message, "type": self.type}
+
+
+@dataclass(slots=True)
+class PartialMessage(_Message):
+    """
+    Part of the result, sent as soon as it is known.
+
+    ``stage`` says which part: ``summary`` (tempo, key, character, waveform,
+    mix points), ``stem`` (one stem's waveform), ``stem_files``, ``cues`` or
+    ``midi``. The final ``complete`` message still carries everything.
+    """
+
+    stage: str
+    data: Dict[str, Any]
+    type: str = "partial"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"stage": self.stage, "data": self.data, "type": self.type}
+
+    def _packed_dict(self) -> Dict[str, Any]:
+        data = self.data
+        if "waveform" in data:
+            data = {**data, "waveform": pack_floats(data["waveform"])}
+        return {"stage": self.stage, "data": data, "type": self.type}
 
 
-@dataclass
+@dataclass(slots=True)
 class MixPoints:
     intro_end: str
     outro_start: str
     drop: Optional[str]
 
+    def to_dict(self) -> Dict[str, Any]:
+        return {"intro_end": self.intro_end, "outro_start": self.outro_start, "drop": self.drop}
+
 
-@dataclass
+@dataclass(slots=True)
 class AnalysisResult:
     bpm: int
     key: str
     texture: str
     color: str
-    loudness: float
+    # Integrated LUFS; None when the loudness stage did not run or failed
+    loudness: Optional[float]
     mix_points: MixPoints
     waveform: List[float]
     stems: Dict[str, List[float]]
@@ -44,16 +106,76 @@ class AnalysisResult:
     cues: List[Dict[str, Any]]
     meta: Dict[str, Any] = field(default_factory=dict)
     genre: str = ""
+    # Labelled intro/verse/chorus/breakdown/drop/outro ranges over the whole track
+    sections: List[Dict[str, Any]] = field(default_factory=list)
+    # Time-resolved tempo/key/energy, only produced by the streaming mix mode
+    curves: Optional[List[Dict[str, Any]]] = None
+    # BS.1770 summary and 1 Hz curves for the full mix, summaries per stem
+    loudness_detail: Optional[Dict[str, Any]] = None
+    stem_loudness: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    # Role ("main" or stem label) -> .peaks file served by /waveform/<file>
+    peak_files: Dict[str, str] = field(default_factory=dict)
+    # Key estimate with confidence margin, runner-up and windowed key curve
+    key_detail: Optional[Dict[str, Any]] = None
+    # Stages analyze_audio ran (see engine.stages); None for the streaming mix mode
+    stages: Optional[List[str]] = None
+    # File name -> content hash of the main file, stems and MIDI; /audio/<file>?v=<hash>
+    # is served as immutable
+    file_hashes: Dict[str, str] = field(default_factory=dict)
+    # Per-stage wall/CPU seconds and peak RSS of the run that produced this
+    # response; only present when requested and never cached
+    timings: Optional[Dict[str, Dict[str, float]]] = None
 
     def to_dict(self) -> Dict[str, Any]:
-        data = asdict(self)
-        data["mix_points"] = asdict(self.mix_points)
+        """Plain fields for JSON; shares the result's lists and dicts rather than copying them."""
+        data = {name: getattr(self, name) for name in _RESULT_FIELDS}
+        data["mix_points"] = self.mix_points.to_dict()
         return data
 
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AnalysisResult":
+        fields = dict(data)
+        fields["mix_points"] = MixPoints(**fields["mix_points"])
+        return cls(**fields)
+
+
+_RESULT_FIELDS = tuple(f.name for f in fields(AnalysisResult))
+
+
+@dataclass(slots=True)
+class CompleteMessage(_Message):
+    result: AnalysisResult
+    type: str = "complete"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "data": self.result.to_dict()}
 
-def complete_message(result: AnalysisResult) -> str:
-    return _to_ndjson({"type": "complete", "data": result.to_dict()})
+    def _packed_dict(self) -> Dict[str, Any]:
+        data = self.result.to_dict()
+        data["waveform"] = pack_floats(data["waveform"])
+        data["stems"] = {name: pack_floats(values) for name, values in data["stems"].items()}
+        return {"type": self.type, "data": data}
+
+
+Message = Union[ProgressMessage, ErrorMessage, PartialMessage, CompleteMessage]
+
+
+def complete_message(result: AnalysisResult) -> CompleteMessage:
+    return CompleteMessage(result)
+
+
+def pack_floats(values: Sequence[float]) -> Any:
+    """A float sequence as a MessagePack ``FLOAT32_EXT`` extension value."""
+    import msgpack
+
+    return msgpack.ExtType(FLOAT32_EXT, np.asarray(values, dtype="<f4").tobytes())
 
 
 def _to_ndjson(payload: Dict[str, Any]) -> str:
     return json.dumps(payload) + "\n"
+
+
+def _to_msgpack(payload: Dict[str, Any]) -> bytes:
+    import msgpack
+
+    return msgpack.packb(payload, use_bin_type=True)
@@ -0,0 +1,242 @@
+"""
+Batch ingestion of a music library into the local SQLite store.
+
+Usage:
+    python ingest.py run /path/to/crates [--workers 4] [--model htdemucs_6s]
+    python ingest.py query --bpm 122-128 --key 8A --key 9A
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import (
+    ALLOWED_MODELS,
+    DEFAULT_MODEL,
+    INGEST_WORKERS,
+    LIBRARY_ARTIFACT_FOLDER,
+    LIBRARY_DB_PATH,
+    METADATA_CACHE_FOLDER,
+    METADATA_CACHE_TTL_SECONDS,
+    METADATA_ENDPOINT,
+    METADATA_MIN_INTERVAL_SECONDS,
+    RESULT_CACHE_FOLDER,
+    RESAMPLER_TIER,
+    RESULT_CACHE_MAX_BYTES,
+    SEPARATION_CHUNK_SECONDS,
+    SEPARATION_CHUNKED,
+    SEPARATION_OVERLAP_SECONDS,
+    SEPARATION_THREADS_PER_WORKER,
+    SEPARATION_WORKERS,
+    STEM_FORMAT,
+    STEM_WORKERS,
+)
+from library import LibraryStore
+
+logger = logging.getLogger("ingest")
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".flac", ".aiff", ".aif", ".m4a", ".ogg", ".opus"}
+
+
+def find_tracks(root: str) -> Iterator[str]:
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                yield os.path.abspath(os.path.join(dirpath, name))
+
+
+def init_worker(workers: int) -> None:
+    """Share the metadata cache, and split the request and separation budgets between worker processes."""
+    import engine
+
+    # Each track is decoded once per ingest; caching its PCM would only fill
+    # the music folders with .npy files.
+    engine.configure_decoding(cache=False, tier=RESAMPLER_TIER)
+    engine.configure_stem_pool(max(1, STEM_WORKERS // workers))
+    engine.configure_metadata(
+        endpoint=METADATA_ENDPOINT,
+        cache_dir=METADATA_CACHE_FOLDER,
+        ttl_seconds=METADATA_CACHE_TTL_SECONDS,
+        min_interval_seconds=METADATA_MIN_INTERVAL_SECONDS * workers,
+    )
+    if SEPARATION_CHUNKED:
+        engine.configure_separation(
+            chunking=engine.ChunkSettings(
+                chunk_seconds=SEPARATION_CHUNK_SECONDS,
+                overlap_seconds=SEPARATION_OVERLAP_SECONDS,
+                workers=max(1, SEPARATION_WORKERS // workers),
+                threads_per_worker=SEPARATION_THREADS_PER_WORKER,
+            )
+        )
+
+
+def analyze_track(path: str, model_name: str, artifact_root: str) -> Dict[str, Any]:
+    """Run the engine on one track inside a pool worker."""
+    import engine
+
+    # Tracks from different crates can share a file name; give each its own folder.
+    output_dir = os.path.join(artifact_root, hashlib.sha1(path.encode("utf-8")).hexdigest()[:16])
+    os.makedirs(output_dir, exist_ok=True)
+    cache = engine.ResultCache(RESULT_CACHE_FOLDER, max_bytes=RESULT_CACHE_MAX_BYTES)
+
+    started = time.perf_counter()
+    outcome: Dict[str, Any] = {"path": path, "result": None, "error": None, "stage_seconds": {}}
+    try:
+        for message in engine.analyze_audio(
+            path,
+            model_name=model_name,
+            cache=cache,
+            output_dir=output_dir,
+            include_timings=True,
+            stem_format=STEM_FORMAT,
+        ):
+            if message.type == "complete":
+                result = message.result.to_dict()
+                timings = result.pop("timings", None) or {}
+                outcome["result"] = result
+                outcome["stage_seconds"] = {name: entry["wall_seconds"] for name, entry in timings.items()}
+            elif message.type == "error":
+                outcome["error"] = message.message
+    except Exception as exc:
+        logger.exception("Analysis crashed for %s", path)
+        outcome["error"] = f"Analysis crashed: {exc}"
+    if outcome["result"] is None and outcome["error"] is None:
+        outcome["error"] = "Analysis produced no result"
+    outcome["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return outcome
+
+
+def run(args: argparse.Namespace) -> int:
+    from engine.cache import ENGINE_VERSION
+
+    store = LibraryStore(args.db)
+    done = store.completed(ENGINE_VERSION, include_failed=not args.retry_failed)
+
+    todo: List[Tuple[str, int, float]] = []
+    skipped = 0
+    for path in find_tracks(args.root):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if done.get(path) == (stat.st_size, stat.st_mtime):
+            skipped += 1
+            continue
+        todo.append((path, stat.st_size, stat.st_mtime))
+
+    logger.info("%d track(s) to analyze, %d already done", len(todo), skipped)
+    if not todo:
+        store.close()
+        return 0
+
+    os.makedirs(args.artifacts, exist_ok=True)
+    totals: Dict[str, float] = defaultdict(float)
+    completed = failed = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(args.workers,),
+    ) as pool:
+        futures = {
+            pool.submit(analyze_track, path, args.model, args.artifacts): (path, size, mtime)
+            for path, size, mtime in todo
+        }
+        for future in as_completed(futures):
+            path, size, mtime = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as exc:
+                outcome = {"error": f"Worker failed: {exc}", "elapsed_seconds": 0.0, "stage_seconds": {}}
+
+            if outcome["error"] is None:
+                store.record_result(
+                    path, size, mtime, ENGINE_VERSION,
+                    outcome["result"], outcome["stage_seconds"], outcome["elapsed_seconds"],
+                )
+                completed += 1
+                for name, seconds in outcome["stage_seconds"].items():
+                    totals[name] += seconds
+            else:
+                store.record_failure(path, size, mtime, ENGINE_VERSION, outcome["error"], outcome["elapsed_seconds"])
+                failed += 1
+                logger.warning("Failed %s: %s", path, outcome["error"])
+
+            handled = completed + failed
+            elapsed = time.perf_counter() - started
+            rate = handled / elapsed * 60 if elapsed > 0 else 0.0
+            remaining = (len(todo) - handled) / rate if rate > 0 else 0.0
+            logger.info(
+                "[%d/%d] %.1f tracks/min, ~%.0f min left (%d failed)",
+                handled, len(todo), rate, remaining, failed,
+            )
+
+    elapsed = time.perf_counter() - started
+    store.close()
+    print(f"Analyzed {completed} track(s), {failed} failed, in {elapsed:.1f}s "
+          f"({(completed + failed) / elapsed * 60 if elapsed else 0.0:.2f} tracks/min)")
+    if completed:
+        print("Mean seconds per track by stage:")
+        for name, seconds in sorted(totals.items(), key=lambda item: -item[1]):
+            print(f"  {name:<40} {seconds / completed:8.2f}")
+    return 1 if failed else 0
+
+
+def query(args: argparse.Namespace) -> int:
+    bpm_min, bpm_max = _parse_range(args.bpm)
+    store = LibraryStore(args.db)
+    rows = store.query(bpm_min=bpm_min, bpm_max=bpm_max, keys=args.key, text=args.text, limit=args.limit)
+    store.close()
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    for row in rows:
+        label = " - ".join(part for part in (row["artist"], row["title"]) if part) or os.path.basename(row["path"])
+        print(f"{row['bpm'] or 0:>4} {row['key'] or '?':>4}  {label}  [{row['path']}]")
+    return 0
+
+
+def _parse_range(value: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    if not value:
+        return None, None
+    low, _, high = value.partition("-")
+    return int(low), int(high or low)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Analyze a music library into a local SQLite store.")
+    parser.add_argument("--db", default=LIBRARY_DB_PATH, help="SQLite store path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Analyze every audio file under a directory")
+    run_parser.add_argument("root")
+    run_parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    run_parser.add_argument("--model", default=DEFAULT_MODEL, choices=sorted(ALLOWED_MODELS))
+    run_parser.add_argument("--artifacts", default=LIBRARY_ARTIFACT_FOLDER, help="Where stems and MIDI are written")
+    run_parser.add_argument("--retry-failed", action="store_true", help="Re-run tracks that failed before")
+    run_parser.set_defaults(func=run)
+
+    query_parser = commands.add_parser("query", help="Search analyzed tracks")
+    query_parser.add_argument("--bpm", help="BPM or range, e.g. 124 or 122-128")
+    query_parser.add_argument("--key", action="append", help="Camelot key, repeatable")
+    query_parser.add_argument("--text", help="Match path, artist or title")
+    query_parser.add_argument("--limit", type=int, default=100)
+    query_parser.add_argument("--json", action="store_true")
+    query_parser.set_defaults(func=query)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional
+from uuid import uuid4
+
+from engine.types import ErrorMessage, Message
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETE = "complete"
+FAILED = "failed"
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+@dataclass
+class Job:
+    params: Dict[str, Any]
+    id: str = field(default_factory=lambda: uuid4().hex)
+    state: str = QUEUED
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    events: List[Message] = field(default_factory=list)
+    _cond: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (COMPLETE, FAILED)
+
+    def append(self, message: Message) -> None:
+        with self._cond:
+            self.events.append(message)
+            self._cond.notify_all()
+
+    def finish(self, state: str) -> None:
+        with self._cond:
+            self.state = state
+            self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def iter_events(self, offset: int = 0, poll_seconds: float = 15.0) -> Iterator[Message]:
+        """
+        Yield events from ``offset`` onwards, blocking for new ones until the job ends.
+
+        Args:
+            offset: Index of the first event to replay.
+            poll_seconds: How long to wait for a new event before re-checking.
+        """
+        position = max(offset, 0)
+        while True:
+            with self._cond:
+                while position >= len(self.events) and not self.finished:
+                    self._cond.wait(timeout=poll_seconds)
+                pending = self.events[position:]
+                done = self.finished
+            yield from pending
+            position += len(pending)
+            if done and position >= len(self.events):
+                return
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "wait_seconds": _elapsed(self.submitted_at, self.started_at),
+            "run_seconds": _elapsed(self.started_at, self.finished_at) if self.started_at else None,
+            "events": len(self.events),
+        }
+
+
+class JobManager:
+    """
+    Fixed-size worker pool that runs analysis jobs independently of any request.
+
+    Submissions beyond ``max_queue_depth`` waiting jobs are rejected with
+    :class:`QueueFullError` so a burst of uploads cannot queue unbounded work.
+    Finished jobs are kept for ``retention_seconds`` so clients can reconnect
+    and replay their event stream.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[Job], Iterable[Message]],
+        workers: int = 2,
+        max_queue_depth: int = 8,
+        retention_seconds: int = 60 * 60,
+    ) -> None:
+        self.runner = runner
+        self.workers = max(1, workers)
+        self.max_queue_depth = max_queue_depth
+        self.retention_seconds = retention_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._queue: "queue.Queue[Job]" = queue.Queue()
+        self._waits: Deque[float] = deque(maxlen=100)
+        self._running = 0
+        self._lock = threading.Lock()
+        for index in range(self.workers):
+            threading.Thread(target=self._work, name=f"analysis-worker-{index}", daemon=True).start()
+
+    def submit(self, **params: Any) -> Job:
+        with self._lock:
+            self._prune()
+            if self._queue.qsize() >= self.max_queue_depth:
+                raise QueueFullError(f"Analysis queue is full ({self.max_queue_depth} jobs waiting)")
+            job = Job(params=params)
+            self._jobs[job.id] = job
+            self._queue.put(job)
+        logger.info("Queued job %s (%d waiting)", job.id, self._queue.qsize())
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            waiting = [job for job in self._jobs.values() if job.state == QUEUED]
+            recent_waits = list(self._waits)
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queue_depth": len(waiting),
+                "max_queue_depth": self.max_queue_depth,
+                "oldest_wait_seconds": round(max((now - job.submitted_at for job in waiting), default=0.0), 3),
+                "avg_wait_seconds": round(sum(recent_waits) / len(recent_waits), 3) if recent_waits else 0.0,
+                "retained_jobs": len(self._jobs),
+            }
+
+    def retry_after_seconds(self) -> int:
+        """Rough hint for how long a rejected client should back off."""
+        stats = self.stats()
+        return max(1, int(stats["avg_wait_seconds"] or 5))
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._running += 1
+                job.state = RUNNING
+                job.started_at = time.time()
+                self._waits.append(job.started_at - job.submitted_at)
+
+            state = FAILED
+            try:
+                for message in self.runner(job):
+                    job.append(message)
+                    if message.type == COMPLETE:
+                        state = COMPLETE
+            except Exception as exc:
+                logger.exception("Job %s crashed", job.id)
+                job.append(ErrorMessage(message=f"Job failed: {exc}"))
+            finally:
+                job.finish(state)
+                with self._lock:
+                    self._running -= 1
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+def _elapsed(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    if start is None:
+        return None
+    return round((end if end is not None else time.time()) - start, 3)
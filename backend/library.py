@@ -0,0 +1,173 @@
+import json
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    status TEXT NOT NULL,
+    engine_version TEXT NOT NULL,
+    bpm INTEGER,
+    key TEXT,
+    genre TEXT,
+    loudness REAL,
+    artist TEXT,
+    title TEXT,
+    result TEXT,
+    error TEXT,
+    stage_seconds TEXT,
+    elapsed_seconds REAL,
+    analyzed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tracks_bpm ON tracks (bpm);
+CREATE INDEX IF NOT EXISTS tracks_key ON tracks (key);
+CREATE INDEX IF NOT EXISTS tracks_status ON tracks (status);
+"""
+
+
+class LibraryStore:
+    """
+    SQLite store of AnalysisResult records for a music library.
+
+    Every finished track is committed immediately, so the table doubles as the
+    ingestion checkpoint: a restarted run skips whatever is already recorded
+    as done for the same file size, mtime and engine version.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def completed(self, engine_version: str, include_failed: bool = False) -> Dict[str, tuple]:
+        """Map of path -> (size, mtime) for tracks already handled by this engine version."""
+        statuses = (DONE, FAILED) if include_failed else (DONE,)
+        rows = self._conn.execute(
+            f"SELECT path, size, mtime FROM tracks WHERE engine_version = ? "
+            f"AND status IN ({', '.join('?' for _ in statuses)})",
+            (engine_version, *statuses),
+        )
+        return {row["path"]: (row["size"], row["mtime"]) for row in rows}
+
+    def record_result(
+        self,
+        path: str,
+        size: int,
+        mtime: float,
+        engine_version: str,
+        result: Dict[str, Any],
+        stage_seconds: Dict[str, float],
+        elapsed_seconds: float,
+    ) -> None:
+        meta = result.get("meta") or {}
+        self._upsert(
+            path=path,
+            size=size,
+            mtime=mtime,
+            status=DONE,
+            engine_version=engine_version,
+            bpm=result.get("bpm"),
+            key=result.get("key"),
+            genre=result.get("genre"),
+            loudness=result.get("loudness"),
+            artist=meta.get("artist"),
+            title=meta.get("title"),
+            result=json.dumps(result),
+            error=None,
+            stage_seconds=json.dumps(stage_seconds),
+            elapsed_seconds=elapsed_seconds,
+        )
+
+    def record_failure(
+        self,
+        path: str,
+        size: int,
+        mtime: float,
+        engine_version: str,
+        error: str,
+        elapsed_seconds: float,
+    ) -> None:
+        self._upsert(
+            path=path,
+            size=size,
+            mtime=mtime,
+            status=FAILED,
+            engine_version=engine_version,
+            bpm=None,
+            key=None,
+            genre=None,
+            loudness=None,
+            artist=None,
+            title=None,
+            result=None,
+            error=error,
+            stage_seconds=None,
+            elapsed_seconds=elapsed_seconds,
+        )
+
+    def query(
+        self,
+        bpm_min: Optional[int] = None,
+        bpm_max: Optional[int] = None,
+        keys: Optional[Iterable[str]] = None,
+        text: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """
+        Find analyzed tracks by tempo range, Camelot key and artist/title text.
+
+        Args:
+            bpm_min: Inclusive lower BPM bound.
+            bpm_max: Inclusive upper BPM bound.
+            keys: Camelot keys to match, e.g. ``["8A", "9A"]``.
+            text: Substring matched against path, artist and title.
+            limit: Maximum number of rows returned.
+        """
+        clauses = ["status = ?"]
+        params: List[Any] = [DONE]
+        if bpm_min is not None:
+            clauses.append("bpm >= ?")
+            params.append(bpm_min)
+        if bpm_max is not None:
+            clauses.append("bpm <= ?")
+            params.append(bpm_max)
+        key_list = list(keys or [])
+        if key_list:
+            clauses.append(f"key IN ({', '.join('?' for _ in key_list)})")
+            params.extend(key_list)
+        if text:
+            clauses.append("(path LIKE ? OR artist LIKE ? OR title LIKE ?)")
+            params.extend([f"%{text}%"] * 3)
+        params.append(limit)
+        rows = self._conn.execute(
+            "SELECT path, bpm, key, genre, loudness, artist, title FROM tracks "
+            f"WHERE {' AND '.join(clauses)} ORDER BY bpm, key, path LIMIT ?",
+            params,
+        )
+        return [dict(row) for row in rows]
+
+    def get_result(self, path: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT result FROM tracks WHERE path = ? AND status = ?", (path, DONE)
+        ).fetchone()
+        return json.loads(row["result"]) if row and row["result"] else None
+
+    def _upsert(self, **row: Any) -> None:
+        row["analyzed_at"] = time.time()
+        columns = ", ".join(row)
+        placeholders = ", ".join(f":{name}" for name in row)
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO tracks ({columns}) VALUES ({placeholders})", row
+        )
+        self._conn.commit()
@@ -1,10 +1,38 @@
+import logging
 import os
-import shutil
+import re
+import sqlite3
+import threading
 import time
 from pathlib import Path
-from typing import Iterable
+from typing import Dict, Iterable, Optional
 
-from config import TEMP_FOLDER, TEMP_FILE_TTL_SECONDS, UPLOAD_FOLDER
+from config import TEMP_FOLDER, UPLOAD_FOLDER
+
+logger = logging.getLogger(__name__)
+
+# Uploads are saved as "<32 hex>_<name>" and every artifact derived from one
+# (stems, encodes, peaks, MIDI) starts with the same prefix.
+_UNIT_PATTERN = re.compile(r"^([0-9a-f]{32})_")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    unit TEXT NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_unit ON files (unit);
+CREATE TABLE IF NOT EXISTS units (
+    unit TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS units_last_access ON units (last_access);
+CREATE TABLE IF NOT EXISTS digests (
+    digest TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+"""
 
 
 def ensure_storage_dirs(directories: Iterable[str] | None = None) -> None:
@@ -19,24 +47,241 @@ def ensure_storage_dirs(directories: Iterable[str] | None = None) -> None:
         Path(folder).mkdir(parents=True, exist_ok=True)
 
 
-def cleanup_temp_storage() -> None:
-    """Remove the temporary audio directory on shutdown."""
-    temp_path = Path(TEMP_FOLDER)
-    if temp_path.exists():
-        shutil.rmtree(temp_path)
+def unit_of(filename: str) -> str:
+    """The analysis a file in temp storage belongs to: its upload prefix, or the file itself."""
+    match = _UNIT_PATTERN.match(filename)
+    return match.group(1) if match else filename
+
+
+class StorageManager:
+    """
+    SQLite index of temp storage, evicted one analysis at a time.
+
+    Each upload and everything derived from it form one unit. Units idle for
+    longer than ``ttl_seconds`` are removed, then least recently used units
+    until the directory fits in ``max_bytes``. Units of running analyses are
+    pinned. Requests only record accesses in memory; directory scans, index
+    writes for accesses and eviction all happen on a background thread.
+    The index lives on disk, so a restart keeps both files and LRU order.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        index_path: str,
+        max_bytes: int,
+        ttl_seconds: float,
+        scan_interval_seconds: float = 300.0,
+    ) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.scan_interval_seconds = scan_interval_seconds
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self._pinned: Dict[str, int] = {}
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="storage-manager", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def register(self, *filenames: str) -> None:
+        """Index new files in ``root`` (by name) and mark their units as just used."""
+        now = time.time()
+        rows = []
+        for filename in filenames:
+            try:
+                size = os.stat(os.path.join(self.root, filename)).st_size
+            except OSError:
+                continue
+            rows.append((filename, unit_of(filename), size))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO files (name, unit, bytes) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET bytes = excluded.bytes",
+                rows,
+            )
+            self._conn.executemany(
+                "INSERT INTO units (unit, created_at, last_access) VALUES (?, ?, ?) "
+                "ON CONFLICT(unit) DO UPDATE SET last_access = excluded.last_access",
+                [(unit, now, now) for unit in {row[1] for row in rows}],
+            )
+            self._conn.commit()
+            over_quota = self._total_bytes() > self.max_bytes
+        if over_quota:
+            self._wake.set()
 
+    def record_digest(self, filename: str, digest: str) -> None:
+        """Remember the content hash of an indexed upload, for :meth:`find_digest`."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO digests (digest, name) VALUES (?, ?) "
+                "ON CONFLICT(digest) DO UPDATE SET name = excluded.name",
+                (digest, filename),
+            )
+            self._conn.commit()
 
-def purge_old_temp_files() -> None:
-    """Remove stale files from temp storage to keep disk usage bounded."""
-    now = time.time()
-    temp_path = Path(TEMP_FOLDER)
-    if not temp_path.exists():
-        return
-    for entry in temp_path.iterdir():
+    def find_digest(self, digest: str) -> Optional[str]:
+        """Name of a stored upload with content hash ``digest``, if one is still on disk."""
+        with self._lock:
+            row = self._conn.execute("SELECT name FROM digests WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        if not os.path.isfile(os.path.join(self.root, row[0])):
+            with self._lock:
+                self._conn.execute("DELETE FROM digests WHERE digest = ?", (digest,))
+                self._conn.commit()
+            return None
+        self.touch(row[0])
+        return row[0]
+
+    def touch(self, filename: str) -> None:
+        """Record a read; written to the index by the background thread."""
+        with self._lock:
+            self._touched[unit_of(filename)] = time.time()
+
+    def pin(self, filename: str) -> None:
+        """Keep the unit of ``filename`` from eviction until :meth:`unpin`."""
+        unit = unit_of(filename)
+        with self._lock:
+            self._pinned[unit] = self._pinned.get(unit, 0) + 1
+
+    def unpin(self, filename: str) -> None:
+        unit = unit_of(filename)
+        with self._lock:
+            count = self._pinned.get(unit, 0) - 1
+            if count > 0:
+                self._pinned[unit] = count
+            else:
+                self._pinned.pop(unit, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            units = self._conn.execute("SELECT COUNT(*) FROM units").fetchone()[0]
+            return {
+                "units": units,
+                "bytes": self._total_bytes(),
+                "max_bytes": self.max_bytes,
+                "pinned": len(self._pinned),
+            }
+
+    def reconcile(self) -> None:
+        """Bring the index in line with the directory: add unknown files, drop vanished ones."""
         try:
-            if entry.is_file():
-                age = now - entry.stat().st_mtime
-                if age > TEMP_FILE_TTL_SECONDS:
-                    entry.unlink(missing_ok=True)
-        except OSError:
-            continue
+            on_disk = {
+                entry.name: entry.stat().st_size
+                for entry in os.scandir(self.root)
+                if entry.is_file() and not entry.name.endswith(".part")
+            }
+        except FileNotFoundError:
+            on_disk = {}
+        now = time.time()
+        with self._lock:
+            indexed = dict(self._conn.execute("SELECT name, bytes FROM files"))
+            # A file registered since the scan is not in it but still exists.
+            vanished = [
+                (name,)
+                for name in indexed.keys() - on_disk.keys()
+                if not os.path.exists(os.path.join(self.root, name))
+            ]
+            self._conn.executemany("DELETE FROM files WHERE name = ?", vanished)
+            self._conn.executemany(
+                "INSERT INTO files (name, unit, bytes) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET bytes = excluded.bytes",
+                [(name, unit_of(name), size) for name, size in on_disk.items() if indexed.get(name) != size],
+            )
+            # Files found by a scan count as used at the time of the scan.
+            self._conn.execute(
+                "INSERT OR IGNORE INTO units (unit, created_at, last_access) "
+                "SELECT DISTINCT unit, ?, ? FROM files",
+                (now, now),
+            )
+            self._conn.execute("DELETE FROM units WHERE unit NOT IN (SELECT unit FROM files)")
+            self._conn.execute("DELETE FROM digests WHERE name NOT IN (SELECT name FROM files)")
+            self._conn.commit()
+
+    def evict(self) -> int:
+        """Apply the TTL and the byte quota; returns the number of units removed."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._conn.executemany(
+                "UPDATE units SET last_access = MAX(last_access, ?) WHERE unit = ?",
+                [(when, unit) for unit, when in touched.items()],
+            )
+            self._conn.commit()
+            pinned = set(self._pinned)
+            total = self._total_bytes()
+            rows = self._conn.execute(
+                "SELECT units.unit, units.last_access, COALESCE(SUM(files.bytes), 0) "
+                "FROM units LEFT JOIN files ON files.unit = units.unit "
+                "GROUP BY units.unit ORDER BY units.last_access"
+            ).fetchall()
+
+        expired_before = time.time() - self.ttl_seconds
+        victims = []
+        for unit, last_access, size in rows:
+            if unit in pinned:
+                continue
+            if last_access < expired_before or total > self.max_bytes:
+                victims.append(unit)
+                total -= size
+        removed = [unit for unit in victims if self._remove_unit(unit)]
+        if removed:
+            logger.info("Evicted %d stored analysis unit(s)", len(removed))
+        return len(removed)
+
+    def _remove_unit(self, unit: str) -> bool:
+        """
+        Delete a unit's files and rows unless it was pinned or used since it was picked.
+
+        The check and the deletion share one hold of the lock, so a pin()
+        either lands first and saves the unit or waits until it is gone.
+        """
+        with self._lock:
+            if unit in self._pinned or unit in self._touched:
+                return False
+            names = [row[0] for row in self._conn.execute("SELECT name FROM files WHERE unit = ?", (unit,))]
+            for name in names:
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    logger.warning("Could not evict %s", name, exc_info=True)
+            self._conn.execute("DELETE FROM digests WHERE name IN (SELECT name FROM files WHERE unit = ?)", (unit,))
+            self._conn.execute("DELETE FROM files WHERE unit = ?", (unit,))
+            self._conn.execute("DELETE FROM units WHERE unit = ?", (unit,))
+            self._conn.commit()
+        return True
+
+    def _total_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM files").fetchone()[0]
+
+    def _run(self) -> None:
+        last_scan = 0.0
+        while not self._stopped.is_set():
+            try:
+                if time.monotonic() - last_scan >= self.scan_interval_seconds:
+                    self.reconcile()
+                    last_scan = time.monotonic()
+                self.evict()
+            except Exception:
+                logger.exception("Storage maintenance failed")
+            self._wake.wait(timeout=min(self.scan_interval_seconds, 60.0))
+            self._wake.clear()
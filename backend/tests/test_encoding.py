@@ -0,0 +1,66 @@
+"""
+Stored stem levels.
+
+Run from backend/: python -m pytest tests (or python -m unittest discover tests)
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import soundfile as sf
+
+from engine.encoding import FORMATS, headroom_gain, write_audio
+
+
+class HeadroomGainTest(unittest.TestCase):
+    def setUp(self) -> None:
+        rng = np.random.default_rng(0)
+        sr = 44100
+        t = np.arange(sr) / sr
+        # Overshooting stems, as Demucs produces, whose sum is the mix
+        self.stems = {
+            "drums": np.stack([1.6 * np.sin(2 * np.pi * 60 * t)] * 2).astype(np.float32),
+            "bass": np.stack([0.9 * np.sin(2 * np.pi * 110 * t)] * 2).astype(np.float32),
+            "other": (0.3 * rng.standard_normal((2, sr))).astype(np.float32),
+        }
+        self.mix = sum(self.stems.values())
+        self.sr = sr
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.workdir = workdir.name
+
+    def store(self, audio_format_name: str) -> dict:
+        audio_format = FORMATS[audio_format_name]
+        gain = headroom_gain(self.stems.values(), audio_format)
+        stored = {}
+        for name, audio in self.stems.items():
+            path = os.path.join(self.workdir, f"{name}{audio_format.extension}")
+            write_audio(path, audio * gain, self.sr)
+            stored[name] = sf.read(path, dtype="float32", always_2d=True)[0].T
+        return stored
+
+    def test_flac_stems_fit_full_scale_and_still_sum_to_the_mix(self) -> None:
+        gain = headroom_gain(self.stems.values(), FORMATS["flac"])
+        self.assertAlmostEqual(gain, 1 / max(float(np.abs(a).max()) for a in self.stems.values()), places=6)
+        stored = self.store("flac")
+        for audio in stored.values():
+            self.assertLessEqual(float(np.abs(audio).max()), 1.0)
+        np.testing.assert_allclose(sum(stored.values()), self.mix * gain, atol=1e-5)
+        # Every stem keeps its level relative to the others
+        for name, audio in stored.items():
+            np.testing.assert_allclose(audio, self.stems[name] * gain, atol=1e-5)
+
+    def test_float_wav_is_stored_unscaled(self) -> None:
+        self.assertEqual(headroom_gain(self.stems.values(), FORMATS["wav"]), 1.0)
+        stored = self.store("wav")
+        np.testing.assert_allclose(sum(stored.values()), self.mix, atol=1e-6)
+
+    def test_stems_in_range_are_left_alone(self) -> None:
+        quiet = [audio * 0.5 for audio in self.stems.values()]
+        self.assertEqual(headroom_gain(quiet, FORMATS["flac"]), 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+MetadataClient against a local HTTP stub standing in for MusicBrainz.
+
+Run from backend/: python -m pytest tests (or python -m unittest discover tests)
+"""
+
+import json
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from engine import metadata
+from engine.metadata import MetadataClient
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, delay_seconds: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", 0), _RecordingHandler)
+        self.delay_seconds = delay_seconds
+        # (monotonic arrival time, query) of every request
+        self.requests: List[Tuple[float, str]] = []
+        self.lock = threading.Lock()
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/ws/2/recording"
+
+    def queries(self) -> List[str]:
+        with self.lock:
+            return [query for _, query in self.requests]
+
+
+class _RecordingHandler(BaseHTTPRequestHandler):
+    server: _StubServer
+
+    def do_GET(self) -> None:
+        query = parse_qs(urlparse(self.path).query).get("query", [""])[0]
+        with self.server.lock:
+            self.server.requests.append((time.monotonic(), query))
+        time.sleep(self.server.delay_seconds)
+        body = json.dumps({"recordings": [{"title": query, "artist-credit": [{"artist": {"name": "Stub"}}]}]})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class MetadataClientTest(unittest.TestCase):
+    def start(self, delay_seconds: float = 0.0, **options) -> Tuple[_StubServer, MetadataClient]:
+        server = _StubServer(delay_seconds)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        cache = tempfile.TemporaryDirectory()
+        self.addCleanup(cache.cleanup)
+        client = MetadataClient(endpoint=server.endpoint, cache_dir=cache.name, **options)
+        self.addCleanup(client.close)
+        return server, client
+
+    def test_requests_are_spaced_by_the_rate_limit(self) -> None:
+        server, client = self.start(min_interval_seconds=0.2)
+        for name in ("first.mp3", "second.mp3", "third.mp3"):
+            self.assertEqual(client.lookup(name)["artist"], "Stub")
+        times = [arrived for arrived, _ in server.requests]
+        self.assertEqual(len(times), 3)
+        for earlier, later in zip(times, times[1:]):
+            self.assertGreaterEqual(later - earlier, 0.19)
+
+    def test_concurrent_identical_lookups_share_one_request(self) -> None:
+        server, client = self.start(delay_seconds=0.3, min_interval_seconds=0.0)
+        # Different upload prefixes normalize to the same query
+        names = [f"{index:032x}_Some Track.mp3" for index in range(6)]
+        futures = [client.submit(name) for name in names]
+        results = [future.result(timeout=5) for future in futures]
+        self.assertEqual(server.queries(), ["some track"])
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(results[0]["title"], "some track")
+
+    def test_disk_cache_serves_until_the_ttl_expires(self) -> None:
+        server, client = self.start(ttl_seconds=0.5, min_interval_seconds=0.0)
+        client.lookup("cached.mp3")
+        client.lookup("cached.mp3")
+        self.assertEqual(len(server.queries()), 1)
+        time.sleep(0.6)
+        client.lookup("cached.mp3")
+        self.assertEqual(server.queries(), ["cached", "cached"])
+
+    def test_reconfiguring_closes_the_previous_client(self) -> None:
+        server, _ = self.start()
+        first = metadata.configure_metadata(endpoint=server.endpoint)
+        second = metadata.configure_metadata(endpoint=server.endpoint)
+        self.addCleanup(second.close)
+        self.assertIs(metadata.get_metadata_client(), second)
+        with self.assertRaises(RuntimeError):
+            first.submit("late.mp3")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,245 @@
+"""
+Streaming, resumable uploads into temp storage.
+
+An upload is written to ``<name>.part`` chunk by chunk as the request body
+is read and hashed on the way, so finishing it needs no second pass over the
+file. A file can arrive in several ``PATCH`` requests; after a dropped
+connection the client asks for the offset the server holds and continues
+from there. A finished upload whose content hash matches a stored file is
+discarded in favour of that file, whose artifacts and cached analysis are
+then reused. Uncompressed WAV/AIFF is decoded while it arrives, so the
+analysis of a large file starts from audio that is already decoded.
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+import engine
+from storage import StorageManager
+
+logger = logging.getLogger(__name__)
+
+# Decoding during uploads; one pass per upload runs at a time
+_decoders = ThreadPoolExecutor(max_workers=2, thread_name_prefix="upload-decode")
+
+
+class UploadConflict(RuntimeError):
+    """Raised when a chunk does not start at the server's offset, or an upload is finished early."""
+
+    def __init__(self, message: str, offset: int) -> None:
+        super().__init__(message)
+        self.offset = offset
+
+
+@dataclass
+class Upload:
+    id: str
+    # Final name in the storage root; the partial file adds ".part"
+    name: str
+    size: Optional[int] = None
+    received: int = 0
+    updated_at: float = field(default_factory=time.time)
+    _hash: Any = field(default_factory=hashlib.sha256, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _decoder: engine.GrowingFileDecoder = field(default_factory=engine.GrowingFileDecoder, repr=False)
+    _decode_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _decode_task: Optional[Future] = field(default=None, repr=False)
+    _decoded_bytes: int = 0
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"upload_id": self.id, "offset": self.received, "size": self.size}
+
+
+@dataclass
+class FinishedUpload:
+    name: str
+    digest: str
+    # True when an identical file was already stored under ``name``
+    duplicate: bool = False
+    # Resolves to ``(y, sr)`` for FeatureContext, or None if not decodable early
+    decoded: Optional[Future] = None
+
+
+class UploadManager:
+    """Upload sessions writing into ``root`` and indexed in ``storage`` once complete."""
+
+    def __init__(
+        self,
+        root: str,
+        storage: StorageManager,
+        max_bytes: int,
+        session_ttl_seconds: float,
+        read_bytes: int = 1 << 20,
+        decode_step_bytes: int = 8 << 20,
+    ) -> None:
+        self.root = root
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.session_ttl_seconds = session_ttl_seconds
+        self.read_bytes = read_bytes
+        self.decode_step_bytes = decode_step_bytes
+        self._uploads: Dict[str, Upload] = {}
+        self._lock = threading.Lock()
+
+    def create(self, filename: str, size: Optional[int] = None) -> Upload:
+        """Open an upload of ``filename`` (already sanitized), optionally declaring its size."""
+        if size is not None and not 0 <= size <= self.max_bytes:
+            raise ValueError(f"Upload size must be between 0 and {self.max_bytes} bytes")
+        self.prune()
+        upload_id = uuid4().hex
+        upload = Upload(id=upload_id, name=f"{upload_id}_{filename}", size=size)
+        open(self._part_path(upload), "wb").close()
+        with self._lock:
+            self._uploads[upload.id] = upload
+        return upload
+
+    def get(self, upload_id: str) -> Optional[Upload]:
+        with self._lock:
+            return self._uploads.get(upload_id)
+
+    def append(self, upload: Upload, offset: int, stream: BinaryIO) -> int:
+        """
+        Write ``stream`` at ``offset``, which must be what the server already holds.
+
+        Returns the new offset. A broken connection keeps whatever arrived
+        intact, so the client can resume from the offset it then asks for.
+        """
+        if not upload._lock.acquire(blocking=False):
+            raise UploadConflict("Another chunk of this upload is being written", upload.received)
+        try:
+            if offset != upload.received:
+                raise UploadConflict(f"Expected offset {upload.received}, got {offset}", upload.received)
+            limit = upload.size if upload.size is not None else self.max_bytes
+            path = self._part_path(upload)
+            with open(path, "r+b") as handle:
+                handle.seek(upload.received)
+                try:
+                    for block in iter(lambda: stream.read(self.read_bytes), b""):
+                        if upload.received + len(block) > limit:
+                            raise ValueError(f"Upload exceeds {limit} bytes")
+                        handle.write(block)
+                        upload._hash.update(block)
+                        upload.received += len(block)
+                        upload.updated_at = time.time()
+                        self._schedule_decode(upload)
+                finally:
+                    # Drop a half-written block so the file matches the hash.
+                    handle.truncate(upload.received)
+            return upload.received
+        finally:
+            upload._lock.release()
+
+    def finish(self, upload: Upload) -> FinishedUpload:
+        """Close the upload and store it, or point at the stored copy of the same content."""
+        with upload._lock:
+            if upload.size is not None and upload.received != upload.size:
+                raise UploadConflict(f"Upload incomplete: {upload.received} of {upload.size} bytes", upload.received)
+            with self._lock:
+                self._uploads.pop(upload.id, None)
+            digest = upload._hash.hexdigest()[: engine.DIGEST_LENGTH]
+
+        # Windows cannot rename or delete a file a decode pass still has open.
+        self._wait_for_decode(upload)
+        part = self._part_path(upload)
+        existing = self.storage.find_digest(digest)
+        if existing is not None:
+            os.remove(part)
+            logger.info("Upload %s duplicates stored %s", upload.name, existing)
+            return FinishedUpload(name=existing, digest=digest, duplicate=True)
+
+        path = os.path.join(self.root, upload.name)
+        os.replace(part, path)
+        self.storage.register(upload.name)
+        self.storage.record_digest(upload.name, digest)
+        decoded = _decoders.submit(self._finish_decode, upload, path)
+        return FinishedUpload(name=upload.name, digest=digest, decoded=decoded)
+
+    def save(self, stream: BinaryIO, filename: str) -> FinishedUpload:
+        """
+        Store a whole file from ``stream`` in one go.
+
+        Transfer, hashing and decoding only overlap when ``stream`` is the
+        connection itself; a multipart file has already been received.
+        """
+        upload = self.create(filename)
+        try:
+            self.append(upload, 0, stream)
+        except Exception:
+            self.abort(upload)
+            raise
+        return self.finish(upload)
+
+    def abort(self, upload: Upload) -> None:
+        with self._lock:
+            self._uploads.pop(upload.id, None)
+        self._wait_for_decode(upload)
+        try:
+            os.remove(self._part_path(upload))
+        except FileNotFoundError:
+            pass
+
+    def prune(self) -> None:
+        """Drop sessions idle past the TTL, and partial files no session owns (e.g. after a restart)."""
+        cutoff = time.time() - self.session_ttl_seconds
+        with self._lock:
+            stale = [upload for upload in self._uploads.values() if upload.updated_at < cutoff]
+            live = {self._part_path(upload) for upload in self._uploads.values()}
+        for upload in stale:
+            logger.info("Dropping abandoned upload %s after %d bytes", upload.name, upload.received)
+            self.abort(upload)
+        for path in glob.glob(os.path.join(self.root, "*.part")):
+            try:
+                if path not in live and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "uploads": len(self._uploads),
+                "bytes": sum(upload.received for upload in self._uploads.values()),
+            }
+
+    def _part_path(self, upload: Upload) -> str:
+        return os.path.join(self.root, f"{upload.name}.part")
+
+    def _schedule_decode(self, upload: Upload) -> None:
+        if upload._decoder.supported is False:
+            return
+        if upload.received - upload._decoded_bytes < self.decode_step_bytes:
+            return
+        if upload._decode_task is not None and not upload._decode_task.done():
+            return
+        upload._decoded_bytes = upload.received
+        upload._decode_task = _decoders.submit(self._decode_step, upload, self._part_path(upload))
+
+    @staticmethod
+    def _wait_for_decode(upload: Upload) -> None:
+        task = upload._decode_task
+        if task is None:
+            return
+        try:
+            task.result()
+        except Exception:
+            logger.warning("Decode pass over %s failed", upload.name, exc_info=True)
+
+    @staticmethod
+    def _decode_step(upload: Upload, path: str) -> None:
+        with upload._decode_lock:
+            upload._decoder.advance(path)
+
+    @staticmethod
+    def _finish_decode(upload: Upload, path: str) -> Optional[Tuple[np.ndarray, int]]:
+        with upload._decode_lock:
+            return upload._decoder.finish(path)
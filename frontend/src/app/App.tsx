@@ -33,6 +33,98 @@ function AnimatedRoutes({ tracks, handleFile, handleReAnalyze, analyzing, progre
   );
 }
 
+const API_URL = 'http://localhost:5000';
+// Sent per PATCH; a dropped connection only costs the chunk in flight
+const UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024;
+const UPLOAD_RETRIES = 5;
+
+async function uploadOffset(uploadUrl: string): Promise<number> {
+  const response = await fetch(`${API_URL}${uploadUrl}`);
+  if (!response.ok) throw new Error(`Upload status failed with status ${response.status}`);
+  return (await response.json()).offset;
+}
+
+// Resumable chunked upload; the server decodes and hashes while it arrives
+async function uploadAndAnalyze(file: File, model: string): Promise<Response> {
+  const created = await fetch(`${API_URL}/uploads`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename: file.name, size: file.size }),
+  });
+  if (!created.ok) {
+    const err = await created.json().catch(() => ({}));
+    throw new Error(err?.error || `Upload failed with status ${created.status}`);
+  }
+  const { upload_url: uploadUrl } = await created.json();
+
+  let offset = 0;
+  let failures = 0;
+  while (offset < file.size) {
+    let response: Response | null = null;
+    try {
+      response = await fetch(`${API_URL}${uploadUrl}`, {
+        method: 'PATCH',
+        headers: { 'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream' },
+        body: file.slice(offset, offset + UPLOAD_CHUNK_BYTES),
+      });
+    } catch (err) {
+      if (++failures > UPLOAD_RETRIES) throw err;
+    }
+    if (response) {
+      const body = await response.json().catch(() => ({}));
+      // 409: the server holds a different offset; continue from there
+      if (response.ok || response.status === 409) {
+        // Same offset back means a previous attempt is still being written
+        if (!response.ok && body.offset === offset) await new Promise(resolve => setTimeout(resolve, 1000));
+        offset = body.offset;
+        failures = 0;
+        continue;
+      }
+      if (response.status < 500 || ++failures > UPLOAD_RETRIES) {
+        throw new Error(body?.error || `Upload failed with status ${response.status}`);
+      }
+    }
+    await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+    offset = await uploadOffset(uploadUrl).catch(() => offset);
+  }
+
+  const response = await fetch(`${API_URL}${uploadUrl}/analyze`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ model }),
+  });
+  if (!response.ok) {
+    const err = await response.json().catch(() => ({}));
+    throw new Error(err?.error || `Analyze failed with status ${response.status}`);
+  }
+  return response;
+}
+
+// Replace the track analysed from `filename`, or add it at the top
+function upsertTrack(tracks: any[], filename: string, update: (track: any) => any): any[] {
+  const exists = tracks.findIndex(t => t.meta?.filename === filename);
+  if (exists !== -1) {
+    const newTracks = [...tracks];
+    newTracks[exists] = update(tracks[exists]);
+    return newTracks;
+  }
+  return [update({ meta: { filename } }), ...tracks];
+}
+
+// Fold a `partial` message into the track it belongs to; `complete` later replaces it
+function mergePartial(track: any, msg: any): any {
+  if (msg.stage === 'stem') {
+    const { name, waveform, peaks } = msg.data;
+    return {
+      ...track,
+      stems: { ...track.stems, [name]: waveform },
+      peak_files: peaks ? { ...track.peak_files, [name]: peaks } : track.peak_files,
+    };
+  }
+  // summary, stem_files, cues and midi carry top-level result fields
+  return { ...track, ...msg.data };
+}
+
 export default function App() {
   const [tracks, setTracks] = useState<any[]>([]);
   const [analyzing, setAnalyzing] = useState(false);
@@ -43,19 +135,13 @@ export default function App() {
     console.log("[handleFile] Starting upload for:", file.name, "with model:", overrideModel || selectedModel);
     setAnalyzing(true);
     setProgressMessage("INITIATING SCAN...");
-    const formData = new FormData();
-    formData.append('file', file);
-    formData.append('model', overrideModel || selectedModel);
-
     try {
-      const response = await fetch('http://localhost:5000/analyze', {
-        method: 'POST',
-        body: formData,
-      });
+      const response = await uploadAndAnalyze(file, overrideModel || selectedModel);
 
       const reader = response.body?.getReader();
       const decoder = new TextDecoder();
       let buffer = '';
+      let trackName: string | undefined;
 
       if (reader) {
         while (true) {
@@ -73,17 +159,16 @@ export default function App() {
               const msg = JSON.parse(line);
               if (msg.type === 'progress') {
                 setProgressMessage(msg.message.toUpperCase());
+              } else if (msg.type === 'partial') {
+                // The summary names the file; later partials belong to the same track
+                if (msg.stage === 'summary') trackName = msg.data.stem_files?.main ?? trackName;
+                if (trackName) {
+                  const target = trackName;
+                  setTracks(prev => upsertTrack(prev, target, track => mergePartial(track, msg)));
+                }
               } else if (msg.type === 'complete') {
                 // Update tracks: if it's a re-analysis, replace the old one
-                setTracks(prev => {
-                  const exists = prev.findIndex(t => t.meta?.filename === msg.data.meta?.filename);
-                  if (exists !== -1) {
-                    const newTracks = [...prev];
-                    newTracks[exists] = msg.data;
-                    return newTracks;
-                  }
-                  return [msg.data, ...prev];
-                });
+                setTracks(prev => upsertTrack(prev, msg.data.meta?.filename, () => msg.data));
               } else if (msg.type === 'error') {
                 console.error(msg.message);
                 alert("ERR: " + msg.message);
@@ -96,6 +181,9 @@ export default function App() {
       }
     } catch (err) {
       console.error("Fetch error:", err);
+      // fetch rejects with a TypeError when the backend is unreachable; anything
+      // else is an upload or analyze request the server refused
+      if (!(err instanceof TypeError)) alert("ERR: " + (err as Error).message);
       // For demo purposes, if backend fails, mock a track so UI can be tested
       // alert("SYSTEM_OFFLINE: Backend not responding.");
     } finally {
@@ -124,6 +212,7 @@ export default function App() {
       const reader = response.body?.getReader();
       const decoder = new TextDecoder();
       let buffer = '';
+      let trackName: string | undefined;
 
       if (reader) {
         while (true) {
@@ -141,16 +230,16 @@ export default function App() {
               const msg = JSON.parse(line);
               if (msg.type === 'progress') {
                 setProgressMessage(msg.message.toUpperCase());
+              } else if (msg.type === 'partial') {
+                // The summary names the file; later partials belong to the same track
+                if (msg.stage === 'summary') trackName = msg.data.stem_files?.main ?? trackName;
+                if (trackName) {
+                  const target = trackName;
+                  setTracks(prev => upsertTrack(prev, target, track => mergePartial(track, msg)));
+                }
               } else if (msg.type === 'complete') {
-                setTracks(prev => {
-                  const exists = prev.findIndex(t => t.meta?.filename === msg.data.meta?.filename);
-                  if (exists !== -1) {
-                    const newTracks = [...prev];
-                    newTracks[exists] = msg.data;
-                    return newTracks;
-                  }
-                  return [msg.data, ...prev];
-                });
+                // Update tracks: if it's a re-analysis, replace the old one
+                setTracks(prev => upsertTrack(prev, msg.data.meta?.filename, () => msg.data));
               } else if (msg.type === 'error') {
                 console.error(msg.message);
                 alert("ERR: " + msg.message);
@@ -9,7 +9,8 @@ interface TrackCueListProps {
   onSelectCue: (cue: Cue) => void;
   stems?: Record<string, number[]>;
   danceability?: number;
-  loudness?: number;
+  // null when the loudness stage did not run or failed
+  loudness?: number | null;
 }
 
 export function TrackCueList({
@@ -17,7 +18,7 @@ export function TrackCueList({
   onSelectCue,
   stems,
   danceability = 0,
-  loudness = 0,
+  loudness = null,
 }: TrackCueListProps) {
   return (
     <motion.div
@@ -103,10 +104,10 @@ export function TrackCueList({
         <div>
           <div className="flex justify-between text-sm mb-1 font-mono text-gray-400">
             <span>LOUDNESS (LUFS)</span>
-            <span>{loudness} dB</span>
+            <span>{loudness ?? '--'} dB</span>
           </div>
           <div className="text-orange-400 font-mono text-sm tracking-widest break-all whitespace-nowrap overflow-hidden">
-            {renderBar(Math.min(100, (loudness + 30) * 3))}
+            {renderBar(loudness == null ? 0 : Math.min(100, (loudness + 30) * 3))}
           </div>
         </div>
       </div>
@@ -9,7 +9,8 @@ interface TrackMetricsPanelsProps {
   mixPoints?: MixPoints;
   descriptors?: TrackDescriptors;
   danceability?: number;
-  loudness?: number;
+  // null when the loudness stage did not run or failed
+  loudness?: number | null;
   texture?: string;
   color?: string;
 }
@@ -18,7 +19,7 @@ export function TrackMetricsPanels({
   mixPoints,
   descriptors,
   danceability = 0,
-  loudness = 0,
+  loudness = null,
   texture,
   color,
 }: TrackMetricsPanelsProps) {
@@ -81,10 +82,10 @@ export function TrackMetricsPanels({
             <div>
               <div className="flex justify-between text-sm mb-2 font-mono text-gray-400">
                 <span>LOUDNESS (LUFS)</span>
-                <span>{loudness} dB</span>
+                <span>{loudness ?? '--'} dB</span>
               </div>
               <div className="text-orange-300 font-mono text-sm tracking-widest break-all whitespace-nowrap overflow-hidden">
-                {renderBar(Math.min(100, (loudness + 30) * 3))}
+                {renderBar(loudness == null ? 0 : Math.min(100, (loudness + 30) * 3))}
               </div>
             </div>
           </GlassPanel>
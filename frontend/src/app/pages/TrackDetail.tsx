@@ -48,20 +48,25 @@ export default function TrackDetail({ onReAnalyze, isAnalyzing, progressMessage
     const dustOpacity = useTransform(scrollYProgress, [0, 1], [0.3, 0.7]);
 
     const waveformPoints = useMemo(() => waveform || [], [waveform]);
+    // ?v=<content hash> lets the browser cache each file for good
+    const audioUrl = (name?: string) => {
+        const version = name ? track.file_hashes?.[name] : undefined;
+        return `http://localhost:5000/audio/${name}${version ? `?v=${version}` : ''}`;
+    };
     const stemUrls = stem_files ? {
-        main: `http://localhost:5000/audio/${meta?.filename}`,
-        vocal: `http://localhost:5000/audio/${stem_files.vocal}`,
-        bass: `http://localhost:5000/audio/${stem_files.bass}`,
-        kick: `http://localhost:5000/audio/${stem_files.kick}`,
-        hihats: `http://localhost:5000/audio/${stem_files.hihats}`,
-        piano: `http://localhost:5000/audio/${stem_files.piano}`,
-        guitar: `http://localhost:5000/audio/${stem_files.guitar}`,
-        other: `http://localhost:5000/audio/${stem_files.other}`,
+        main: audioUrl(meta?.filename),
+        vocal: audioUrl(stem_files.vocal),
+        bass: audioUrl(stem_files.bass),
+        kick: audioUrl(stem_files.kick),
+        hihats: audioUrl(stem_files.hihats),
+        piano: audioUrl(stem_files.piano),
+        guitar: audioUrl(stem_files.guitar),
+        other: audioUrl(stem_files.other),
     } : undefined;
     const midiUrls = track.midi_files ? {
-        bass: track.midi_files.bass ? `http://localhost:5000/audio/${track.midi_files.bass}` : undefined,
-        piano: track.midi_files.piano ? `http://localhost:5000/audio/${track.midi_files.piano}` : undefined,
-        guitar: track.midi_files.guitar ? `http://localhost:5000/audio/${track.midi_files.guitar}` : undefined,
+        bass: track.midi_files.bass ? audioUrl(track.midi_files.bass) : undefined,
+        piano: track.midi_files.piano ? audioUrl(track.midi_files.piano) : undefined,
+        guitar: track.midi_files.guitar ? audioUrl(track.midi_files.guitar) : undefined,
     } : undefined;
 
     useEffect(() => {